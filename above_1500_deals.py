@@ -1,30 +1,20 @@
 import streamlit as st
-import psycopg2
-import pandas as pd
 from datetime import datetime, timedelta
 
-def show_above_1500_clients():
-    st.title("Clients with Budget above 1500$ less than 200$")
-
-    db_params = {
-        'dbname': st.secrets["database"]["DB_NAME"],
-        'user': st.secrets["database"]["DB_USER"],
-        'password': st.secrets["database"]["DB_PASSWORD"],
-        'host': st.secrets["database"]["DB_HOST"],
-        'port': st.secrets["database"]["DB_PORT"]
-    }
-
-    # Date input to select a start and end date
-    st.subheader("Select Date Range for Client Records")
-    start_date = st.date_input("Start Date", datetime.now().date() - timedelta(days=1))
-    end_date = st.date_input("End Date", datetime.now().date())
+from change_feed import watch_tables
+from db import fetch_frame, register_query
+from frame_dtypes import normalize_frame
+from range_cache import cached_days
+from roster import group_ids
 
-    # Convert dates to datetime format with start and end of the day
-    start_datetime = datetime.combine(start_date, datetime.min.time())
-    end_datetime = datetime.combine(end_date, datetime.max.time())
+PAGE = "Today's Clients between 1500$ and 2000$"
+# Short recent ranges; read from the primary
+PROFILE = 'primary'
+# Tables whose changes make this page's cached results stale
+CHANGE_TABLES = watch_tables(PAGE, ('client',))
 
-    # Query to fetch clients with specified conditions
-    fetch_clients_query = f"""
+# Query to fetch clients with specified conditions
+clients_query = register_query('above_1500_clients', """
         SELECT DISTINCT ON (c.id)
             c.id AS client_id,
             c.fullname AS client_name,
@@ -47,30 +37,32 @@ def show_above_1500_clients():
             public.requirements r ON c.id = r.client_id
         WHERE 
             r.budget > 1500 AND r.budget < 2000
-            AND c.created >= '{start_datetime}'::timestamp AT TIME ZONE 'CST'
-            AND c.created <= '{end_datetime}'::timestamp AT TIME ZONE 'CST'
+            AND c.created >= %(start_datetime)s::timestamp AT TIME ZONE 'CST'
+            AND c.created <= %(end_datetime)s::timestamp AT TIME ZONE 'CST'
         ORDER BY 
             c.id, c.created;
-    """
+""")
 
-    def fetch_data(query):
-        connection = None
-        cursor = None
-        try:
-            connection = psycopg2.connect(**db_params)
-            cursor = connection.cursor()
-            cursor.execute(query)
-            records = cursor.fetchall()
-            column_names = [desc[0] for desc in cursor.description]
-            df = pd.DataFrame(records, columns=column_names)
-            return df
-        except Exception as error:
-            st.error(f"Error fetching records: {error}")
-        finally:
-            if cursor:
-                cursor.close()
-            if connection:
-                connection.close()
+def fetch_clients_range(first_day, last_day):
+    # Convert dates to datetime format with start and end of the day
+    start_datetime = datetime.combine(first_day, datetime.min.time())
+    end_datetime = datetime.combine(last_day, datetime.max.time())
+    return fetch_frame(clients_query, {'start_datetime': start_datetime, 'end_datetime': end_datetime}, profile=PROFILE)
+
+def load_above_1500_clients(start_date, end_date):
+    # Only days missing from the per-day cache are queried
+    clients_data = cached_days('above_1500_clients', start_date, end_date, fetch_clients_range, 'created_at', tables=CHANGE_TABLES)
+    if clients_data is not None and not clients_data.empty:
+        clients_data = clients_data.sort_values('client_id', ignore_index=True)
+    return {'clients': normalize_frame(clients_data, PAGE)}
+
+def show_above_1500_clients():
+    st.title("Clients with Budget above 1500$ less than 200$")
+
+    # Date input to select a start and end date
+    st.subheader("Select Date Range for Client Records")
+    start_date = st.date_input("Start Date", datetime.now().date() - timedelta(days=1))
+    end_date = st.date_input("End Date", datetime.now().date())
 
     def display_clients_as_table(df):
         st.subheader("Filtered Clients (Budget < 1500 & Budget > 2000)")
@@ -79,8 +71,8 @@ def show_above_1500_clients():
             st.write("No clients found.")
         else:
             total_clients = len(df)
-            not_assigned_to_317_318_319 = (~df['assigned_employee'].isin([317, 318, 319,410,415,416])).sum()
-            percentage_not_assigned = (not_assigned_to_317_318_319 / total_clients) * 100
+            not_assigned_to_may_accounts = (~df['assigned_employee'].isin(group_ids('may_accounts'))).sum()
+            percentage_not_assigned = (not_assigned_to_may_accounts / total_clients) * 100
 
             st.subheader(f"Percentage of clients assigned to employees: {percentage_not_assigned:.2f}%")
 
@@ -89,6 +81,6 @@ def show_above_1500_clients():
 
             st.write(df.to_html(escape=False), unsafe_allow_html=True)
 
-    clients_data = fetch_data(fetch_clients_query)
+    clients_data = load_above_1500_clients(start_date, end_date)['clients']
 
     display_clients_as_table(clients_data)
@@ -1,3 +1,4 @@
+import time
 import streamlit as st
 from sales_leads import show_sales_leads
 from client_stage_progression import show_client_stage_progression
@@ -13,11 +14,35 @@ from above_2000_deals import show_above_2000_clients
 from client_process_sold import show_responsive_clients
 from urgent_movein import show_clients_with_urgent_movein
 from reporting_11am import generate_11am_report
+from cohort_funnel import show_cohort_funnel
 import streamlit.components.v1 as components
+from frame_dtypes import memory_saved, reset_memory_report
+from db import begin_script_run
+from change_feed import is_listening, page_versions, reruns_on_change, should_rerun, start_change_feed
+from page_profiler import page_profile
+from metrics import page_timer, start_metrics_exporter
 
 favicon = "fubicon.jpeg"
 st.set_page_config(page_title='Homeeasy Sales Dashboard', page_icon=favicon, layout='wide', initial_sidebar_state='auto')
 
+# A rerun (changed date, new page) supersedes this session's previous run; stop its queries
+begin_script_run()
+# Process-wide LISTEN thread that expires cached results when their tables change
+start_change_feed()
+# Scrape endpoint and/or metrics file from the [metrics] secrets section
+start_metrics_exporter()
+
+# How often an open page checks the change feed for its tables
+CHANGE_CHECK_SECONDS = 60
+
+
+@st.fragment(run_every=CHANGE_CHECK_SECONDS)
+def watch_page_changes(page, seen_versions):
+    # Only the sections whose caches the feed expired query the database again
+    if should_rerun(page, seen_versions, st.session_state.get("feed_rerun_at", float('-inf'))):
+        st.session_state.feed_rerun_at = time.monotonic()
+        st.rerun(scope="app")
+
 logo_path = "homeeasyLogo.png"
 # st.sidebar.image(logo_path, use_column_width=True)
 st.sidebar.image(logo_path, width=300)
@@ -28,7 +53,6 @@ if "refresh_count" not in st.session_state:
 st.session_state.refresh_count += 1
 # st.sidebar.write("The page will refresh automatically every hour.")
 
-st_autorefresh(interval=3600 * 1000, key="autoRefresh", debounce=False)
 st.sidebar.title("Homeeasy Sales Leads Monitoring System")
 
 page = st.sidebar.selectbox("Choose a report", [
@@ -38,6 +62,7 @@ page = st.sidebar.selectbox("Choose a report", [
     "11 AM Reporting",
     "Sales Leads Monitoring", 
     "Client Stage Progression Report", 
+    "Weekly Cohort Funnel",
     "Low Sales Progression", 
     "Sales Rep Daily Report", 
     "Amy Account Assigned Clients", 
@@ -48,105 +73,122 @@ page = st.sidebar.selectbox("Choose a report", [
     "Today's Client above 2000$"
 ])
 
-if page == "Home":
-    components.html("""
-        <div style="font-family: system-ui; font-size: 1.2em; line-height: 1.2; text-align: center; color:#00ceffed;">
-            <h2 id="introTitle"></h2>
-            <p id="introDesc"></p>
-            <h3 id="title1"></h3>
-            <p id="desc1"></p>
-            <h3 id="title2"></h3>
-            <p id="desc2"></p>
-            <h3 id="title3"></h3>
-            <p id="desc3"></p>
-            <h3 id="title4"></h3>
-            <p id="desc4"></p>
-            <h3 id="title5"></h3>
-            <p id="desc5"></p>
-            <h3 id="title6"></h3>
-            <p id="desc6"></p>
-            <h3 id="title7"></h3>
-            <p id="desc7"></p>
-            <h3 id="title8"></h3>
-            <p id="desc8"></p>
-            <h3 id="title9"></h3>
-            <p id="desc9"></p>
-            <h3 id="title10"></h3>
-            <p id="desc10"></p>
-            <p id="outroText"></p>
-        </div>
-        <script>
-            const texts = [
-                { title: "Welcome to the Homeeasy Sales Dashboard", desc: "This dashboard is designed to help you monitor and analyze sales leads and client progress effectively. Below is an overview of each report available in this dashboard:" },
-                { title: "1. Sales Leads Monitoring", desc: "View and track the latest sales leads with details about the client, assigned employee, and the status of interactions." },
-                { title: "2. Client Stage Progression Report", desc: "Analyze the progression of clients through various sales stages to understand where clients stand in the sales pipeline." },
-                { title: "3. Low Sales Progression", desc: "Identify clients or leads with low engagement or slow progression to address potential issues in the sales process." },
-                { title: "4. Sales Rep Daily Report", desc: "Review daily activities of each sales representative to assess performance and productivity." },
-                { title: "5. May Account Assigned Clients", desc: "Monitor clients assigned to the 'May Account' for special handling or follow-up actions." },
-                { title: "6. May Update Channel Clients", desc: "Keep track of clients needing updates through the May Channel." },
-                { title: "7. Today's Client Under 1000$", desc: "View clients whose budget falls under $1000 for today, allowing tailored strategies for smaller budgets." },
-                { title: "8. Today's Client Between 1000$ and 1500$", desc: "Focus on clients with a budget between $1000 and $1500 to identify and address specific needs." },
-                { title: "9. Today's Clients between 1500$ and 2000$", desc: "View clients whose budget is between $1500 and $2000, for potential upsell or targeted marketing efforts." },
-                { title: "10. Today's Client above 2000$", desc: "Target clients with a budget above $2000 to maximize high-value sales opportunities." },
-                { title: "", desc: "Please select a report from the sidebar to begin analyzing specific data." }
-            ];
-
-            function typeWriter(text, elementId, delay) {
-                let index = 0;
-                function type() {
-                    const element = document.getElementById(elementId);
-                    if (element && index < text.length) {
-                        element.innerHTML += text.charAt(index);
-                        index++;
-                        setTimeout(type, delay);
+reset_memory_report(page)
+# Cached pages rerun when the feed reports a change; pages that query everything on
+# each run, and every page while the feed is down, fall back to a blanket hourly rerun
+if is_listening() and reruns_on_change(page):
+    watch_page_changes(page, page_versions(page))
+else:
+    st_autorefresh(interval=3600 * 1000, key="autoRefresh", debounce=False)
+
+# Render time is exported per page; admins can also run the page under the sampling profiler
+with page_timer(page), page_profile(page):
+    if page == "Home":
+        components.html("""
+            <div style="font-family: system-ui; font-size: 1.2em; line-height: 1.2; text-align: center; color:#00ceffed;">
+                <h2 id="introTitle"></h2>
+                <p id="introDesc"></p>
+                <h3 id="title1"></h3>
+                <p id="desc1"></p>
+                <h3 id="title2"></h3>
+                <p id="desc2"></p>
+                <h3 id="title3"></h3>
+                <p id="desc3"></p>
+                <h3 id="title4"></h3>
+                <p id="desc4"></p>
+                <h3 id="title5"></h3>
+                <p id="desc5"></p>
+                <h3 id="title6"></h3>
+                <p id="desc6"></p>
+                <h3 id="title7"></h3>
+                <p id="desc7"></p>
+                <h3 id="title8"></h3>
+                <p id="desc8"></p>
+                <h3 id="title9"></h3>
+                <p id="desc9"></p>
+                <h3 id="title10"></h3>
+                <p id="desc10"></p>
+                <p id="outroText"></p>
+            </div>
+            <script>
+                const texts = [
+                    { title: "Welcome to the Homeeasy Sales Dashboard", desc: "This dashboard is designed to help you monitor and analyze sales leads and client progress effectively. Below is an overview of each report available in this dashboard:" },
+                    { title: "1. Sales Leads Monitoring", desc: "View and track the latest sales leads with details about the client, assigned employee, and the status of interactions." },
+                    { title: "2. Client Stage Progression Report", desc: "Analyze the progression of clients through various sales stages to understand where clients stand in the sales pipeline." },
+                    { title: "3. Low Sales Progression", desc: "Identify clients or leads with low engagement or slow progression to address potential issues in the sales process." },
+                    { title: "4. Sales Rep Daily Report", desc: "Review daily activities of each sales representative to assess performance and productivity." },
+                    { title: "5. May Account Assigned Clients", desc: "Monitor clients assigned to the 'May Account' for special handling or follow-up actions." },
+                    { title: "6. May Update Channel Clients", desc: "Keep track of clients needing updates through the May Channel." },
+                    { title: "7. Today's Client Under 1000$", desc: "View clients whose budget falls under $1000 for today, allowing tailored strategies for smaller budgets." },
+                    { title: "8. Today's Client Between 1000$ and 1500$", desc: "Focus on clients with a budget between $1000 and $1500 to identify and address specific needs." },
+                    { title: "9. Today's Clients between 1500$ and 2000$", desc: "View clients whose budget is between $1500 and $2000, for potential upsell or targeted marketing efforts." },
+                    { title: "10. Today's Client above 2000$", desc: "Target clients with a budget above $2000 to maximize high-value sales opportunities." },
+                    { title: "", desc: "Please select a report from the sidebar to begin analyzing specific data." }
+                ];
+
+                function typeWriter(text, elementId, delay) {
+                    let index = 0;
+                    function type() {
+                        const element = document.getElementById(elementId);
+                        if (element && index < text.length) {
+                            element.innerHTML += text.charAt(index);
+                            index++;
+                            setTimeout(type, delay);
+                        }
                     }
+                    type();
                 }
-                type();
-            }
-
-            function animate() {
-                texts.forEach((item, idx) => {
-                    setTimeout(() => {
-                        if (idx === 0) {
-                            typeWriter(item.title, 'introTitle', 30); // Faster title typing
-                            setTimeout(() => typeWriter(item.desc, 'introDesc', 20), 500); // Faster description typing
-                        } else if (idx === texts.length - 1) {
-                            typeWriter(item.desc, 'outroText', 20);
-                        } else {
-                            typeWriter(item.title, 'title' + idx, 30);
-                            setTimeout(() => typeWriter(item.desc, 'desc' + idx, 20), 500);
-                        }
-                    }, idx * 2000); // Slightly faster overall display timing
-                });
-            }
-
-            animate();
-        </script>
-    """, height=1500, scrolling=True)
-
-elif page == "Sales Leads Monitoring":
-    show_sales_leads()
-elif page == "Responsive Clients":
-    show_responsive_clients()
-elif page == "Clients With Move in Date":
-    show_clients_with_urgent_movein()
-elif page == "11 AM Reporting":
-    generate_11am_report()
-elif page == "Client Stage Progression Report":
-    show_client_stage_progression()
-elif page == "Amy Account Assigned Clients":
-    show_recent_clients()
-elif page == "Sales Rep Daily Report":
-    show_sales_rep_daily_report()
-elif page == "Amy Update Channel Clients":
-    may_update_channel_clients()
-elif page == "Today's Client Under 1000$":
-    under_1000_budget_clients()
-elif page == "Today's Client Between 1000$ and 1500$":
-    btw_1000_1500_budget_clients()
-elif page == "Today's Clients between 1500$ and 2000$":
-    show_above_1500_clients()  
-elif page == "Today's Client above 2000$":
-    show_above_2000_clients()
-else:
-    show_low_sales_progression()
+
+                function animate() {
+                    texts.forEach((item, idx) => {
+                        setTimeout(() => {
+                            if (idx === 0) {
+                                typeWriter(item.title, 'introTitle', 30); // Faster title typing
+                                setTimeout(() => typeWriter(item.desc, 'introDesc', 20), 500); // Faster description typing
+                            } else if (idx === texts.length - 1) {
+                                typeWriter(item.desc, 'outroText', 20);
+                            } else {
+                                typeWriter(item.title, 'title' + idx, 30);
+                                setTimeout(() => typeWriter(item.desc, 'desc' + idx, 20), 500);
+                            }
+                        }, idx * 2000); // Slightly faster overall display timing
+                    });
+                }
+
+                animate();
+            </script>
+        """, height=1500, scrolling=True)
+
+    elif page == "Sales Leads Monitoring":
+        show_sales_leads()
+    elif page == "Responsive Clients":
+        show_responsive_clients()
+    elif page == "Clients With Move in Date":
+        show_clients_with_urgent_movein()
+    elif page == "11 AM Reporting":
+        generate_11am_report()
+    elif page == "Client Stage Progression Report":
+        show_client_stage_progression()
+    elif page == "Amy Account Assigned Clients":
+        show_recent_clients()
+    elif page == "Weekly Cohort Funnel":
+        show_cohort_funnel()
+    elif page == "Sales Rep Daily Report":
+        show_sales_rep_daily_report()
+    elif page == "Amy Update Channel Clients":
+        may_update_channel_clients()
+    elif page == "Today's Client Under 1000$":
+        under_1000_budget_clients()
+    elif page == "Today's Client Between 1000$ and 1500$":
+        btw_1000_1500_budget_clients()
+    elif page == "Today's Clients between 1500$ and 2000$":
+        show_above_1500_clients()  
+    elif page == "Today's Client above 2000$":
+        show_above_2000_clients()
+    else:
+        show_low_sales_progression()
+
+saved_bytes = memory_saved(page)
+if saved_bytes > 0:
+    st.sidebar.caption(f"Memory saved by compact dtypes on this page: {saved_bytes / 1024:.1f} KB")
+
@@ -0,0 +1,149 @@
+"""Generate dashboard reports without a browser session.
+
+Runs the data loaders behind the Streamlit pages in parallel and writes every
+frame they return to <out>/<report>/<table>.<format>:
+
+    python batch_reports.py --start 2024-06-01 --end 2024-06-02 --format parquet
+    python batch_reports.py --reports sales_leads urgent_movein --out nightly
+
+Every report runs at once, so a run takes about as long as its slowest page.
+Workers are capped only by the connections of all profiles together; a
+report whose profile's pool is full waits for a connection instead of failing.
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, datetime, time as dt_time, timedelta
+
+import pandas as pd
+
+from above_1500_deals import load_above_1500_clients
+from above_2000_deals import load_above_2000_clients
+from building_send_clients import load_update_channel_clients
+from client_process_sold import load_responsive_clients
+from client_stage_progression import load_client_stage_progression
+from clients_under_1000 import load_under_1000_budget_clients
+from cohort_funnel import load_cohort_funnel
+from db import plan_cache_summary, set_checkout_timeout, total_pool_size
+from low_sales_progression import load_low_sales_progression
+from may_accounts_monitor import load_recent_clients
+from reporting_11am import load_11am_report
+from sales_daily_report import load_sales_rep_daily_report
+from sales_leads import load_sales_leads
+from sales_rep_report import load_sales_rep_report
+from stage_velocity import load_stage_velocity
+from under_1500_clients import load_btw_1000_1500_budget_clients
+from urgent_movein import load_urgent_movein_clients
+
+# The daily report covers the 13:00 shift and the 12 hours after it
+SHIFT_START = dt_time(13, 0)
+SHIFT_HOURS = 12
+
+STAGE_OPTIONS = ("7", "6", "5", "4")
+
+# A queued report waits as long as an analytics statement may run rather than the
+# page default, since nobody is waiting on a batch interactively
+BATCH_CHECKOUT_TIMEOUT_SECONDS = 10 * 60
+
+
+def load_daily_shift_report(start_date, end_date):
+    start_datetime = datetime.combine(start_date, SHIFT_START)
+    end_datetime = datetime.combine(end_date, SHIFT_START) + timedelta(hours=SHIFT_HOURS)
+    return load_sales_rep_daily_report(start_datetime, end_datetime)
+
+
+# Report name -> loader taking (start_date, end_date) and returning a dict of frames
+REPORTS = {
+    'responsive_clients': load_responsive_clients,
+    'urgent_movein': load_urgent_movein_clients,
+    '11am_reporting': load_11am_report,
+    'sales_leads': lambda start_date, end_date: load_sales_leads(),
+    'stage_velocity': lambda start_date, end_date: load_stage_velocity(),
+    'cohort_funnel': lambda start_date, end_date: load_cohort_funnel(),
+    'client_stage_progression': lambda start_date, end_date: load_client_stage_progression(start_date, end_date, STAGE_OPTIONS),
+    'low_sales_progression': lambda start_date, end_date: load_low_sales_progression(),
+    'sales_rep_daily_report': load_daily_shift_report,
+    'sales_rep_report': lambda start_date, end_date: load_sales_rep_report(),
+    'amy_account_clients': lambda start_date, end_date: load_recent_clients(),
+    'amy_update_channel_clients': load_update_channel_clients,
+    'under_1000_clients': load_under_1000_budget_clients,
+    'btw_1000_1500_clients': load_btw_1000_1500_budget_clients,
+    'btw_1500_2000_clients': load_above_1500_clients,
+    'above_2000_clients': load_above_2000_clients,
+}
+
+
+def write_frames(report, data, out_dir, file_format):
+    """Write each DataFrame value of a loader result; other values are skipped"""
+    # Loaders report database errors by returning None instead of raising
+    if data is None or not any(isinstance(df, pd.DataFrame) for df in data.values()):
+        raise RuntimeError("loader returned no frames")
+    report_dir = os.path.join(out_dir, report)
+    os.makedirs(report_dir, exist_ok=True)
+    written = []
+    for table, df in data.items():
+        if not isinstance(df, pd.DataFrame):
+            continue
+        if df.index.name is not None:
+            df = df.reset_index()
+        path = os.path.join(report_dir, f"{table}.{file_format}")
+        if file_format == 'parquet':
+            df.to_parquet(path, index=False)
+        else:
+            df.to_csv(path, index=False)
+        written.append(path)
+    return written
+
+
+def run_report(report, start_date, end_date, out_dir, file_format):
+    started = time.perf_counter()
+    data = REPORTS[report](start_date, end_date)
+    written = write_frames(report, data, out_dir, file_format)
+    return written, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--start', type=date.fromisoformat, default=date.today() - timedelta(days=1))
+    parser.add_argument('--end', type=date.fromisoformat, default=None, help="defaults to --start")
+    parser.add_argument('--reports', nargs='+', choices=sorted(REPORTS), default=list(REPORTS))
+    parser.add_argument('--format', choices=('csv', 'parquet'), default='csv')
+    parser.add_argument('--out', default='reports_out')
+    parser.add_argument('--workers', type=int, default=None,
+                        help="parallel reports, at most the connections of all pools together")
+    args = parser.parse_args()
+
+    end_date = args.end or args.start
+    # The reports split over the primary and analytics pools, so all of them together
+    # fit in both pools; a loader that finds its pool full (the daily report borrows
+    # from several threads) waits for a connection
+    workers = min(args.workers or len(args.reports), total_pool_size())
+    set_checkout_timeout(BATCH_CHECKOUT_TIMEOUT_SECONDS)
+
+    started = time.perf_counter()
+    failed = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(run_report, report, args.start, end_date, args.out, args.format): report
+            for report in args.reports
+        }
+        for future in as_completed(futures):
+            report = futures[future]
+            try:
+                written, seconds = future.result()
+            except Exception as error:
+                failed.append(report)
+                print(f"{report}: failed: {error}")
+                continue
+            print(f"{report}: {len(written)} tables in {seconds:.1f}s")
+
+    print(f"{len(args.reports) - len(failed)}/{len(args.reports)} reports in {time.perf_counter() - started:.1f}s")
+    for name, stats in plan_cache_summary().items():
+        print(f"  {name}: prepared {stats['prepared']}, reused {stats['reused']}")
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Compare the tuple -> object DataFrame -> Arrow path with the COPY -> Arrow path.
+
+Both paths end with the bytes Streamlit sends to the frontend for st.dataframe.
+The rows are synthetic and shaped like the sales leads history table, so the
+benchmark runs without a database. The tuple path leaves out psycopg2's own
+row decoding, so the measured gap is a lower bound:
+
+    python benchmarks/arrow_result_path.py --rows 200000
+"""
+import argparse
+import csv
+import io
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+from streamlit.dataframe_util import convert_pandas_df_to_arrow_bytes
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db import read_arrow_frame  # noqa: E402
+from frame_dtypes import STAGE_NAMES  # noqa: E402
+
+COLUMNS = ['client_id', 'followup_boss_link', 'client_name', 'employee_name',
+           'data_1_recorded', 'time_for_data1_recorded', 'data_2_recorded', 'time_for_data2_recorded']
+
+
+def make_rows(count):
+    random.seed(7)
+    employees = [f"Employee {i}" for i in range(30)]
+    start = datetime(2024, 1, 1)
+    rows = []
+    for client_id in range(1, count + 1):
+        entered = start + timedelta(minutes=random.randint(0, 500000))
+        rows.append((
+            client_id,
+            f"https://services.followupboss.com/2/people/view/{client_id}",
+            f"Client {client_id}",
+            random.choice(employees),
+            STAGE_NAMES[random.randint(1, 4)],
+            entered,
+            STAGE_NAMES[random.randint(4, 8)] if client_id % 3 else None,
+            entered + timedelta(hours=random.randint(1, 400)) if client_id % 3 else None,
+        ))
+    return rows
+
+
+def make_copy_payload(rows):
+    # What COPY ... TO STDOUT WITH (FORMAT csv, HEADER true) sends for the same rows
+    text = io.StringIO()
+    writer = csv.writer(text, lineterminator='\n')
+    writer.writerow(COLUMNS)
+    writer.writerows(['' if value is None else value for value in row] for row in rows)
+    return text.getvalue().encode()
+
+
+def tuple_path(rows):
+    df = pd.DataFrame(rows, columns=COLUMNS)
+    return convert_pandas_df_to_arrow_bytes(df)
+
+
+def arrow_path(payload):
+    df = read_arrow_frame(io.BytesIO(payload))
+    return convert_pandas_df_to_arrow_bytes(df)
+
+
+def best_of(repeat, func, *args):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    payload = make_copy_payload(rows)
+
+    tuple_seconds = best_of(args.repeat, tuple_path, rows)
+    arrow_seconds = best_of(args.repeat, arrow_path, payload)
+
+    print(f"rows: {args.rows}")
+    print(f"tuples -> object frame -> arrow bytes: {tuple_seconds * 1000:.1f} ms")
+    print(f"COPY csv -> ArrowDtype frame -> arrow bytes: {arrow_seconds * 1000:.1f} ms")
+    print(f"speedup: {tuple_seconds / arrow_seconds:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
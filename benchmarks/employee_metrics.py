@@ -0,0 +1,77 @@
+"""Time the per-employee metric computation behind the Sales Rep Daily Report tabs.
+
+Compares the former per-tab boolean-mask scans with the single groupby pass in
+report_metrics.employee_activity_metrics on synthetic activity frames:
+
+    python benchmarks/employee_metrics.py --rows-per-rep 400
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from frame_dtypes import normalize_frame  # noqa: E402
+from report_metrics import employee_activity_metrics  # noqa: E402
+
+SECONDS_PER_MESSAGE = 5
+REP_COUNTS = (30, 100, 300)
+
+
+def make_activity(reps, rows_per_rep):
+    rng = np.random.default_rng(7)
+    rows = reps * rows_per_rep
+    df = pd.DataFrame({
+        'employee_name': rng.choice([f"Employee {i}" for i in range(reps)], rows),
+        'type': rng.choice(['call', 'text_created'], rows),
+        'client_id': rng.integers(1, rows // 4 + 2, rows),
+        'call_duration': rng.integers(0, 600, rows).astype(float),
+    })
+    df.loc[df['type'] == 'text_created', 'call_duration'] = 0
+    return normalize_frame(df)
+
+
+def per_employee_scan(df):
+    # The lookups add_employee_report used to run for each tab
+    results = {}
+    for employee_name in df['employee_name'].unique():
+        calls = df[(df['employee_name'] == employee_name) & (df['type'] == 'call')]
+        texts = df[(df['employee_name'] == employee_name) & (df['type'] == 'text_created')]
+        total_calls = calls.shape[0]
+        call_seconds = df[(df['employee_name'] == employee_name) & (df['type'] == 'call')]['call_duration'].sum()
+        total_messages = texts.shape[0]
+        clients = set(calls['client_id'].dropna().unique()) | set(texts['client_id'].dropna().unique())
+        results[employee_name] = (total_calls, call_seconds, total_messages, len(clients),
+                                  call_seconds + total_messages * SECONDS_PER_MESSAGE)
+    return results
+
+
+def best_of(repeat, func, *args):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows-per-rep', type=int, default=400)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'reps':>5} {'rows':>8} {'per-tab scans':>14} {'groupby once':>13} {'speedup':>8}")
+    for reps in REP_COUNTS:
+        df = make_activity(reps, args.rows_per_rep)
+        scan_seconds = best_of(args.repeat, per_employee_scan, df)
+        groupby_seconds = best_of(args.repeat, employee_activity_metrics, df, SECONDS_PER_MESSAGE)
+        print(f"{reps:>5} {len(df):>8} {scan_seconds * 1000:>11.1f} ms {groupby_seconds * 1000:>10.1f} ms "
+              f"{scan_seconds / groupby_seconds:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""Show which server and session settings each connection profile gets.
+
+Point the secrets at two local instances, e.g. a primary on 5432 and a
+streaming replica on 5433 (pg_basebackup -R), with only the port overridden:
+
+    [database]
+    DB_NAME = "homeeasy"
+    ...
+    DB_PORT = 5432
+
+    [replica]
+    DB_PORT = 5433
+
+then run
+
+    python benchmarks/replica_routing.py
+    python benchmarks/replica_routing.py --max-lag -1    # force the primary fallback
+
+Pausing replay on the replica (SELECT pg_wal_replay_pause()) while the primary
+takes writes makes the lag grow until analytics queries fall back to the primary.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import db  # noqa: E402
+
+SESSION_QUERY = """
+    SELECT inet_server_port(), pg_is_in_recovery(),
+           current_setting('statement_timeout'), current_setting('work_mem')
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--max-lag', type=float, default=None,
+                        help="override the analytics profile's lag threshold in seconds")
+    parser.add_argument('--rounds', type=int, default=1)
+    parser.add_argument('--interval', type=float, default=db.LAG_CHECK_SECONDS)
+    args = parser.parse_args()
+
+    if args.max_lag is not None:
+        db.CONNECTION_PROFILES['analytics']['max_lag_seconds'] = args.max_lag
+
+    for round_number in range(args.rounds):
+        if round_number:
+            time.sleep(args.interval)
+        for profile, settings in db.CONNECTION_PROFILES.items():
+            target = db.route(profile)
+            lags = {replica: db.replica_lag(profile, replica) for replica in settings['replicas']
+                    if replica in db.st.secrets}
+            with db.pooled_connection(profile) as connection, connection.cursor() as cursor:
+                cursor.execute(SESSION_QUERY)
+                port, in_recovery, statement_timeout, work_mem = cursor.fetchone()
+            print(f"{profile}: {target} (port {port}, recovery {in_recovery}), "
+                  f"statement_timeout {statement_timeout}, work_mem {work_mem}, replica lag {lags}")
+
+
+if __name__ == '__main__':
+    main()
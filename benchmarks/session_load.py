@@ -0,0 +1,220 @@
+"""Drive concurrent headless dashboard sessions and report how latency scales.
+
+Each session is a Streamlit AppTest of app.py, so it runs the real page code
+against whatever database secrets.toml points at; use the synthetic local
+database, not production. Sessions pick pages from a weighted mix and change
+the page's date and select widgets between runs. For every session count it
+reports page latency percentiles, errors, connections checked out of the app
+pools, server backends in pg_stat_activity, peak RSS and CPU:
+
+    python benchmarks/session_load.py --sessions 1 10 25 50 100 --steps 10
+    python benchmarks/session_load.py --sessions 5 --pages "Responsive Clients" "11 AM Reporting"
+"""
+import argparse
+import os
+import random
+import resource
+import sys
+import threading
+import time
+from datetime import date, timedelta
+
+import numpy as np
+from streamlit.runtime import Runtime
+from streamlit.testing.v1 import AppTest, app_test
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import db  # noqa: E402
+
+APP_PATH = os.path.join(ROOT, "app.py")
+
+# Rough share of manager traffic; the daily report also calls Sling
+PAGE_MIX = {
+    "Responsive Clients": 4,
+    "Clients With Move in Date": 2,
+    "11 AM Reporting": 3,
+    "Sales Leads Monitoring": 1,
+    "Client Stage Progression Report": 2,
+    "Weekly Cohort Funnel": 1,
+    "Low Sales Progression": 1,
+    "Sales Rep Daily Report": 2,
+    "Amy Account Assigned Clients": 1,
+    "Amy Update Channel Clients": 1,
+    "Today's Client Under 1000$": 1,
+    "Today's Client Between 1000$ and 1500$": 1,
+    "Today's Clients between 1500$ and 2000$": 1,
+    "Today's Client above 2000$": 1,
+}
+WIDGET_CHANGE_PROBABILITY = 0.5
+SAMPLE_SECONDS = 0.5
+
+BACKENDS_QUERY = "SELECT count(*) FROM pg_stat_activity WHERE datname = current_database()"
+
+
+class _SharedRuntimeType(type):
+    """AppTest installs a mock Runtime for each run and clears it afterwards,
+    which breaks sessions still running in other threads. The first mock is
+    kept for every session instead, so they also share one st.cache_data store
+    as sessions of a real server do."""
+
+    @property
+    def _instance(cls):
+        return Runtime._instance
+
+    @_instance.setter
+    def _instance(cls, runtime):
+        if runtime is not None and Runtime._instance is None:
+            Runtime._instance = runtime
+
+
+class _SharedRuntime(Runtime, metaclass=_SharedRuntimeType):
+    pass
+
+
+app_test.Runtime = _SharedRuntime
+
+
+def change_widgets(at, rng):
+    """Move a date widget within the last two weeks or pick another select option"""
+    widgets = list(at.main.date_input) + list(at.main.selectbox)
+    if not widgets:
+        return False
+    widget = rng.choice(widgets)
+    if hasattr(widget, 'options'):
+        widget.select(rng.choice(widget.options))
+    elif isinstance(widget.value, tuple):
+        end = date.today() - timedelta(days=rng.randint(0, 7))
+        widget.set_value((end - timedelta(days=rng.randint(0, 7)), end))
+    else:
+        widget.set_value(date.today() - timedelta(days=rng.randint(0, 14)))
+    return True
+
+
+def timed_run(at, page, samples, lock):
+    started = time.perf_counter()
+    try:
+        at.run()
+        failed = bool(at.exception) or bool(at.error)
+    except Exception:
+        failed = True
+    with lock:
+        samples.append((page, time.perf_counter() - started, failed))
+
+
+def run_session(seed, pages, weights, steps, timeout, samples, lock):
+    rng = random.Random(seed)
+    at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+    timed_run(at, "Home", samples, lock)
+    for _ in range(steps):
+        page = rng.choices(pages, weights)[0]
+        if not at.sidebar.selectbox:
+            # The previous run failed before drawing the page picker
+            timed_run(at, "Home", samples, lock)
+            continue
+        at.sidebar.selectbox[0].select(page)
+        timed_run(at, page, samples, lock)
+        if rng.random() < WIDGET_CHANGE_PROBABILITY and change_widgets(at, rng):
+            timed_run(at, page, samples, lock)
+
+
+def pool_in_use():
+    with db._pool_lock:
+        pools = list(db._pools.values())
+    return sum(len(pool._used) for pool in pools)
+
+
+def rss_bytes():
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def sample_server(stop, stats):
+    """Poll pool checkouts, database backends and RSS until stopped"""
+    monitor = None
+    try:
+        monitor = db.psycopg2.connect(**db.get_db_params())
+        monitor.autocommit = True
+    except Exception as error:
+        print(f"pg_stat_activity not sampled: {error}")
+    while not stop.wait(SAMPLE_SECONDS):
+        stats['pool_in_use'].append(pool_in_use())
+        stats['rss'].append(rss_bytes())
+        if monitor is not None:
+            with monitor.cursor() as cursor:
+                cursor.execute(BACKENDS_QUERY)
+                stats['backends'].append(cursor.fetchone()[0])
+    if monitor is not None:
+        monitor.close()
+
+
+def run_level(sessions, pages, weights, steps, timeout):
+    samples, lock = [], threading.Lock()
+    stats = {'pool_in_use': [], 'backends': [], 'rss': []}
+    stop = threading.Event()
+    sampler = threading.Thread(target=sample_server, args=(stop, stats), daemon=True)
+    sampler.start()
+
+    started, cpu_started = time.perf_counter(), time.process_time()
+    threads = [threading.Thread(target=run_session, args=(seed, pages, weights, steps, timeout, samples, lock))
+               for seed in range(sessions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall, cpu = time.perf_counter() - started, time.process_time() - cpu_started
+    stop.set()
+    sampler.join()
+
+    latencies = np.array([seconds for _, seconds, _ in samples])
+    return {
+        'sessions': sessions,
+        'runs': len(samples),
+        'errors': sum(failed for _, _, failed in samples),
+        'p50': np.percentile(latencies, 50),
+        'p95': np.percentile(latencies, 95),
+        'p99': np.percentile(latencies, 99),
+        'runs_per_second': len(samples) / wall,
+        'pool_max': max(stats['pool_in_use'], default=0),
+        'backends_max': max(stats['backends'], default=None),
+        'rss_mb': max(stats['rss'] + [rss_bytes()]) / 2 ** 20,
+        'cpu_cores': cpu / wall,
+    }, samples
+
+
+def print_pages(samples):
+    print("\nper page at the highest session count:")
+    for page in sorted({page for page, _, _ in samples}):
+        latencies = np.array([seconds for name, seconds, _ in samples if name == page])
+        print(f"  {page:45s} runs {len(latencies):4d}  p50 {np.percentile(latencies, 50):6.2f}s"
+              f"  p95 {np.percentile(latencies, 95):6.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sessions', type=int, nargs='+', default=[1, 5, 10, 25, 50, 100])
+    parser.add_argument('--steps', type=int, default=10, help="page visits per session")
+    parser.add_argument('--pages', nargs='+', choices=sorted(PAGE_MIX), default=None)
+    parser.add_argument('--timeout', type=float, default=300, help="seconds allowed per script run")
+    args = parser.parse_args()
+
+    pages = args.pages or list(PAGE_MIX)
+    weights = [PAGE_MIX[page] for page in pages]
+    # AppTest resolves the logo and favicon relative to the working directory
+    os.chdir(ROOT)
+
+    print(f"{'sessions':>8} {'runs':>6} {'errors':>6} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} "
+          f"{'runs/s':>7} {'pool':>5} {'pg':>5} {'rss MB':>7} {'cpu':>5}")
+    samples = []
+    for sessions in args.sessions:
+        level, samples = run_level(sessions, pages, weights, args.steps, args.timeout)
+        backends = '-' if level['backends_max'] is None else level['backends_max']
+        print(f"{level['sessions']:8d} {level['runs']:6d} {level['errors']:6d} {level['p50']:7.2f} "
+              f"{level['p95']:7.2f} {level['p99']:7.2f} {level['runs_per_second']:7.2f} "
+              f"{level['pool_max']:5d} {backends:>5} {level['rss_mb']:7.0f} {level['cpu_cores']:5.2f}")
+    print_pages(samples)
+    print(f"peak RSS over the whole run: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Time the Sales Rep Daily Report PDF export for a full team.
+
+Renders synthetic employee sections shaped like the dashboard tabs (metrics,
+a week of attendance, client progression) in-process and across a process
+pool, then merges them into one document:
+
+    python benchmarks/team_pdf_export.py --employees 30 --clients 60
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from report_pdf import merge_pdfs, render_employee_section, build_team_pdf  # noqa: E402
+
+ATTENDANCE_HEADER = ['Date', 'Scheduled Clock-in', 'Actual Clock-in', 'Late Minutes',
+                     'Scheduled Clock-out', 'Actual Clock-out', 'Early Out Minutes',
+                     'Scheduled Break Duration', 'Actual Break Taken']
+STAGES = ['1:  Initial Contact', '2:  Requirement Collection', '3:  Property Touring',
+          '4:  Property Touring', '5:  Property Tour and Feedback', '6:  Application and Approval']
+
+
+def make_sections(employees, clients):
+    random.seed(7)
+    sections = []
+    for i in range(employees):
+        attendance = [ATTENDANCE_HEADER] + [
+            [f"2024-06-0{day}", '13:00', '13:05', str(random.choice([0, 0, 20])), '01:00', '00:55',
+             str(random.choice([0, 30])), '60', str(random.randint(30, 90))]
+            for day in range(1, 8)
+        ]
+        progression = [['Client', 'Previous Stage', 'Current Stage']] + [
+            [f"Client {i}-{c}", random.choice(STAGES[:3]), random.choice(STAGES[3:])]
+            for c in range(clients)
+        ]
+        sections.append({
+            'employee_name': f"Employee {i}",
+            'subtitle': '2024-06-01 13:00:00 to 2024-06-08 01:00:00',
+            'metrics': {'Total Calls': str(random.randint(20, 200)), 'Total Messages': str(random.randint(50, 400)),
+                        'Assigned Time (min)': '480', 'Clients Handled': str(clients)},
+            'attendance': attendance,
+            'progression': progression,
+        })
+    return sections
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--employees', type=int, default=30)
+    parser.add_argument('--clients', type=int, default=60)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    sections = make_sections(args.employees, args.clients)
+
+    started = time.perf_counter()
+    serial = merge_pdfs([render_employee_section(section) for section in sections])
+    serial_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    parallel = build_team_pdf(sections, args.workers)
+    parallel_seconds = time.perf_counter() - started
+
+    print(f"employees: {args.employees}, clients each: {args.clients}, cpus: {os.cpu_count()}")
+    print(f"in-process: {serial_seconds:.2f}s ({len(serial) / 1024:.0f} KB)")
+    print(f"process pool: {parallel_seconds:.2f}s ({len(parallel) / 1024:.0f} KB)")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,24 +1,19 @@
 import streamlit as st
-import psycopg2
-import pandas as pd
 from datetime import datetime
 
-def may_update_channel_clients():
-    st.title("Buildings Sent to Clients")
-
-    db_params = {
-        'dbname': st.secrets["database"]["DB_NAME"],
-        'user': st.secrets["database"]["DB_USER"],
-        'password': st.secrets["database"]["DB_PASSWORD"],
-        'host': st.secrets["database"]["DB_HOST"],
-        'port': st.secrets["database"]["DB_PORT"]
-    }
+from change_feed import watch_tables
+from db import fetch_frame, register_query
+from frame_dtypes import normalize_frame
+from range_cache import cached_days
+from roster import group_ids
 
-    selected_date = st.date_input("Select a date to view clients", datetime.now().date())
+PAGE = "Amy Update Channel Clients"
+# Short recent ranges; read from the primary
+PROFILE = 'primary'
+# Tables whose changes make this page's cached results stale
+CHANGE_TABLES = watch_tables(PAGE, ('client',))
 
-    selected_datetime_start = f"{selected_date} 00:00:00"
-    selected_datetime_end = f"{selected_date} 23:59:59"
-    fetch_clients_query = f"""
+clients_query = register_query('update_channel_clients', """
         SELECT DISTINCT ON (c.id)
             c.id AS client_id,
             c.fullname AS client_name,
@@ -42,29 +37,29 @@ def may_update_channel_clients():
         LEFT JOIN 
             public.requirements r ON c.id = r.client_id
         WHERE 
-            c.created >= '{selected_datetime_start}'::timestamp AT TIME ZONE 'CST'
-            AND c.created <= '{selected_datetime_end}'::timestamp AT TIME ZONE 'CST'
+            c.created >= %(selected_datetime_start)s::timestamp AT TIME ZONE 'CST'
+            AND c.created <= %(selected_datetime_end)s::timestamp AT TIME ZONE 'CST'
         ORDER BY 
             c.id, c.created;
-    """
-    def fetch_data(query):
-        connection = None
-        cursor = None
-        try:
-            connection = psycopg2.connect(**db_params)
-            cursor = connection.cursor()
-            cursor.execute(query)
-            records = cursor.fetchall()
-            column_names = [desc[0] for desc in cursor.description]
-            df = pd.DataFrame(records, columns=column_names)
-            return df
-        except Exception as error:
-            st.error(f"Error fetching records: {error}")
-        finally:
-            if cursor:
-                cursor.close()
-            if connection:
-                connection.close()
+""")
+
+def fetch_clients_range(first_day, last_day):
+    selected_datetime_start = f"{first_day} 00:00:00"
+    selected_datetime_end = f"{last_day} 23:59:59"
+    return fetch_frame(clients_query, {'selected_datetime_start': selected_datetime_start, 'selected_datetime_end': selected_datetime_end}, profile=PROFILE)
+
+def load_update_channel_clients(start_date, end_date):
+    # Only days missing from the per-day cache are queried
+    clients_data = cached_days('update_channel_clients', start_date, end_date, fetch_clients_range, 'created_at', tables=CHANGE_TABLES)
+    if clients_data is not None and not clients_data.empty:
+        clients_data = clients_data.sort_values('client_id', ignore_index=True)
+    return {'clients': normalize_frame(clients_data, PAGE)}
+
+def may_update_channel_clients():
+    st.title("Buildings Sent to Clients")
+
+    selected_date = st.date_input("Select a date to view clients", datetime.now().date())
+
     def display_clients_as_table(df):
         st.subheader(f"Clients on {selected_date}")
         
@@ -72,8 +67,8 @@ def may_update_channel_clients():
             st.write("No clients found.")
         else:
             total_clients = len(df)
-            not_assigned_to_317_318_319 = (~df['assigned_employee'].isin([317, 318, 319,410,415,416,160, 20])).sum()
-            percentage_not_assigned = (not_assigned_to_317_318_319 / total_clients) * 100
+            not_assigned_to_may_accounts = (~df['assigned_employee'].isin(group_ids('may_accounts'))).sum()
+            percentage_not_assigned = (not_assigned_to_may_accounts / total_clients) * 100
 
             # st.write(f"Percentage of clients assigned to employees: {percentage_not_assigned:.2f}%")
             st.subheader(f"Percentage of clients assigned to employees: {percentage_not_assigned:.2f}%", divider="green")
@@ -83,6 +78,6 @@ def may_update_channel_clients():
 
             st.write(df.to_html(escape=False), unsafe_allow_html=True)
 
-    clients_data = fetch_data(fetch_clients_query)
+    clients_data = load_update_channel_clients(selected_date, selected_date)['clients']
 
     display_clients_as_table(clients_data)
@@ -0,0 +1,200 @@
+"""Storage for range_cache entries.
+
+Every Streamlit process keeps its own MemoryBackend by default. Behind a load
+balancer, point all processes at one shared backend in secrets.toml so a day
+fetched by one process is served to the rest, and TTLs and invalidations apply
+to all of them:
+
+    [cache]
+    backend = "sqlite"                     # on a volume every process mounts
+    path = "/shared/dashboard_cache.sqlite"
+
+    [cache]
+    backend = "redis"                      # Redis or any RESP-compatible server
+    url = "redis://localhost:6379/0"
+
+Shared backends store each day as zstd-compressed Parquet.
+"""
+import io
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+
+import pandas as pd
+import streamlit as st
+
+MAX_DAY_ENTRIES = 5000
+# Shared backends drop expired rows on every Nth write
+PRUNE_EVERY_PUTS = 200
+
+
+def frame_to_bytes(frame):
+    buffer = io.BytesIO()
+    frame.to_parquet(buffer, compression='zstd', index=False)
+    return buffer.getvalue()
+
+
+def frame_from_bytes(payload):
+    return pd.read_parquet(io.BytesIO(payload))
+
+
+class MemoryBackend:
+    """Per-process LRU of frames, expired on a monotonic clock"""
+
+    def __init__(self, max_entries=MAX_DAY_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, namespace, day):
+        key = (namespace, day)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            frame, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return frame
+
+    def put(self, namespace, day, frame, ttl_seconds):
+        key = (namespace, day)
+        with self._lock:
+            self._entries[key] = (frame, time.monotonic() + ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def expire(self, namespaces, from_day):
+        with self._lock:
+            for key in [key for key in self._entries if key[0] in namespaces and key[1] >= from_day]:
+                del self._entries[key]
+
+    def clear(self, namespace=None):
+        with self._lock:
+            for key in [key for key in self._entries if namespace is None or key[0] == namespace]:
+                del self._entries[key]
+
+
+class SQLiteBackend:
+    """Entries in one SQLite file shared by every process; expiry uses wall-clock time"""
+
+    def __init__(self, path, max_entries=MAX_DAY_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._puts = 0
+        with self._connection() as connection:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS range_cache (
+                    namespace TEXT NOT NULL,
+                    day TEXT NOT NULL,
+                    payload BLOB NOT NULL,
+                    expires_at REAL NOT NULL,
+                    PRIMARY KEY (namespace, day)
+                )
+            """)
+
+    def _connection(self):
+        # sqlite3 connections cannot be shared between threads
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            # WAL lets readers in other processes continue while one process writes
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    def get(self, namespace, day):
+        row = self._connection().execute(
+            "SELECT payload FROM range_cache WHERE namespace = ? AND day = ? AND expires_at >= ?",
+            (namespace, day.isoformat(), time.time()),
+        ).fetchone()
+        return frame_from_bytes(row[0]) if row else None
+
+    def put(self, namespace, day, frame, ttl_seconds):
+        payload = frame_to_bytes(frame)
+        with self._connection() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO range_cache (namespace, day, payload, expires_at) VALUES (?, ?, ?, ?)",
+                (namespace, day.isoformat(), payload, time.time() + ttl_seconds),
+            )
+            self._puts += 1
+            if self._puts % PRUNE_EVERY_PUTS == 0:
+                connection.execute("DELETE FROM range_cache WHERE expires_at < ?", (time.time(),))
+                # Past the size limit, drop the entries closest to expiring
+                connection.execute("""
+                    DELETE FROM range_cache WHERE rowid IN (
+                        SELECT rowid FROM range_cache ORDER BY expires_at DESC LIMIT -1 OFFSET ?
+                    )
+                """, (self.max_entries,))
+
+    def expire(self, namespaces, from_day):
+        if not namespaces:
+            return
+        placeholders = ", ".join("?" * len(namespaces))
+        with self._connection() as connection:
+            connection.execute(
+                f"DELETE FROM range_cache WHERE namespace IN ({placeholders}) AND day >= ?",
+                (*namespaces, from_day.isoformat()),
+            )
+
+    def clear(self, namespace=None):
+        with self._connection() as connection:
+            if namespace is None:
+                connection.execute("DELETE FROM range_cache")
+            else:
+                connection.execute("DELETE FROM range_cache WHERE namespace = ?", (namespace,))
+
+
+class RedisBackend:
+    """Entries as Redis keys with server-side TTLs, shared by every process"""
+
+    def __init__(self, url, prefix="dashboard:range_cache"):
+        # Only deployments that choose this backend need the redis client installed
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def _key(self, namespace, day):
+        return f"{self.prefix}:{namespace}:{day.isoformat()}"
+
+    def get(self, namespace, day):
+        payload = self.client.get(self._key(namespace, day))
+        return frame_from_bytes(payload) if payload is not None else None
+
+    def put(self, namespace, day, frame, ttl_seconds):
+        self.client.set(self._key(namespace, day), frame_to_bytes(frame), ex=max(int(ttl_seconds), 1))
+
+    def _keys(self, namespace):
+        return self.client.scan_iter(match=f"{self.prefix}:{namespace}:*", count=500)
+
+    def expire(self, namespaces, from_day):
+        for namespace in namespaces:
+            stale = [key for key in self._keys(namespace)
+                     if date.fromisoformat(key.decode().rsplit(':', 1)[1]) >= from_day]
+            if stale:
+                self.client.delete(*stale)
+
+    def clear(self, namespace=None):
+        stale = list(self._keys(namespace if namespace is not None else '*'))
+        if stale:
+            self.client.delete(*stale)
+
+
+def backend_from_secrets():
+    """Backend named in the [cache] secrets section, in-process memory if there is none"""
+    try:
+        settings = st.secrets.get("cache", {})
+    except FileNotFoundError:
+        settings = {}
+    backend = settings.get("backend", "memory")
+    if backend == "sqlite":
+        return SQLiteBackend(settings["path"])
+    if backend == "redis":
+        return RedisBackend(settings["url"])
+    return MemoryBackend()
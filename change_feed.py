@@ -0,0 +1,200 @@
+"""Change feed from Postgres NOTIFY to the dashboard caches.
+
+Statement-level triggers on client, client_stage_progression and textmessage
+send the table name on the dashboard_changes channel. A listener thread in the
+app bumps a version per table and expires today's range-cache entries of the
+pages that read it; the incremental engines skip their delta query while their
+tables are unchanged. An open page whose data is served from those caches
+reruns once one of its tables has changed, at most every MIN_RERUN_SECONDS;
+pages without a cache of their own keep the hourly refresh, since a rerun would
+run every one of their queries again.
+
+Install the triggers, then watch the channel while inserting rows in psql:
+
+    python change_feed.py --install
+    python change_feed.py --listen
+"""
+import argparse
+import json
+import select
+import threading
+import time
+from collections import Counter
+
+import psycopg2
+
+from db import CONNECT_TIMEOUT_SECONDS, get_db_params
+from range_cache import expire_tables
+
+CHANNEL = "dashboard_changes"
+WATCHED_TABLES = ('client', 'client_stage_progression', 'textmessage')
+
+# How long the listener waits on the socket before checking the connection again
+POLL_SECONDS = 30
+RECONNECT_SECONDS = 10
+# Changes arriving faster than this (a steady stream of texts) are coalesced into one rerun
+MIN_RERUN_SECONDS = 300
+
+INSTALL_SQL = f"""
+CREATE OR REPLACE FUNCTION dashboard_notify_change() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('{CHANNEL}', json_build_object('table', TG_TABLE_NAME, 'op', TG_OP)::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+""" + "".join(f"""
+DROP TRIGGER IF EXISTS dashboard_notify_change ON public.{table};
+CREATE TRIGGER dashboard_notify_change
+    AFTER INSERT OR UPDATE OR DELETE ON public.{table}
+    FOR EACH STATEMENT EXECUTE PROCEDURE dashboard_notify_change();
+""" for table in WATCHED_TABLES)
+
+UNINSTALL_SQL = "".join(
+    f"DROP TRIGGER IF EXISTS dashboard_notify_change ON public.{table};\n" for table in WATCHED_TABLES
+) + "DROP FUNCTION IF EXISTS dashboard_notify_change();\n"
+
+_versions = Counter()
+_versions_lock = threading.Lock()
+_page_tables = {}
+_rerun_pages = set()
+_listening = threading.Event()
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def watch_tables(page, tables, rerun=True):
+    """Record which tables a page reads; returns them for the page's cache calls.
+
+    rerun=False is for pages that query everything on each run, which are not
+    rerun by the feed.
+    """
+    tables = tuple(tables)
+    _page_tables[page] = tuple(dict.fromkeys(_page_tables.get(page, ()) + tables))
+    if rerun:
+        _rerun_pages.add(page)
+    return tables
+
+
+def table_versions(tables):
+    with _versions_lock:
+        return tuple(_versions[table] for table in tables)
+
+
+def page_versions(page):
+    return table_versions(_page_tables.get(page, ()))
+
+
+def is_listening():
+    return _listening.is_set()
+
+
+def reruns_on_change(page):
+    return page in _rerun_pages
+
+
+def should_rerun(page, seen, last_rerun, now=None):
+    """True when an open page should rerun: one of its tables changed since `seen`
+    and its last feed rerun (time.monotonic()) is at least MIN_RERUN_SECONDS ago"""
+    if not _listening.is_set() or not reruns_on_change(page) or page_versions(page) == seen:
+        return False
+    now = time.monotonic() if now is None else now
+    return now - last_rerun >= MIN_RERUN_SECONDS
+
+
+def unchanged(tables, seen):
+    """True only while the feed is live and none of the tables changed since `seen`"""
+    return _listening.is_set() and seen is not None and seen == table_versions(tables)
+
+
+def mark_changed(tables):
+    with _versions_lock:
+        for table in tables:
+            _versions[table] += 1
+    expire_tables(tables)
+
+
+def notified_table(payload):
+    """Table named by a notification, or None for a payload the triggers did not send"""
+    # Anyone can NOTIFY the channel; a stray payload must not stop the listener
+    try:
+        return json.loads(payload)['table']
+    except (ValueError, TypeError, KeyError) as error:
+        print(f"change feed: ignoring notification {payload!r}: {error!r}")
+        return None
+
+
+def _listen(connection):
+    with connection.cursor() as cursor:
+        cursor.execute(f"LISTEN {CHANNEL}")
+    _listening.set()
+    # Anything may have changed while nobody was listening
+    mark_changed(WATCHED_TABLES)
+    while True:
+        if select.select([connection], [], [], POLL_SECONDS) == ([], [], []):
+            continue
+        connection.poll()
+        tables = set()
+        while connection.notifies:
+            table = notified_table(connection.notifies.pop(0).payload)
+            if table is not None:
+                tables.add(table)
+        if tables:
+            mark_changed(tables)
+
+
+def _listen_forever():
+    while True:
+        connection = None
+        try:
+            # NOTIFY is only delivered on the primary, and LISTEN holds its own session
+            connection = psycopg2.connect(connect_timeout=CONNECT_TIMEOUT_SECONDS, **get_db_params())
+            connection.autocommit = True
+            _listen(connection)
+        except (psycopg2.Error, OSError) as error:
+            print(f"change feed: {error}; reconnecting in {RECONNECT_SECONDS}s")
+        finally:
+            _listening.clear()
+            if connection is not None:
+                connection.close()
+        time.sleep(RECONNECT_SECONDS)
+
+
+def start_change_feed():
+    """Start the process-wide listener thread once"""
+    global _listener
+    with _listener_lock:
+        if _listener is None:
+            _listener = threading.Thread(target=_listen_forever, name="change-feed", daemon=True)
+            _listener.start()
+    return _listener
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--install', action='store_true', help="create the NOTIFY triggers")
+    group.add_argument('--uninstall', action='store_true', help="drop the NOTIFY triggers")
+    group.add_argument('--listen', action='store_true', help="print notifications as they arrive")
+    args = parser.parse_args()
+
+    connection = psycopg2.connect(connect_timeout=CONNECT_TIMEOUT_SECONDS, **get_db_params())
+    connection.autocommit = True
+    try:
+        if args.listen:
+            with connection.cursor() as cursor:
+                cursor.execute(f"LISTEN {CHANNEL}")
+            print(f"listening on {CHANNEL}")
+            while True:
+                select.select([connection], [], [])
+                connection.poll()
+                while connection.notifies:
+                    print(connection.notifies.pop(0).payload)
+        with connection.cursor() as cursor:
+            cursor.execute(INSTALL_SQL if args.install else UNINSTALL_SQL)
+        print(f"{'installed' if args.install else 'removed'} triggers on {', '.join(WATCHED_TABLES)}")
+    finally:
+        connection.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""Client id -> name dimension for labelling activity rows.
+
+Ids are kept as a sorted NumPy array with the names in a matching Arrow string
+array, so a whole column of client ids is labelled with one searchsorted. The
+dimension is saved under history/; a cold start loads it from disk and only
+asks the database for clients with an id above the highest one it has.
+Renamed clients are picked up by the daily full reload, and while the change
+feed is live the delta query is skipped until the client table changes.
+"""
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from change_feed import table_versions, unchanged
+from db import fetch_arrow_frame, register_query
+from history_store import HISTORY_ROOT
+
+# Full client table on a reload; served by a replica when one is configured and current
+PROFILE = 'analytics'
+CHANGE_TABLES = ('client',)
+
+STORE_PATH = os.path.join(HISTORY_ROOT, "client_dimension", "clients.parquet")
+# Ids only grow; names can change, so the whole table is read again once a day
+FULL_RELOAD_SECONDS = 24 * 3600
+
+client_names_template = """
+SELECT c.id AS client_id, c.fullname AS client_name
+FROM public.client c
+{row_filter}
+ORDER BY c.id;
+"""
+
+fetch_client_names_query = register_query(
+    'client_dimension_names', client_names_template.format(row_filter=''))
+fetch_new_client_names_query = register_query(
+    'client_dimension_new_names', client_names_template.format(row_filter="WHERE c.id > %(since_id)s"))
+
+_dimension = {'ids': None, 'names': None, 'loaded_at': 0.0, 'feed_version': None}
+# Held only to read or swap the state; the queries run under _refresh_lock, so
+# lookups keep using the current dimension while one thread reloads it
+_dimension_lock = threading.Lock()
+_refresh_lock = threading.Lock()
+
+
+def _columns(frame):
+    """Sorted int64 ids and the matching names as an Arrow string array"""
+    frame = frame.dropna(subset=['client_id'])
+    ids = frame['client_id'].to_numpy(dtype='int64')
+    names = pa.array(frame['client_name'].to_numpy(dtype=object, na_value=None), pa.string())
+    if len(ids) > 1 and not (ids[1:] > ids[:-1]).all():
+        order = np.argsort(ids, kind='stable')
+        ids, names = ids[order], names.take(pa.array(order))
+    return ids, names
+
+
+def save_dimension(ids, names, loaded_at, path=STORE_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    table = pa.table({'client_id': ids, 'client_name': names})
+    table = table.replace_schema_metadata({'loaded_at': repr(loaded_at)})
+    # Write then rename so a crash never leaves a half-written dimension behind
+    temp_path = f"{path}.tmp"
+    pq.write_table(table, temp_path, compression='zstd')
+    os.replace(temp_path, path)
+
+
+def load_dimension(path=STORE_PATH):
+    """Saved ids, names and the wall-clock time of their last full reload, or None"""
+    if not os.path.exists(path):
+        return None
+    table = pq.read_table(path)
+    metadata = table.schema.metadata or {}
+    loaded_at = float(metadata.get(b'loaded_at', b'0'))
+    return table['client_id'].to_numpy(), table['client_name'].combine_chunks(), loaded_at
+
+
+def _refresh():
+    versions = table_versions(CHANGE_TABLES)
+    with _dimension_lock:
+        state = dict(_dimension)
+    if state['ids'] is None:
+        saved = load_dimension()
+        if saved is not None:
+            state['ids'], state['names'], state['loaded_at'] = saved
+            with _dimension_lock:
+                _dimension.update(ids=state['ids'], names=state['names'], loaded_at=state['loaded_at'])
+
+    if state['ids'] is None or time.time() - state['loaded_at'] > FULL_RELOAD_SECONDS:
+        frame = fetch_arrow_frame(fetch_client_names_query, profile=PROFILE)
+        if frame is None:
+            return
+        ids, names = _columns(frame)
+        loaded_at = time.time()
+    elif unchanged(CHANGE_TABLES, state['feed_version']):
+        return
+    else:
+        since_id = int(state['ids'][-1]) if len(state['ids']) else 0
+        frame = fetch_arrow_frame(fetch_new_client_names_query, {'since_id': since_id}, profile=PROFILE)
+        if frame is None:
+            return
+        if frame.empty:
+            with _dimension_lock:
+                _dimension['feed_version'] = versions
+            return
+        new_ids, new_names = _columns(frame)
+        # Every new id is above the previous maximum, so appending keeps the ids sorted
+        ids = np.concatenate([state['ids'], new_ids])
+        names = pa.concat_arrays([state['names'], new_names])
+        loaded_at = state['loaded_at']
+        print(f"client dimension: {len(new_ids)} new clients")
+
+    with _dimension_lock:
+        _dimension.update(ids=ids, names=names, loaded_at=loaded_at, feed_version=versions)
+    save_dimension(ids, names, loaded_at)
+
+
+def client_names(client_ids):
+    """Names for a column of client ids, missing for unknown ids; None if the dimension cannot be loaded"""
+    # Only one thread refreshes; the others label with the current dimension instead of
+    # waiting, unless there is none yet
+    with _dimension_lock:
+        loaded = _dimension['ids'] is not None
+    if _refresh_lock.acquire(blocking=not loaded):
+        try:
+            _refresh()
+        finally:
+            _refresh_lock.release()
+    with _dimension_lock:
+        ids, names = _dimension['ids'], _dimension['names']
+    if ids is None:
+        return None
+    index = client_ids.index
+    keys = pd.array(client_ids, dtype='Int64')
+    if not len(ids):
+        return pd.Series(None, index=index, dtype=object, name='client_name')
+    values = keys.to_numpy(dtype='int64', na_value=-1)
+    positions = np.minimum(np.searchsorted(ids, values), len(ids) - 1)
+    found = ~keys.isna() & (ids[positions] == values)
+    labels = pc.if_else(pa.array(found), names.take(pa.array(positions)), pa.scalar(None, pa.string()))
+    return pd.Series(labels.to_numpy(zero_copy_only=False), index=index, name='client_name')
@@ -1,30 +1,21 @@
 import streamlit as st
-import psycopg2
-import pandas as pd
 from datetime import datetime, timedelta
 
-def show_responsive_clients():
-    st.title("Responsive Clients")
+from change_feed import watch_tables
+from db import fetch_frame, register_query
+from exports import download_buttons
+from frame_dtypes import normalize_frame
+from range_cache import cached_days
+from roster import group_ids
 
-    db_params = {
-        'dbname': st.secrets["database"]["DB_NAME"],
-        'user': st.secrets["database"]["DB_USER"],
-        'password': st.secrets["database"]["DB_PASSWORD"],
-        'host': st.secrets["database"]["DB_HOST"],
-        'port': st.secrets["database"]["DB_PORT"]
-    }
+PAGE = "Responsive Clients"
+# Short recent ranges; read from the primary
+PROFILE = 'primary'
+# Tables whose changes make this page's cached results stale
+CHANGE_TABLES = watch_tables(PAGE, ('client', 'textmessage'))
 
-    # Date input to select a start and end date
-    st.subheader("Select Date Range for Client Records")
-    start_date = st.date_input("Start Date", datetime.now().date() - timedelta(days=1))
-    end_date = st.date_input("End Date", datetime.now().date())
-
-    # Convert dates to datetime format with start and end of the day
-    start_datetime = datetime.combine(start_date, datetime.min.time())
-    end_datetime = datetime.combine(end_date, datetime.max.time())
-
-    # Query for all clients
-    fetch_all_clients_query = f"""
+# Query for all clients
+all_clients_query = register_query('responsive_all_clients', """
     WITH clients_created_today AS (
         SELECT 
             c.id AS client_id,
@@ -32,6 +23,7 @@ def show_responsive_clients():
             e.fullname AS assigned_employee_name,
             c.fphone1 AS phone_number,
             c.fullname AS client_name,
+            c.created AT TIME ZONE 'UTC' AT TIME ZONE 'CST' AS created_at,
             r.move_in_date AS move_in_date,
             r.budget AS budget,
             r.beds AS beds,
@@ -48,9 +40,9 @@ def show_responsive_clients():
         LEFT JOIN 
             public.employee e ON c.assigned_employee = e.id
         WHERE 
-            c.created >= '{start_datetime}'::timestamp AT TIME ZONE 'CST'
-            AND c.created <= '{end_datetime}'::timestamp AT TIME ZONE 'CST'
-            AND (c.assigned_employee NOT IN (317, 318, 319,410,415,416,344,160,20) OR c.assigned_employee IS NULL)
+            c.created >= %(start_datetime)s::timestamp AT TIME ZONE 'CST'
+            AND c.created <= %(end_datetime)s::timestamp AT TIME ZONE 'CST'
+            AND (c.assigned_employee <> ALL(%(excluded_ids)s) OR c.assigned_employee IS NULL)
     ),
     clients_with_received_status AS (
         SELECT DISTINCT 
@@ -76,6 +68,7 @@ def show_responsive_clients():
         c.city,
         c.state,
         c.street,
+        c.created_at,
         CASE 
             WHEN EXISTS (
                 SELECT 1 
@@ -90,10 +83,10 @@ def show_responsive_clients():
         clients_with_received_status r ON c.client_id = r.client_id
     ORDER BY 
         c.client_id;
-    """
+""")
 
-    # Query for clients assigned to employees 317, 318, and 319
-    fetch_specific_employees_query = f"""
+# Query for clients assigned to the May accounts
+specific_employees_query = register_query('responsive_may_account_clients', """
      WITH clients_created_today AS (
         SELECT 
             c.id AS client_id,
@@ -101,6 +94,7 @@ def show_responsive_clients():
             e.fullname AS assigned_employee_name,
             c.fphone1 AS phone_number,
             c.fullname AS client_name,
+            c.created AT TIME ZONE 'UTC' AT TIME ZONE 'CST' AS created_at,
             r.move_in_date AS move_in_date,
             r.budget AS budget,
             r.beds AS beds,
@@ -117,9 +111,9 @@ def show_responsive_clients():
         LEFT JOIN 
             public.employee e ON c.assigned_employee = e.id
         WHERE 
-            c.created >= '{start_datetime}'::timestamp AT TIME ZONE 'CST'
-            AND c.created <= '{end_datetime}'::timestamp AT TIME ZONE 'CST'
-            AND c.assigned_employee IN (317, 318, 319,410,415,416,20,160)
+            c.created >= %(start_datetime)s::timestamp AT TIME ZONE 'CST'
+            AND c.created <= %(end_datetime)s::timestamp AT TIME ZONE 'CST'
+            AND c.assigned_employee = ANY(%(may_account_ids)s)
     ),
     clients_with_received_status AS (
         SELECT DISTINCT 
@@ -145,6 +139,7 @@ def show_responsive_clients():
         c.city,
         c.state,
         c.street,
+        c.created_at,
         CASE 
             WHEN EXISTS (
                 SELECT 1 
@@ -159,27 +154,46 @@ def show_responsive_clients():
         clients_with_received_status r ON c.client_id = r.client_id
     ORDER BY 
         c.client_id;
-    """
+""")
 
-    def fetch_data(query):
-        connection = None
-        cursor = None
-        try:
-            connection = psycopg2.connect(**db_params)
-            cursor = connection.cursor()
-            cursor.execute(query)
-            records = cursor.fetchall()
-            column_names = [desc[0] for desc in cursor.description]
-            df = pd.DataFrame(records, columns=column_names)
-            return df
-        except Exception as error:
-            st.error(f"Error fetching records: {error}")
-            return None
-        finally:
-            if cursor:
-                cursor.close()
-            if connection:
-                connection.close()
+def fetch_range(query):
+    def fetch_clients_range(first_day, last_day):
+        # Convert dates to datetime format with start and end of the day
+        start_datetime = datetime.combine(first_day, datetime.min.time())
+        end_datetime = datetime.combine(last_day, datetime.max.time())
+        params = {'start_datetime': start_datetime, 'end_datetime': end_datetime,
+                  'excluded_ids': group_ids('excluded'), 'may_account_ids': group_ids('may_accounts')}
+        return fetch_frame(query, params, profile=PROFILE)
+    return fetch_clients_range
+
+def number_clients(df):
+    # Row numbers were per query; renumber across the cached days
+    if df is None or df.empty:
+        return df
+    df = df.sort_values('client_id', ignore_index=True)
+    df['count'] = range(1, len(df) + 1)
+    return df
+
+def load_responsive_clients(start_date, end_date):
+    # Only days missing from the per-day cache are queried
+    all_clients_data = cached_days('responsive_all_clients', start_date, end_date,
+                                   fetch_range(all_clients_query), 'created_at', tables=CHANGE_TABLES)
+    specific_employees_data = cached_days('responsive_may_account_clients', start_date, end_date,
+                                          fetch_range(specific_employees_query), 'created_at', tables=CHANGE_TABLES)
+    all_clients_data = number_clients(all_clients_data)
+    specific_employees_data = number_clients(specific_employees_data)
+    return {
+        'all_clients': normalize_frame(all_clients_data, PAGE),
+        'may_account_clients': normalize_frame(specific_employees_data, PAGE),
+    }
+
+def show_responsive_clients():
+    st.title("Responsive Clients")
+
+    # Date input to select a start and end date
+    st.subheader("Select Date Range for Client Records")
+    start_date = st.date_input("Start Date", datetime.now().date() - timedelta(days=1))
+    end_date = st.date_input("End Date", datetime.now().date())
 
     def display_clients_as_table(df, title):
         st.subheader(title)
@@ -194,20 +208,13 @@ def show_responsive_clients():
                              'move_in_date', 'credit_score', 'section8', 'city', 'state', 'street', 'calls', 'FUB Link']]
             st.write(df_display.to_html(escape=False, index=False), unsafe_allow_html=True)
 
-            # Add download button for CSV
-            csv = df.to_csv(index=False)
-            st.download_button(
-                label=f"Download {title} as CSV",
-                data=csv,
-                file_name=f"{title.replace(' ', '_').lower()}.csv",
-                mime="text/csv"
-            )
+            # Add download buttons; the file is only written when one is clicked
+            download_buttons(f"Download {title}", title.replace(' ', '_').lower(), df)
 
-    # Fetch and display data for all clients
-    all_clients_data = fetch_data(fetch_all_clients_query)
-    display_clients_as_table(all_clients_data, "All Clients (Assigned to Sales Rep)")
+    data = load_responsive_clients(start_date, end_date)
 
-    # Fetch and display data for specific employees
-    specific_employees_data = fetch_data(fetch_specific_employees_query)
-    display_clients_as_table(specific_employees_data, "All Clients Assigned to May Account's")
+    # Display data for all clients
+    display_clients_as_table(data['all_clients'], "All Clients (Assigned to Sales Rep)")
 
+    # Display data for specific employees
+    display_clients_as_table(data['may_account_clients'], "All Clients Assigned to May Account's")
@@ -1,113 +1,127 @@
 import streamlit as st
-import psycopg2
-import pandas as pd
 import matplotlib.pyplot as plt
+import pandas as pd
 from datetime import datetime, timedelta
 
-def show_client_stage_progression():
-    st.title("Client Stage Progression Report")
-
-    db_params = {
-        'dbname': st.secrets["database"]["DB_NAME"],
-        'user': st.secrets["database"]["DB_USER"],
-        'password': st.secrets["database"]["DB_PASSWORD"],
-        'host': st.secrets["database"]["DB_HOST"],
-        'port': st.secrets["database"]["DB_PORT"]
-    }
-    
-    fetch_leads_stage_4_and_beyond_query = """
-        SELECT 
-            csp.client_id,
-            c.fullname AS client_name,
-            e.fullname AS employee_name,
-            MAX(csp.current_stage) AS current_stage,
-            MAX(csp.created_on) AS time_entered_stage,
-            CONCAT('https://services.followupboss.com/2/people/view/', csp.client_id) AS followup_boss_link
-        FROM 
-            public.client_stage_progression csp
-        JOIN 
-            public.client c ON csp.client_id = c.id
-        JOIN 
-            public.employee e ON c.assigned_employee = e.id
-        WHERE 
-            csp.current_stage >= 4
-            AND csp.created_on BETWEEN %s AND %s
-        GROUP BY 
-            csp.client_id, c.fullname, e.fullname
-        ORDER BY 
-            csp.client_id;
-    """
-
-    fetch_sales_reps_count_query = """
-    WITH latest_stage_progression AS (
+from change_feed import watch_tables
+from db import fetch_arrow_frame, fetch_frame, register_query
+from exports import download_buttons
+from frame_dtypes import STAGE_NAMES, normalize_frame
+from range_cache import cached_days
+
+PAGE = "Client Stage Progression Report"
+# Full-history analytics; served by a replica when one is configured and current
+PROFILE = 'analytics'
+# Tables whose changes make this page's cached results stale
+CHANGE_TABLES = watch_tables(PAGE, ('client', 'client_stage_progression'))
+
+# One row per client and day, so days can be cached and combined independently
+fetch_leads_stage_4_and_beyond_query = register_query('stage_4_leads_by_day', """
+SELECT 
+    csp.client_id,
+    c.fullname AS client_name,
+    e.fullname AS employee_name,
+    MAX(csp.current_stage) AS current_stage,
+    MAX(csp.created_on) AS time_entered_stage,
+    CONCAT('https://services.followupboss.com/2/people/view/', csp.client_id) AS followup_boss_link,
+    DATE(csp.created_on) AS day_entered
+FROM 
+    public.client_stage_progression csp
+JOIN 
+    public.client c ON csp.client_id = c.id
+JOIN 
+    public.employee e ON c.assigned_employee = e.id
+WHERE 
+    csp.current_stage >= 4
+    AND csp.created_on >= %(first_day)s AND csp.created_on < %(end_day)s
+GROUP BY 
+    csp.client_id, c.fullname, e.fullname, DATE(csp.created_on)
+ORDER BY 
+    csp.client_id;
+""")
+
+fetch_stage_clients_query = register_query('stage_clients', """
+SELECT 
+    csp.client_id,
+    c.fullname AS client_name,
+    e.fullname AS employee_name,
+    csp.current_stage,
+    csp.created_on AS time_entered_stage,
+    CONCAT('https://services.followupboss.com/2/people/view/', csp.client_id) AS followup_boss_link
+FROM 
+    public.client_stage_progression csp
+JOIN 
+    public.client c ON csp.client_id = c.id
+JOIN 
+    public.employee e ON c.assigned_employee = e.id
+INNER JOIN (
     SELECT 
-        csp.client_id,
-        e.fullname AS employee_name,
-        DATE(MAX(csp.created_on)) AS date_moved
+        client_id,
+        MAX(created_on) AS latest_created_on
     FROM 
-        public.client_stage_progression csp
-    JOIN 
-        public.client c ON csp.client_id = c.id
-    JOIN 
-        public.employee e ON c.assigned_employee = e.id
+        public.client_stage_progression
     WHERE 
-        csp.current_stage >= 4
-        AND csp.created_on BETWEEN %s AND %s
+        current_stage >= 4
     GROUP BY 
-        csp.client_id, e.fullname
+        client_id
+) latest_stage ON csp.client_id = latest_stage.client_id 
+            AND csp.created_on = latest_stage.latest_created_on
+WHERE 
+    csp.current_stage = %(stage)s
+    AND csp.created_on::date BETWEEN %(first_day)s AND %(last_day)s
+ORDER BY 
+    csp.created_on DESC;
+""")
+
+def fetch_leads_range(first_day, last_day):
+    return fetch_arrow_frame(fetch_leads_stage_4_and_beyond_query,
+                             {'first_day': first_day, 'end_day': last_day + timedelta(days=1)}, profile=PROFILE)
+
+def combine_leads(leads_by_day):
+    # Latest stage and time per client over the whole range
+    leads = (
+        leads_by_day.groupby(['client_id', 'client_name', 'employee_name', 'followup_boss_link'], dropna=False)
+        .agg(current_stage=('current_stage', 'max'), time_entered_stage=('time_entered_stage', 'max'))
+        .reset_index()
     )
-    SELECT 
-        employee_name,
-        date_moved,
-        COUNT(client_id) AS count_of_leads
-    FROM 
-        latest_stage_progression
-    GROUP BY 
-        employee_name, date_moved
-    ORDER BY 
-        date_moved DESC, count_of_leads DESC;
-    """
+    return leads[['client_id', 'client_name', 'employee_name', 'current_stage', 'time_entered_stage', 'followup_boss_link']]
+
+def count_sales_reps(leads):
+    # Each client counts once, on the day of its latest move to stage 4 or beyond
+    moved = leads.assign(date_moved=pd.to_datetime(leads['time_entered_stage']).dt.date)
+    sales_reps = moved.groupby(['employee_name', 'date_moved']).size().reset_index(name='count_of_leads')
+    return sales_reps.sort_values(['date_moved', 'count_of_leads'], ascending=False, ignore_index=True)
+
+def load_stage_clients(option, start_date, end_date):
+    def fetch_stage_clients_range(first_day, last_day):
+        return fetch_frame(fetch_stage_clients_query, {'stage': option, 'first_day': first_day, 'last_day': last_day}, profile=PROFILE)
+
+    # Only days missing from the per-day cache are queried. A client's newer stage row (or a
+    # reassignment) changes earlier days' results, so any change expires every cached day
+    stage_clients = cached_days(f'stage_{option}_clients', start_date, end_date,
+                                fetch_stage_clients_range, 'time_entered_stage', tables=CHANGE_TABLES,
+                                expire_all=True)
+    if stage_clients is not None and not stage_clients.empty:
+        stage_clients = stage_clients.sort_values('time_entered_stage', ascending=False, ignore_index=True)
+    return normalize_frame(stage_clients, PAGE)
+
+def load_client_stage_progression(start_date, end_date, stages=()):
+    # Only days missing from the per-day cache are queried; today is always up to now
+    leads_by_day = cached_days('stage_4_leads', start_date, end_date, fetch_leads_range, 'day_entered', tables=CHANGE_TABLES)
+    leads_data = sales_reps_data = None
+    if leads_by_day is not None:
+        leads_data = combine_leads(leads_by_day)
+        sales_reps_data = count_sales_reps(leads_data)
+    data = {
+        'leads': normalize_frame(leads_data, PAGE),
+        'sales_reps': normalize_frame(sales_reps_data, PAGE),
+    }
+    for stage in stages:
+        data[f'stage_{stage}_clients'] = load_stage_clients(stage, start_date, end_date)
+    return data
 
-    def fetch_data(query, start_date, end_date):
-        connection = None
-        cursor = None
-        try:
-            connection = psycopg2.connect(**db_params)
-            cursor = connection.cursor()
-            cursor.execute(query, (start_date, end_date))
-            records = cursor.fetchall()
-            column_names = [desc[0] for desc in cursor.description]
-            df = pd.DataFrame(records, columns=column_names)
-            
-            return df
-            
-        except Exception as error:
-            st.error(f"Error fetching records: {error}")
-        finally:
-            if cursor:
-                cursor.close()
-            if connection:
-                connection.close()
-    def fetch_data_stage(query, option, start_date, end_date):
-        connection = None
-        cursor = None
-        try:
-            connection = psycopg2.connect(**db_params)
-            cursor = connection.cursor()
-            cursor.execute(query, (option, start_date, end_date))
-            records = cursor.fetchall()
-            column_names = [desc[0] for desc in cursor.description]
-            df = pd.DataFrame(records, columns=column_names)
-            
-            return df
-            
-        except Exception as error:
-            st.error(f"Error fetching records: {error}")
-        finally:
-            if cursor:
-                cursor.close()
-            if connection:
-                connection.close()
+def show_client_stage_progression():
+    st.title("Client Stage Progression Report")
 
     def plot_leads_stage_4_and_beyond(df):
         st.subheader("Bar Chart of Clients in Property Touring and Beyond")
@@ -118,15 +132,7 @@ def show_client_stage_progression():
             return
 
         # Map stage numbers to names
-        stage_mapping = {
-            4: 'Stage 4: Property Touring',
-            5: 'Stage 5: Property Tour and Feedback',
-            6: 'Stage 6: Application and Approval',
-            7: 'Stage 7: Post-Approval and Follow-Up',
-            8: 'Stage 8: Commission Collection'
-        }
-        
-        df['stage_name'] = df['current_stage'].map(stage_mapping)
+        df['stage_name'] = df['current_stage'].map(STAGE_NAMES)
 
         # Group by stage_name and count the number of clients in each stage
         stage_counts = df['stage_name'].value_counts().sort_index()
@@ -154,26 +160,22 @@ def show_client_stage_progression():
     
     def create_employee_stage_table(df):
         st.subheader("Number of Clients in Each Stage per Employee")
-        pivot_df = df.pivot_table(index='employee_name', columns='current_stage', aggfunc='size', fill_value=0)
-        pivot_df = pivot_df.rename(columns={4: 'Stage 4: Property Touring', 5: 'Stage 5: Property Tour and Feedback', 6: 'Stage 6: Application and Approval', 7: 'Stage 7: Post-Approval and Follow-Up', 8: 'Stage 8: Commission Collection'})
+        pivot_df = df.pivot_table(index='employee_name', columns='current_stage', aggfunc='size', fill_value=0, observed=True)
+        pivot_df = pivot_df.rename(columns=STAGE_NAMES)
         st.dataframe(pivot_df)
 
     # Show the date range message
     selected_start_date = st.date_input("Select Start Date", datetime.today())
     selected_end_date = st.date_input("Select End Date", datetime.today())  # Default to today's date
 
-    # Convert selected dates to strings
-    start_date_filter = selected_start_date.strftime('%Y-%m-%d')
-    end_date_filter = selected_end_date.strftime('%Y-%m-%d')
-
     # Check if start and end dates are the same
-    if start_date_filter == end_date_filter:
-        st.markdown(f"**DATE: {start_date_filter}** (This report contains data for the selected day up to the current time)")
-        end_date_filter = datetime.now().strftime('%Y-%m-%d %H:%M:%S')  # Include current time for the same day
+    if selected_start_date == selected_end_date:
+        st.markdown(f"**DATE: {selected_start_date.strftime('%Y-%m-%d')}** (This report contains data for the selected day up to the current time)")
     else:
-        st.markdown(f"**DATE RANGE: {start_date_filter} to {end_date_filter}**")
+        st.markdown(f"**DATE RANGE: {selected_start_date.strftime('%Y-%m-%d')} to {selected_end_date.strftime('%Y-%m-%d')}**")
 
-    leads_data = fetch_data(fetch_leads_stage_4_and_beyond_query, start_date_filter, end_date_filter)
+    data = load_client_stage_progression(selected_start_date, selected_end_date)
+    leads_data = data['leads']
 
     if leads_data is not None:
         st.subheader("Leads in Property Touring and Beyond")
@@ -183,7 +185,7 @@ def show_client_stage_progression():
         plot_leads_stage_4_and_beyond(leads_data)
         create_employee_stage_table(leads_data)
 
-    sales_reps_data = fetch_data(fetch_sales_reps_count_query, start_date_filter, end_date_filter)
+    sales_reps_data = data['sales_reps']
 
     if sales_reps_data is not None:
         st.subheader("Sales Reps Moving Leads to Property Touring and Beyond")
@@ -192,46 +194,13 @@ def show_client_stage_progression():
         plot_sales_reps_moving_leads(sales_reps_data)
 
 
-    fetch_stage_7_clients_query = """
-        SELECT 
-            csp.client_id,
-            c.fullname AS client_name,
-            e.fullname AS employee_name,
-            csp.current_stage,
-            csp.created_on AS time_entered_stage,
-            CONCAT('https://services.followupboss.com/2/people/view/', csp.client_id) AS followup_boss_link
-        FROM 
-            public.client_stage_progression csp
-        JOIN 
-            public.client c ON csp.client_id = c.id
-        JOIN 
-            public.employee e ON c.assigned_employee = e.id
-        INNER JOIN (
-            SELECT 
-                client_id,
-                MAX(created_on) AS latest_created_on
-            FROM 
-                public.client_stage_progression
-            WHERE 
-                current_stage >= 4
-            GROUP BY 
-                client_id
-        ) latest_stage ON csp.client_id = latest_stage.client_id 
-                    AND csp.created_on = latest_stage.latest_created_on
-        WHERE 
-            csp.current_stage = %s
-            AND csp.created_on::date BETWEEN %s AND %s
-        ORDER BY 
-            csp.created_on DESC;
-    """
-
     option = st.selectbox(
         "Select Stage You want to see?",
         ("7", "6", "5", "4"),
         index=None,
         placeholder="Select Stage Number...",
     )
-    stage_7_clients = fetch_data_stage(fetch_stage_7_clients_query , option, start_date_filter, end_date_filter)
+    stage_7_clients = load_stage_clients(option, selected_start_date, selected_end_date)
     
     if stage_7_clients is not None and not stage_7_clients.empty:
         if option == "7": 
@@ -254,11 +223,12 @@ def show_client_stage_progression():
         # Render the table with HTML links
         st.write(stage_7_display.to_html(escape=False, index=False), unsafe_allow_html=True)
 
-        # Add CSV download button
-        csv_data = stage_7_display.drop(columns=['FUB Link'])  # Exclude HTML column for clean CSV
-        csv_data['FUB Link'] = stage_7_clients['followup_boss_link']  # Add plain URL in CSV
-        csv = csv_data.to_csv(index=False)
-        st.download_button(label=f"Download Stage {option} Clients CSV", data=csv, file_name=f"Stage{option}_Clients.csv", mime="text/csv")
+        # Add download buttons; the export frame is only built when one is clicked
+        def export_frame():
+            csv_data = stage_7_display.drop(columns=['FUB Link'])  # Exclude HTML column for clean CSV
+            csv_data['FUB Link'] = stage_7_clients['followup_boss_link']  # Add plain URL in CSV
+            return csv_data
+        download_buttons(f"Download Stage {option} Clients", f"Stage{option}_Clients", export_frame)
         
         st.write(f"Total clients at Stage {option}: {len(stage_7_clients)}")
     else:
@@ -0,0 +1,236 @@
+"""Weekly creation-cohort funnel: how many clients created each week reached
+stages 4 (Property Touring) through 8 (Commission Collection).
+
+The engine keeps one row per client (cohort week and furthest stage reached)
+and the per-cohort counts derived from it. Both are kept in the process and the
+client state is saved under history/, so a cold start loads it from disk and
+only asks the database for clients and progression rows after the watermarks.
+A refresh recounts just the cohorts those rows belong to. Rows the watermarks
+miss (committed late, backfilled, deleted or re-dated) are picked up by a full
+reload once a day.
+"""
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import streamlit as st
+
+from change_feed import table_versions, unchanged, watch_tables
+from db import fetch_arrow_frame, register_query
+from frame_dtypes import STAGE_NAMES
+from history_store import HISTORY_ROOT
+from stage_velocity import week_start
+
+PAGE = "Weekly Cohort Funnel"
+# Full-history aggregate on a cold start; served by a replica when one is configured and current
+PROFILE = 'analytics'
+# Tables whose changes make this page's cached results stale
+CHANGE_TABLES = watch_tables(PAGE, ('client', 'client_stage_progression'))
+
+FUNNEL_STAGES = [4, 5, 6, 7, 8]
+STATE_PATH = os.path.join(HISTORY_ROOT, "cohort_funnel", "clients.parquet")
+DEFAULT_WEEKS = 26
+# The delta only sees rows after the watermarks, so the whole state is rebuilt once a day
+FULL_RELOAD_SECONDS = 24 * 3600
+
+# Stage 9 (Dead Stage) is not progress, so only stages 1-8 count toward the furthest stage
+client_progress_columns = """
+    c.id AS client_id,
+    c.created AS created,
+    c.created AT TIME ZONE 'UTC' AT TIME ZONE 'CST' AS created_at,
+    MAX(csp.current_stage) FILTER (WHERE csp.current_stage BETWEEN 1 AND 8) AS furthest_stage,
+    MAX(csp.created_on) AS last_progression
+"""
+
+fetch_client_progress_query = register_query('cohort_funnel_client_progress', f"""
+SELECT {client_progress_columns}
+FROM
+    public.client c
+LEFT JOIN
+    public.client_stage_progression csp ON csp.client_id = c.id
+GROUP BY
+    c.id;
+""")
+
+# New clients with all their rows, plus existing clients with only their new rows
+fetch_changed_client_progress_query = register_query('cohort_funnel_changed_client_progress', f"""
+SELECT {client_progress_columns}
+FROM
+    public.client c
+LEFT JOIN
+    public.client_stage_progression csp ON csp.client_id = c.id
+WHERE
+    c.created > %(clients_since)s
+GROUP BY
+    c.id
+UNION ALL
+SELECT {client_progress_columns}
+FROM
+    public.client_stage_progression csp
+JOIN
+    public.client c ON csp.client_id = c.id
+WHERE
+    csp.created_on > %(progress_since)s
+GROUP BY
+    c.id;
+""")
+
+_funnel = {'state': None, 'counts': None, 'clients_since': None, 'progress_since': None, 'loaded_at': 0.0,
+           'feed_version': None}
+_funnel_lock = threading.Lock()
+
+
+def client_rows(progress):
+    """One row per client: cohort week and furthest stage, 0 before any progression"""
+    progress = progress.dropna(subset=['client_id', 'created_at'])
+    rows = pd.DataFrame({
+        'client_id': progress['client_id'].to_numpy(dtype='int64'),
+        'cohort': week_start(progress['created_at']).to_numpy(),
+        'furthest_stage': progress['furthest_stage'].to_numpy(dtype='float64', na_value=0).astype('int8'),
+    })
+    # A client can appear in both halves of the changed-rows query
+    return rows.groupby('client_id').agg(cohort=('cohort', 'first'), furthest_stage=('furthest_stage', 'max'))
+
+
+def cohort_counts(state):
+    """Clients per cohort and how many of them reached each funnel stage"""
+    stages = state['furthest_stage'].to_numpy()
+    reached = pd.DataFrame({stage: stages >= stage for stage in FUNNEL_STAGES}, index=state.index)
+    reached.insert(0, 'clients', 1)
+    return reached.groupby(state['cohort'].to_numpy()).sum().rename_axis('cohort')
+
+
+def apply_changes(state, counts, changed):
+    """Fold changed client rows into the state and recount only the cohorts they belong to"""
+    existing = changed.index.isin(state.index)
+    updated = changed[existing]
+    state.loc[updated.index, 'furthest_stage'] = np.maximum(
+        state.loc[updated.index, 'furthest_stage'].to_numpy(), updated['furthest_stage'].to_numpy())
+    state = pd.concat([state, changed[~existing]])
+
+    touched = pd.Index(changed['cohort'].unique())
+    recounted = cohort_counts(state[state['cohort'].isin(touched)])
+    counts = pd.concat([counts.drop(touched, errors='ignore'), recounted]).sort_index()
+    return state, counts
+
+
+def _max_time(progress, column, current):
+    latest = progress[column].max() if not progress.empty else None
+    if latest is None or pd.isna(latest):
+        return current
+    return latest if current is None else max(latest, current)
+
+
+def save_state(state, clients_since, progress_since, loaded_at, path=STATE_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    table = pa.Table.from_pandas(state.reset_index(), preserve_index=False)
+    table = table.replace_schema_metadata({
+        'clients_since': pd.Timestamp(clients_since).isoformat() if clients_since is not None else '',
+        'progress_since': pd.Timestamp(progress_since).isoformat() if progress_since is not None else '',
+        'loaded_at': repr(loaded_at),
+    })
+    # Write then rename so a crash never leaves a half-written state behind
+    temp_path = f"{path}.tmp"
+    pq.write_table(table, temp_path, compression='zstd')
+    os.replace(temp_path, path)
+
+
+def load_state(path=STATE_PATH):
+    """Saved client state, its watermarks and the wall-clock time of its last full
+    reload, or None when nothing is saved yet"""
+    if not os.path.exists(path):
+        return None
+    table = pq.read_table(path)
+    metadata = {key.decode(): value.decode() for key, value in (table.schema.metadata or {}).items()}
+    state = table.to_pandas().set_index('client_id')
+    watermarks = [pd.Timestamp(metadata[key]) if metadata.get(key) else None
+                  for key in ('clients_since', 'progress_since')]
+    # States saved before full reloads were recorded count as due for one
+    return state, *watermarks, float(metadata.get('loaded_at', '0'))
+
+
+def _refresh():
+    versions = table_versions(CHANGE_TABLES)
+    if _funnel['state'] is None:
+        saved = load_state()
+        if saved is not None:
+            state, _funnel['clients_since'], _funnel['progress_since'], _funnel['loaded_at'] = saved
+            _funnel['state'], _funnel['counts'] = state, cohort_counts(state)
+
+    if _funnel['state'] is None or time.time() - _funnel['loaded_at'] > FULL_RELOAD_SECONDS:
+        progress = fetch_arrow_frame(fetch_client_progress_query, profile=PROFILE)
+        if progress is None:
+            return
+        state = client_rows(progress)
+        counts = cohort_counts(state)
+        # The reload replaces the state, so its watermarks start over from what it read
+        _funnel['clients_since'] = _funnel['progress_since'] = None
+        _funnel['loaded_at'] = time.time()
+    elif unchanged(CHANGE_TABLES, _funnel['feed_version']):
+        return
+    else:
+        progress = fetch_arrow_frame(fetch_changed_client_progress_query,
+                                     {'clients_since': _funnel['clients_since'],
+                                      'progress_since': _funnel['progress_since']}, profile=PROFILE)
+        if progress is None:
+            return
+        if progress.empty:
+            _funnel['feed_version'] = versions
+            return
+        state, counts = apply_changes(_funnel['state'], _funnel['counts'], client_rows(progress))
+        print(f"{PAGE}: {len(progress)} changed clients")
+
+    _funnel['clients_since'] = _max_time(progress, 'created', _funnel['clients_since'])
+    _funnel['progress_since'] = _max_time(progress, 'last_progression', _funnel['progress_since'])
+    _funnel['state'], _funnel['counts'], _funnel['feed_version'] = state, counts, versions
+    save_state(state, _funnel['clients_since'], _funnel['progress_since'], _funnel['loaded_at'])
+
+
+def cohort_funnel():
+    """Per-cohort counts, refreshed with the clients and rows added since the last call"""
+    with _funnel_lock:
+        _refresh()
+        return _funnel['counts']
+
+
+def funnel_table(counts, weeks=None):
+    """Counts and conversion from creation to each stage for the most recent cohorts"""
+    if weeks:
+        counts = counts.tail(weeks)
+    table = pd.DataFrame({'Cohort Week': counts.index, 'Clients': counts['clients'].to_numpy()})
+    for stage in FUNNEL_STAGES:
+        name = STAGE_NAMES[stage]
+        table[name] = counts[stage].to_numpy()
+        table[f"{name} %"] = (100 * counts[stage] / counts['clients']).round(1).to_numpy()
+    return table
+
+
+def load_cohort_funnel(weeks=None):
+    started = time.perf_counter()
+    counts = cohort_funnel()
+    if counts is None:
+        return {'funnel': None}
+    funnel = funnel_table(counts, weeks)
+    print(f"{PAGE}: {len(counts)} cohorts in {time.perf_counter() - started:.2f}s")
+    return {'funnel': funnel}
+
+
+def show_cohort_funnel():
+    st.title("Weekly Cohort Funnel")
+    st.markdown("Share of the clients created each week that have reached each stage so far.")
+
+    weeks = st.slider("Cohort weeks to show", min_value=4, max_value=156, value=DEFAULT_WEEKS)
+    funnel = load_cohort_funnel(weeks)['funnel']
+    if funnel is None or funnel.empty:
+        st.write("No clients found.")
+        return
+
+    st.dataframe(funnel, hide_index=True)
+
+    st.subheader("Conversion by Cohort (%)")
+    conversion = funnel.set_index('Cohort Week')[[f"{STAGE_NAMES[stage]} %" for stage in FUNNEL_STAGES]]
+    st.line_chart(conversion)
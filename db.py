@@ -0,0 +1,463 @@
+import io
+import itertools
+import re
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+import pandas as pd
+import psycopg2.extensions
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import streamlit as st
+from psycopg2.extensions import QueryCanceledError
+from psycopg2.pool import PoolError, ThreadedConnectionPool
+from streamlit.runtime import Runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from metrics import query_errors, query_rows, query_seconds
+
+# Shared by every page in the process and by the batch runner's workers
+POOL_MIN_CONNECTIONS = 1
+POOL_MAX_CONNECTIONS = 16
+CONNECT_TIMEOUT_SECONDS = 5
+# ThreadedConnectionPool raises at once when every connection is out; borrowers
+# wait up to this long for one to be returned instead
+POOL_CHECKOUT_TIMEOUT_SECONDS = 60
+
+# Secrets section of the primary; replica sections only need the keys that differ
+PRIMARY_TARGET = 'database'
+PRIMARY_PROFILE = 'primary'
+
+# Pages pick a profile; each gets its own pool and session settings on every target.
+# 'replicas' are secrets sections tried in order, skipped when missing or lagging.
+CONNECTION_PROFILES = {
+    'primary': {
+        'replicas': (),
+        'statement_timeout': '60s',
+        'work_mem': '16MB',
+        'pool_size': POOL_MAX_CONNECTIONS,
+    },
+    'analytics': {
+        'replicas': ('replica',),
+        'statement_timeout': '10min',
+        'work_mem': '256MB',
+        'pool_size': 8,
+        'max_lag_seconds': 60,
+    },
+}
+
+# How long a measured replica lag is trusted before it is checked again
+LAG_CHECK_SECONDS = 30
+
+# A replica that has replayed everything it received is current even if the primary is idle
+REPLICA_LAG_QUERY = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+_pools = {}
+_pool_lock = threading.Lock()
+_lag_checks = {}
+_lag_lock = threading.Lock()
+
+# Session id -> its newest script run, and the connections each session has checked out.
+# A rerun starts a new script thread while the old one may still be waiting on the server.
+_latest_runs = {}
+_inflight = {}
+_runs_lock = threading.Lock()
+_run_ids = itertools.count(1)
+
+# Named templates with %(name)s parameters, prepared once per pooled connection
+QUERY_REGISTRY = {}
+_PARAM_PATTERN = re.compile(r'%\((\w+)\)s')
+
+# Query name -> {'prepared': n, 'reused': n}; reused executions skip parsing and planning setup
+plan_cache_stats = {}
+_stats_lock = threading.Lock()
+
+
+class RegisteredQuery:
+    """A report query registered under a name and run as a server-side prepared statement"""
+
+    def __init__(self, name, sql):
+        self.name = name
+        self.sql = sql.strip().rstrip(';')
+        # The SQL hash in the name keeps an edited, reloaded template from reusing the old plan
+        self.statement_name = f"{name}_{zlib.crc32(self.sql.encode()):08x}"
+        self.param_names = list(dict.fromkeys(_PARAM_PATTERN.findall(self.sql)))
+        numbered = _PARAM_PATTERN.sub(lambda match: f"${self.param_names.index(match.group(1)) + 1}", self.sql)
+        # PREPARE is sent without parameters, so psycopg2 does not unescape %% itself
+        self.statement = numbered.replace('%%', '%')
+
+
+def register_query(name, sql):
+    query = RegisteredQuery(name, sql)
+    registered = QUERY_REGISTRY.get(name)
+    # Streamlit re-imports edited pages; the same template keeps its registration
+    if registered is not None and registered.statement_name == query.statement_name:
+        return registered
+    QUERY_REGISTRY[name] = query
+    return query
+
+
+class ReportConnection(psycopg2.extensions.connection):
+    """Connection that remembers which registered queries it has prepared"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared_statements = set()
+        # (session_id, run_id) of the script run holding the connection, if any
+        self.script_run = None
+        # Connection profile of the current borrower, for the query metrics
+        self.profile = PRIMARY_PROFILE
+
+    def query_tag(self):
+        """SQL comment naming the script run, visible in pg_stat_activity"""
+        if self.script_run is None:
+            return ''
+        session_id, run_id = self.script_run
+        return f"/* dashboard session={session_id} run={run_id} */ "
+
+
+def _count_plan_cache(name, outcome):
+    with _stats_lock:
+        stats = plan_cache_stats.setdefault(name, {'prepared': 0, 'reused': 0})
+        stats[outcome] += 1
+
+
+def query_name(query):
+    """Metrics label of a query: its registered name, 'adhoc' for plain SQL"""
+    return query.name if isinstance(query, RegisteredQuery) else 'adhoc'
+
+
+@contextmanager
+def observed_query(cursor, query):
+    """Record the latency, rows and failures of the statement run inside the block"""
+    labels = (query_name(query), cursor.connection.profile)
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        query_errors.inc(*labels)
+        raise
+    query_seconds.observe(time.perf_counter() - started, *labels)
+    # Results are buffered client-side, so rowcount is known before fetching; COPY reports it too
+    query_rows.observe(max(cursor.rowcount, 0), *labels)
+
+
+def execute_query(cursor, query, params=None):
+    """Run a registered query as a prepared statement; plain SQL runs as before"""
+    with observed_query(cursor, query):
+        _execute_query(cursor, query, params)
+
+
+def _execute_query(cursor, query, params=None):
+    connection = cursor.connection
+    _check_superseded(connection.script_run)
+    tag = connection.query_tag()
+    if not isinstance(query, RegisteredQuery):
+        cursor.execute(tag + query, params)
+        return
+    if query.statement_name in connection.prepared_statements:
+        _count_plan_cache(query.name, 'reused')
+    else:
+        cursor.execute(f"PREPARE {query.statement_name} AS {query.statement}")
+        connection.prepared_statements.add(query.statement_name)
+        _count_plan_cache(query.name, 'prepared')
+    values = [(params or {})[name] for name in query.param_names]
+    if values:
+        cursor.execute(f"{tag}EXECUTE {query.statement_name} ({', '.join(['%s'] * len(values))})", values)
+    else:
+        cursor.execute(f"{tag}EXECUTE {query.statement_name}")
+
+
+def plan_cache_summary():
+    with _stats_lock:
+        return {name: dict(stats) for name, stats in sorted(plan_cache_stats.items())}
+
+
+def begin_script_run():
+    """Mark the calling Streamlit run as its session's newest and cancel the queries
+    still running for the runs it supersedes. Call once at the top of the app script."""
+    ctx = get_script_run_ctx(suppress_warning=True)
+    if ctx is None:
+        return None
+    run_id = next(_run_ids)
+    # Helper threads attached with add_script_run_ctx share this context and its run id
+    ctx.report_run_id = run_id
+    with _runs_lock:
+        _forget_closed_sessions()
+        _latest_runs[ctx.session_id] = run_id
+        stale = [connection for connection, owner in _inflight.get(ctx.session_id, {}).items() if owner != run_id]
+        # Cancelled under the lock: _untrack takes it too, so none of these connections can be
+        # returned and lent to another borrower before its cancel has been sent
+        for connection in stale:
+            try:
+                # Sends a cancel request on a separate socket; the old run's execute raises QueryCanceledError
+                connection.cancel()
+            except psycopg2.Error as error:
+                print(f"Could not cancel query: {error}")
+    if stale:
+        print(f"session {ctx.session_id}: cancelled {len(stale)} queries of superseded runs")
+    return run_id
+
+
+def _forget_closed_sessions():
+    # Called with _runs_lock held; a session that has gone away keeps no entry
+    if not Runtime.exists():
+        return
+    runtime = Runtime.instance()
+    for session_id in [session_id for session_id in _latest_runs
+                       if session_id not in _inflight and not runtime.is_active_session(session_id)]:
+        del _latest_runs[session_id]
+
+
+def current_script_run():
+    ctx = get_script_run_ctx(suppress_warning=True)
+    run_id = getattr(ctx, 'report_run_id', None)
+    return None if run_id is None else (ctx.session_id, run_id)
+
+
+def _check_superseded(script_run):
+    if script_run is None:
+        return
+    session_id, run_id = script_run
+    with _runs_lock:
+        latest = _latest_runs.get(session_id)
+    if latest is not None and latest != run_id:
+        raise QueryCanceledError(f"script run {run_id} was superseded by run {latest}")
+
+
+def _track(connection, script_run):
+    connection.script_run = script_run
+    if script_run is None:
+        return
+    with _runs_lock:
+        _inflight.setdefault(script_run[0], {})[connection] = script_run[1]
+
+
+def _untrack(connection):
+    script_run, connection.script_run = connection.script_run, None
+    if script_run is None:
+        return
+    with _runs_lock:
+        connections = _inflight.get(script_run[0], {})
+        connections.pop(connection, None)
+        if not connections:
+            _inflight.pop(script_run[0], None)
+
+
+def get_db_params(target=PRIMARY_TARGET):
+    # Read lazily so helpers in this module can be imported without secrets
+    secrets = {**st.secrets[PRIMARY_TARGET], **st.secrets.get(target, {})}
+    return {
+        'dbname': secrets["DB_NAME"],
+        'user': secrets["DB_USER"],
+        'password': secrets["DB_PASSWORD"],
+        'host': secrets["DB_HOST"],
+        'port': secrets["DB_PORT"]
+    }
+
+
+def session_options(profile):
+    settings = CONNECTION_PROFILES[profile]
+    return f"-c statement_timeout={settings['statement_timeout']} -c work_mem={settings['work_mem']}"
+
+
+def get_pool(profile=PRIMARY_PROFILE, target=PRIMARY_TARGET):
+    with _pool_lock:
+        pool = _pools.get((profile, target))
+        if pool is None:
+            pool = ThreadedConnectionPool(POOL_MIN_CONNECTIONS, CONNECTION_PROFILES[profile]['pool_size'],
+                                          connection_factory=ReportConnection,
+                                          connect_timeout=CONNECT_TIMEOUT_SECONDS,
+                                          options=session_options(profile), **get_db_params(target))
+            # One slot per connection; getconn is only called while holding a slot
+            pool.slots = threading.BoundedSemaphore(CONNECTION_PROFILES[profile]['pool_size'])
+            _pools[(profile, target)] = pool
+        return pool
+
+
+def set_checkout_timeout(seconds):
+    global POOL_CHECKOUT_TIMEOUT_SECONDS
+    POOL_CHECKOUT_TIMEOUT_SECONDS = seconds
+
+
+def total_pool_size():
+    return sum(settings['pool_size'] for settings in CONNECTION_PROFILES.values())
+
+
+def checkout(pool):
+    """Take a connection from the pool, waiting for one to be returned when all are out"""
+    if not pool.slots.acquire(timeout=POOL_CHECKOUT_TIMEOUT_SECONDS):
+        raise PoolError(f"no pooled connection free after {POOL_CHECKOUT_TIMEOUT_SECONDS}s")
+    try:
+        return pool.getconn()
+    except Exception:
+        pool.slots.release()
+        raise
+
+
+def checkin(pool, connection):
+    try:
+        pool.putconn(connection, close=bool(connection.closed))
+    finally:
+        pool.slots.release()
+
+
+def replica_lag(profile, target):
+    """Seconds the replica is behind the primary, infinite if it cannot be reached"""
+    with _lag_lock:
+        checked = _lag_checks.get(target)
+    if checked is not None and checked[1] > time.monotonic() - LAG_CHECK_SECONDS:
+        return checked[0]
+    try:
+        pool = get_pool(profile, target)
+        connection = checkout(pool)
+        try:
+            connection.autocommit = True
+            with connection.cursor() as cursor:
+                cursor.execute(REPLICA_LAG_QUERY)
+                lag = float(cursor.fetchone()[0])
+        finally:
+            checkin(pool, connection)
+    except (psycopg2.Error, PoolError) as error:
+        print(f"{target}: lag check failed: {error}")
+        lag = float('inf')
+    with _lag_lock:
+        _lag_checks[target] = (lag, time.monotonic())
+    return lag
+
+
+def route(profile):
+    """Secrets section the profile's next query should run against"""
+    settings = CONNECTION_PROFILES[profile]
+    for target in settings['replicas']:
+        if target not in st.secrets:
+            continue
+        lag = replica_lag(profile, target)
+        if lag <= settings['max_lag_seconds']:
+            return target
+        print(f"{target}: {lag:.0f}s behind, {profile} queries fall back to the primary")
+    return PRIMARY_TARGET
+
+
+@contextmanager
+def pooled_connection(profile=PRIMARY_PROFILE):
+    """Borrow a connection for the profile from its pool and return it afterwards"""
+    script_run = current_script_run()
+    # A run that has been superseded gets no new connections
+    _check_superseded(script_run)
+    pool = get_pool(profile, route(profile))
+    connection = checkout(pool)
+    # Report queries are read-only; autocommit avoids idle-in-transaction sessions
+    connection.autocommit = True
+    connection.profile = profile
+    _track(connection, script_run)
+    try:
+        yield connection
+    finally:
+        _untrack(connection)
+        checkin(pool, connection)
+
+
+def fetch_frame(query, params=None, profile=PRIMARY_PROFILE):
+    try:
+        with pooled_connection(profile) as connection, connection.cursor() as cursor:
+            execute_query(cursor, query, params)
+            records = cursor.fetchall()
+            column_names = [desc[0] for desc in cursor.description]
+            return pd.DataFrame(records, columns=column_names)
+    except Exception as error:
+        st.error(f"Error fetching records: {error}")
+        return None
+
+
+def fetch_value(query, params=None, profile=PRIMARY_PROFILE):
+    """Return the first column of the first row, e.g. for MAX/AVG queries"""
+    try:
+        with pooled_connection(profile) as connection, connection.cursor() as cursor:
+            execute_query(cursor, query, params)
+            row = cursor.fetchone()
+            return row[0] if row else None
+    except Exception as error:
+        st.error(f"Error fetching records: {error}")
+        return None
+
+
+# Arrow type of each Postgres result type OID; anything else is read as text, so
+# phone numbers and zip codes keep their leading zeros. timestamptz comes out of
+# COPY with its offset and is stored in UTC whatever the session TimeZone is.
+PG_ARROW_TYPES = {
+    16: pa.bool_(),
+    20: pa.int64(), 21: pa.int16(), 23: pa.int32(), 26: pa.int64(),
+    700: pa.float64(), 701: pa.float64(), 1700: pa.float64(),
+    1082: pa.date32(),
+    1114: pa.timestamp('us'),
+    1184: pa.timestamp('us', tz='UTC'),
+}
+
+# Query name (or SQL text) -> column name -> Arrow type; result types do not depend on parameters
+_result_types = {}
+_result_types_lock = threading.Lock()
+
+
+def bind_query(cursor, query, params=None):
+    """SQL text of a query with its parameters bound client-side"""
+    if isinstance(query, RegisteredQuery):
+        query = cursor.mogrify(query.sql, params or {}).decode()
+    elif params is not None:
+        query = cursor.mogrify(query, params).decode()
+    return query.strip().rstrip(';')
+
+
+def copy_query(cursor, query, params=None):
+    """Wrap a SELECT in COPY ... TO STDOUT so rows never become Python tuples"""
+    # COPY cannot wrap EXECUTE, so registered queries are bound client-side and
+    # run without their prepared statement
+    query = bind_query(cursor, query, params)
+    _check_superseded(cursor.connection.script_run)
+    return f"{cursor.connection.query_tag()}COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER true)"
+
+
+def result_types(cursor, query, params=None):
+    """Arrow type of each result column, from the server's types of a zero-row run"""
+    key = query.statement_name if isinstance(query, RegisteredQuery) else query
+    with _result_types_lock:
+        types = _result_types.get(key)
+    if types is None:
+        execute_query(cursor, f"SELECT * FROM ({bind_query(cursor, query, params)}) AS described LIMIT 0")
+        types = {column.name: PG_ARROW_TYPES.get(column.type_code, pa.string()) for column in cursor.description}
+        with _result_types_lock:
+            _result_types[key] = types
+    return types
+
+
+def read_arrow_frame(payload, column_types=None):
+    """Decode a COPY csv payload into a pandas frame backed by Arrow columns;
+    without column_types, Arrow infers them from the text"""
+    # NULLs come out of COPY as unquoted empty fields, empty strings as "", booleans as t/f
+    convert_options = pa_csv.ConvertOptions(column_types=column_types or {}, strings_can_be_null=True,
+                                            quoted_strings_can_be_null=False,
+                                            true_values=['t'], false_values=['f'])
+    table = pa_csv.read_csv(payload, convert_options=convert_options)
+    return table.to_pandas(types_mapper=pd.ArrowDtype)
+
+
+def fetch_arrow_frame(query, params=None, profile=PRIMARY_PROFILE):
+    try:
+        with pooled_connection(profile) as connection, connection.cursor() as cursor:
+            column_types = result_types(cursor, query, params)
+            payload = io.BytesIO()
+            with observed_query(cursor, query):
+                cursor.copy_expert(copy_query(cursor, query, params), payload)
+            payload.seek(0)
+            return read_arrow_frame(payload, column_types)
+    except Exception as error:
+        st.error(f"Error fetching records: {error}")
+        return None
@@ -0,0 +1,72 @@
+import gzip
+import io
+import tempfile
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import streamlit as st
+
+# Rows serialized per chunk; the export never holds more than one chunk as text
+EXPORT_CHUNK_ROWS = 50_000
+# Exports larger than this spill from memory to a temporary file
+SPOOL_MAX_BYTES = 8 * 1024 * 1024
+
+
+def _resolve(frame):
+    return frame() if callable(frame) else frame
+
+
+def write_csv_gzip(df, target, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Write df as gzip-compressed CSV to a binary file, one chunk of rows at a time"""
+    with gzip.GzipFile(fileobj=target, mode='wb') as compressed, \
+            io.TextIOWrapper(compressed, encoding='utf-8', newline='') as text:
+        if df.empty:
+            df.to_csv(text, index=False)
+        for start in range(0, len(df), chunk_rows):
+            df.iloc[start:start + chunk_rows].to_csv(text, index=False, header=start == 0)
+
+
+def write_parquet(df, target, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Write df as Parquet to a binary file, one row group per chunk"""
+    # Infer the schema from the whole frame so a chunk of all-null values keeps its column type
+    schema = pa.Schema.from_pandas(df, preserve_index=False)
+    with pq.ParquetWriter(target, schema, compression='zstd') as writer:
+        for start in range(0, len(df), chunk_rows):
+            chunk = df.iloc[start:start + chunk_rows]
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+
+
+EXPORT_FORMATS = {
+    'CSV': (write_csv_gzip, 'csv.gz', 'application/gzip'),
+    'Parquet': (write_parquet, 'parquet', 'application/vnd.apache.parquet'),
+}
+
+
+def export_file(frame, export_format):
+    """Zero-argument callable for st.download_button that builds the file only when clicked"""
+    writer = EXPORT_FORMATS[export_format][0]
+
+    def build():
+        target = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+        writer(_resolve(frame), target)
+        target.seek(0)
+        return target
+    return build
+
+
+def download_buttons(label, file_stem, frame, key=None):
+    """Gzip CSV and Parquet download buttons for a frame, or a callable returning one.
+
+    Nothing is serialized during the page run; the file is written in chunks
+    when a button is clicked, and clicking does not rerun the page.
+    """
+    columns = st.columns(len(EXPORT_FORMATS))
+    for column, (export_format, (_, extension, mime)) in zip(columns, EXPORT_FORMATS.items()):
+        column.download_button(
+            label=f"{label} ({export_format})",
+            data=export_file(frame, export_format),
+            file_name=f"{file_stem}.{extension}",
+            mime=mime,
+            key=f"{key or file_stem}_{extension}",
+            on_click="ignore",
+        )
@@ -0,0 +1,130 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+# Stage labels are mapped on the client from the integer stage instead of
+# shipping the CASE label string from SQL for every row
+STAGE_NAMES = {
+    1: 'Stage 1: Not Interested',
+    2: 'Stage 2: Initial Contact',
+    3: 'Stage 3: Requirement Collection',
+    4: 'Stage 4: Property Touring',
+    5: 'Stage 5: Property Tour and Feedback',
+    6: 'Stage 6: Application and Approval',
+    7: 'Stage 7: Post-Approval and Follow-Up',
+    8: 'Stage 8: Commission Collection',
+    9: 'Stage 9: Dead Stage',
+}
+UNKNOWN_STAGE = 'Unknown Stage'
+STAGE_DTYPE = pd.CategoricalDtype(list(STAGE_NAMES.values()) + [UNKNOWN_STAGE], ordered=True)
+
+# Low-cardinality text columns shared by the report frames; the 'YES'/'NO'
+# call flags stay as their labels, which is what the pages show
+CATEGORY_COLUMNS = (
+    'employee_name', 'assigned_employee_name', 'stage_name', 'latest_stage_name',
+    'current_stage_name', 'type', 'city', 'state', 'originating_city', 'originating_state',
+    'calls', 'call_status',
+)
+# Ids, stages and counters
+INTEGER_COLUMNS = (
+    'id', 'client_id', 'employee_id', 'assigned_employee', 'current_stage', 'count',
+    'total_employee_messages', 'number_of_clients', 'count_of_leads',
+)
+# Budgets and other measures; kept at float64 since they are displayed, and
+# float32 shows a budget of 1234.56 as 1234.560059
+FLOAT_COLUMNS = ('budget', 'beds', 'baths', 'bedrooms', 'bathrooms', 'call_duration')
+
+# Session state key of the bytes saved by normalization, per page, for the current run
+MEMORY_REPORT_KEY = 'dtype_memory_saved'
+
+
+def stage_labels(stages):
+    """Map integer stages to the ordered stage label categorical"""
+    labels = pd.to_numeric(stages, errors='coerce').map(STAGE_NAMES).fillna(UNKNOWN_STAGE)
+    return labels.astype(STAGE_DTYPE)
+
+
+def _compact_integers(series):
+    values = pd.to_numeric(series, errors='coerce')
+    present = values.dropna()
+    if present.empty or (present % 1 != 0).any():
+        return series
+    if len(present) == len(values):
+        return pd.to_numeric(values, downcast='integer')
+    # Keep missing ids (LEFT JOINs) as a nullable integer of the same width
+    width = pd.to_numeric(present.astype('int64'), downcast='integer').dtype
+    return values.astype(width.name.capitalize())
+
+
+def _compact_floats(series):
+    try:
+        return pd.to_numeric(series).astype('float64')
+    except (TypeError, ValueError):
+        return series
+
+
+def _compact_arrow(series, kind):
+    # Arrow-backed columns (db.fetch_arrow_frame) are narrowed with Arrow casts
+    # so they stay Arrow-native on their way to st.dataframe
+    array = series.array.__arrow_array__()
+    if kind == 'integer' and pa.types.is_integer(array.type) and array.null_count < len(array):
+        bounds = pc.min_max(array)
+        for candidate in (pa.int8(), pa.int16(), pa.int32()):
+            info = np.iinfo(candidate.to_pandas_dtype())
+            if info.min <= bounds['min'].as_py() and bounds['max'].as_py() <= info.max:
+                return pd.Series(pc.cast(array, candidate), index=series.index, dtype=pd.ArrowDtype(candidate))
+    elif kind == 'category' and (pa.types.is_string(array.type) or pa.types.is_large_string(array.type)):
+        return series.astype('category')
+    return series
+
+
+def normalize_frame(df, page=None):
+    """Convert fetched report columns to compact dtypes and record the memory saved"""
+    if df is None or df.empty:
+        return df
+
+    before = df.memory_usage(deep=True).sum()
+    df = df.copy()
+
+    for column in df.columns:
+        series = df[column]
+        if isinstance(series.dtype, pd.ArrowDtype):
+            kind = ('integer' if column in INTEGER_COLUMNS
+                    else 'category' if column in CATEGORY_COLUMNS else None)
+            df[column] = _compact_arrow(series, kind)
+        elif column in INTEGER_COLUMNS:
+            df[column] = _compact_integers(series)
+        elif column in FLOAT_COLUMNS:
+            df[column] = _compact_floats(series)
+        elif column in CATEGORY_COLUMNS and not isinstance(series.dtype, pd.CategoricalDtype):
+            df[column] = series.astype('category')
+
+    saved = before - df.memory_usage(deep=True).sum()
+    if page:
+        report = _memory_report()
+        if report is not None:
+            report[page] = report.get(page, 0) + saved
+        print(f"{page}: dtype normalization saved {saved / 1024:.1f} KB")
+    return df
+
+
+def _memory_report():
+    # Per session, so one session's page run never resets another's figure;
+    # None outside a script run (batch reports)
+    if get_script_run_ctx(suppress_warning=True) is None:
+        return None
+    return st.session_state.setdefault(MEMORY_REPORT_KEY, {})
+
+
+def reset_memory_report(page):
+    report = _memory_report()
+    if report is not None:
+        report[page] = 0
+
+
+def memory_saved(page):
+    report = _memory_report()
+    return report.get(page, 0) if report is not None else 0
@@ -0,0 +1,256 @@
+"""Local date-partitioned Parquet copy of the activity facts the reports read.
+
+Finished days of textmessage, call and openphone_log never change, so they are
+copied once into history/<fact>/day=YYYY-MM-DD/part-0.parquet with only the
+columns the reports use. Reports read completed days from here and query
+production only for the part of their range after the sync watermark.
+
+Run the incremental sync nightly:
+
+    python history_store.py --since 2024-01-01
+
+Days written under an older version of a fact's query are dropped and copied
+again by the next sync. --resync copies every day in the range again, e.g.
+openphone_log after phone_index.py --backfill has attributed more calls.
+"""
+import argparse
+import io
+import os
+from datetime import date, datetime, timedelta
+
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from db import copy_query, pooled_connection
+
+HISTORY_ROOT = "history"
+PART_FILE = "part-0.parquet"
+DEFAULT_SYNC_DAYS = 90
+# Stored timestamps have microsecond resolution
+WATERMARK_GAP = timedelta(microseconds=1)
+# Finished days are the same on a replica, so the sync reads through the analytics profile
+PROFILE = 'analytics'
+
+DAY_PARTITIONING = ds.partitioning(pa.schema([('day', pa.string())]), flavor='hive')
+
+# One day of each fact, already joined to the employee who created it
+FACTS = {
+    'textmessage': {
+        'time_column': 'created',
+        'query': """
+            SELECT t.created::timestamp AS created, t.client_id, e.id AS employee_id,
+                   e.fullname AS employee_name, t.message
+            FROM textmessage t
+            JOIN employee e ON t.created_by = e.id
+            WHERE t.created >= %s AND t.created < %s
+        """,
+        'schema': pa.schema([
+            ('created', pa.timestamp('us')),
+            ('client_id', pa.int64()),
+            ('employee_id', pa.int64()),
+            ('employee_name', pa.string()),
+            ('message', pa.string()),
+        ]),
+    },
+    'call': {
+        'time_column': 'created',
+        'query': """
+            SELECT c.created::timestamp AS created, c.client_id, e.id AS employee_id,
+                   e.fullname AS employee_name, c.note AS message, c.duration
+            FROM call c
+            JOIN employee e ON c.employee_id = e.id
+            WHERE c.created >= %s AND c.created < %s
+            AND c.is_incoming = false
+        """,
+        'schema': pa.schema([
+            ('created', pa.timestamp('us')),
+            ('client_id', pa.int64()),
+            ('employee_id', pa.int64()),
+            ('employee_name', pa.string()),
+            ('message', pa.string()),
+            ('duration', pa.float64()),
+        ]),
+    },
+    'openphone_log': {
+        # 2: calls attributed by the normalized phone index instead of from_ = employee.phone
+        # 3: numbers written with a country code no longer get +1 added
+        'version': 3,
+        'time_column': 'created_at_parsed',
+        'query': """
+            SELECT ol.created_at_parsed::timestamp AS created_at_parsed,
+                   ol.completed_at_parsed::timestamp AS completed_at_parsed,
+                   ol.client_id, ol.employee_id, e.fullname AS employee_name
+            FROM openphone_log ol
+            -- employee_id is maintained by phone_index.py from normalized numbers
+            JOIN employee e ON ol.employee_id = e.id
+            WHERE ol.created_at_parsed >= %s AND ol.created_at_parsed < %s
+            AND ol.direction = 'outgoing'
+        """,
+        'schema': pa.schema([
+            ('created_at_parsed', pa.timestamp('us')),
+            ('completed_at_parsed', pa.timestamp('us')),
+            ('client_id', pa.int64()),
+            ('employee_id', pa.int64()),
+            ('employee_name', pa.string()),
+        ]),
+    },
+}
+
+
+def partition_path(fact, day, root=HISTORY_ROOT):
+    return os.path.join(root, fact, f"day={day.isoformat()}", PART_FILE)
+
+
+def synced_days(fact, root=HISTORY_ROOT):
+    fact_dir = os.path.join(root, fact)
+    if not os.path.isdir(fact_dir):
+        return []
+    days = []
+    for name in os.listdir(fact_dir):
+        if name.startswith('day=') and os.path.exists(os.path.join(fact_dir, name, PART_FILE)):
+            days.append(date.fromisoformat(name[len('day='):]))
+    return sorted(days)
+
+
+def coverage(fact, root=HISTORY_ROOT):
+    """First synced day and the day after the last one without gaps, or None"""
+    days = synced_days(fact, root)
+    if not days:
+        return None
+    end = days[0]
+    for day in days:
+        if day != end:
+            break
+        end = day + timedelta(days=1)
+    return days[0], end
+
+
+def split_at_watermark(facts, start, end, root=HISTORY_ROOT):
+    """Split [start, end] into a part served from history and a [watermark, end]
+    part for the live database; either part may be None.
+
+    Both parts are inclusive like the live queries' BETWEEN, so the history part
+    ends one microsecond (the timestamp resolution) before the watermark.
+    """
+    bounds = [coverage(fact, root) for fact in facts]
+    if any(bound is None for bound in bounds):
+        return None, (start, end)
+    first_day = max(bound[0] for bound in bounds)
+    watermark = datetime.combine(min(bound[1] for bound in bounds), datetime.min.time())
+    if start < datetime.combine(first_day, datetime.min.time()) or start >= watermark:
+        return None, (start, end)
+    if end < watermark:
+        return (start, end), None
+    return (start, watermark - WATERMARK_GAP), (watermark, end)
+
+
+def read_fact(fact, start, end, columns, employee_names=None, time_column=None, lookback_days=0,
+              root=HISTORY_ROOT, employee_ids=None):
+    """Rows of a fact with time_column in [start, end], reading only the needed
+    partitions and columns. Both bounds are inclusive, as in the live queries'
+    BETWEEN, so a row at either bound counts the same on both sides.
+
+    Rows are partitioned by their creation day; filtering on a later timestamp
+    such as completed_at_parsed needs lookback_days to reach calls started earlier.
+    """
+    time_column = time_column or FACTS[fact]['time_column']
+    first_day = start.date() - timedelta(days=lookback_days)
+    dataset = ds.dataset(os.path.join(root, fact), format='parquet', partitioning=DAY_PARTITIONING,
+                         schema=FACTS[fact]['schema'].append(pa.field('day', pa.string())))
+    condition = (
+        (ds.field('day') >= first_day.isoformat())
+        & (ds.field('day') <= end.date().isoformat())
+        & (ds.field(time_column) >= pa.scalar(start, pa.timestamp('us')))
+        & (ds.field(time_column) <= pa.scalar(end, pa.timestamp('us')))
+    )
+    if employee_names is not None:
+        condition &= ds.field('employee_name').isin(list(employee_names))
+    if employee_ids is not None:
+        condition &= ds.field('employee_id').isin(list(employee_ids))
+    return dataset.to_table(columns=columns, filter=condition).to_pandas()
+
+
+def fetch_fact_day(fact, day):
+    spec = FACTS[fact]
+    start = datetime.combine(day, datetime.min.time())
+    with pooled_connection(PROFILE) as connection, connection.cursor() as cursor:
+        payload = io.BytesIO()
+        cursor.copy_expert(copy_query(cursor, spec['query'], (start, start + timedelta(days=1))), payload)
+        payload.seek(0)
+    # Same NULL handling as db.read_arrow_frame: only unquoted empty fields are NULL,
+    # so an empty message body stays '' as it does in live reads
+    convert_options = pa_csv.ConvertOptions(column_types=spec['schema'], strings_can_be_null=True,
+                                            quoted_strings_can_be_null=False)
+    table = pa_csv.read_csv(payload, convert_options=convert_options)
+    return table.select(spec['schema'].names).cast(spec['schema'])
+
+
+def fact_version(fact):
+    return FACTS[fact].get('version', 1)
+
+
+def write_partition(fact, day, table, root=HISTORY_ROOT):
+    path = partition_path(fact, day, root)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    table = table.replace_schema_metadata({'fact_version': str(fact_version(fact))})
+    # Write then rename so a crashed sync never leaves a half-written day behind
+    temp_path = f"{path}.tmp"
+    pq.write_table(table, temp_path, compression='zstd')
+    os.replace(temp_path, path)
+
+
+def partition_version(fact, day, root=HISTORY_ROOT):
+    # Days written before versions were recorded are version 1
+    metadata = pq.read_schema(partition_path(fact, day, root)).metadata or {}
+    return int(metadata.get(b'fact_version', b'1'))
+
+
+def drop_partitions(fact, days, root=HISTORY_ROOT):
+    for day in days:
+        os.remove(partition_path(fact, day, root))
+        print(f"{fact} {day}: dropped")
+
+
+def drop_outdated_partitions(fact, root=HISTORY_ROOT):
+    """Drop days written by an older version of the fact's query, so they are copied again"""
+    outdated = [day for day in synced_days(fact, root) if partition_version(fact, day, root) < fact_version(fact)]
+    drop_partitions(fact, outdated, root)
+    return outdated
+
+
+def sync_history(since=None, until=None, facts=None, root=HISTORY_ROOT, resync=False):
+    """Copy every finished day missing or outdated locally, up to and including `until`
+    (yesterday); with resync, every day from `since` is copied again"""
+    # Today's rows can still change, so it is never copied
+    until = min(until or date.today(), date.today() - timedelta(days=1))
+    since = since or until - timedelta(days=DEFAULT_SYNC_DAYS - 1)
+    for fact in facts or FACTS:
+        drop_outdated_partitions(fact, root)
+        if resync:
+            drop_partitions(fact, [day for day in synced_days(fact, root) if since <= day <= until], root)
+        have = set(synced_days(fact, root))
+        day = since
+        while day <= until:
+            if day not in have:
+                table = fetch_fact_day(fact, day)
+                write_partition(fact, day, table, root)
+                print(f"{fact} {day}: {table.num_rows} rows")
+            day += timedelta(days=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--since', type=date.fromisoformat, default=None,
+                        help=f"first day to keep, defaults to {DEFAULT_SYNC_DAYS} days ago")
+    parser.add_argument('--until', type=date.fromisoformat, default=None, help="last day, defaults to yesterday")
+    parser.add_argument('--facts', nargs='+', choices=sorted(FACTS), default=None)
+    parser.add_argument('--root', default=HISTORY_ROOT)
+    parser.add_argument('--resync', action='store_true', help="copy the days in the range again")
+    args = parser.parse_args()
+    sync_history(args.since, args.until, args.facts, args.root, args.resync)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+import json
+import os
+import threading
+
+import streamlit as st
+
+OVERRIDES_FILE = "sling_identity_overrides.json"
+# Local state of the dashboard; set [storage] data_dir in secrets.toml to keep it elsewhere
+DEFAULT_DATA_DIR = "data"
+
+# Sessions saving overrides at the same time must not drop each other's entries
+_overrides_lock = threading.Lock()
+
+
+def overrides_path():
+    try:
+        data_dir = st.secrets.get("storage", {}).get("data_dir", DEFAULT_DATA_DIR)
+    except FileNotFoundError:
+        data_dir = DEFAULT_DATA_DIR
+    return os.path.join(data_dir, OVERRIDES_FILE)
+
+
+def normalize_email(email):
+    return email.strip().lower() if isinstance(email, str) and email.strip() else None
+
+
+def normalize_name(name):
+    return " ".join(name.split()).casefold() if isinstance(name, str) and name.strip() else None
+
+
+def load_overrides(path=None):
+    """Load manual Sling user id / email -> employee id overrides"""
+    path = path or overrides_path()
+    if not os.path.exists(path):
+        # Overrides saved before the data dir existed sit in the working directory
+        if not os.path.exists(OVERRIDES_FILE):
+            return {'sling_user_ids': {}, 'emails': {}}
+        path = OVERRIDES_FILE
+    with open(path) as f:
+        overrides = json.load(f)
+    return {
+        'sling_user_ids': {str(k): int(v) for k, v in overrides.get('sling_user_ids', {}).items()},
+        'emails': {normalize_email(k): int(v) for k, v in overrides.get('emails', {}).items()},
+    }
+
+
+def save_override(sling_user_id, employee_id, path=None):
+    path = path or overrides_path()
+    with _overrides_lock:
+        overrides = load_overrides(path)
+        overrides['sling_user_ids'][str(sling_user_id)] = int(employee_id)
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        # Write then rename so a reader never sees a half-written file
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(overrides, f, indent=2, sort_keys=True)
+        os.replace(temp_path, path)
+
+
+def build_identity_index(sling_users, employees, overrides=None):
+    """Resolve Sling user ids to employee ids.
+
+    sling_users is the id -> {'email', 'name'} map from the Sling users endpoint
+    and employees a frame with id, fullname and email columns. Manual overrides
+    win, then email, then an exact full name that belongs to a single employee.
+    """
+    overrides = overrides or {'sling_user_ids': {}, 'emails': {}}
+
+    by_email = {}
+    for employee_id, email in zip(employees['id'], employees['email']):
+        email = normalize_email(email)
+        if email:
+            by_email.setdefault(email, int(employee_id))
+
+    names = employees['fullname'].map(normalize_name)
+    unique_names = names[~names.duplicated(keep=False)].dropna()
+    by_name = dict(zip(unique_names, employees.loc[unique_names.index, 'id'].astype(int)))
+
+    index = {}
+    for sling_user_id, user in sling_users.items():
+        email = normalize_email(user.get('email'))
+        employee_id = (
+            overrides['sling_user_ids'].get(str(sling_user_id))
+            or overrides['emails'].get(email)
+            or by_email.get(email)
+            or by_name.get(normalize_name(user.get('name')))
+        )
+        if employee_id is not None:
+            index[str(sling_user_id)] = employee_id
+    return index
@@ -1,8 +1,11 @@
 import streamlit as st
-import psycopg2
-import pandas as pd
 from datetime import datetime
 
+from change_feed import watch_tables
+from db import fetch_frame, register_query
+from frame_dtypes import normalize_frame
+from roster import group_ids
+
 # def messageParser(client_id: int):
     # db_params = {
     #     'dbname': st.secrets["database"]["DB_NAME"],
@@ -38,65 +41,44 @@ from datetime import datetime
 #         print(e)
 #         return None
 
-def show_low_sales_progression():
-    st.title("Low Sales Progression Report")
-    
-    db_params = {
-        'dbname': st.secrets["database"]["DB_NAME"],
-        'user': st.secrets["database"]["DB_USER"],
-        'password': st.secrets["database"]["DB_PASSWORD"],
-        'host': st.secrets["database"]["DB_HOST"],
-        'port': st.secrets["database"]["DB_PORT"]
-    }
-    # Employee IDs to filter
-    employee_ids = [378, 375, 356, 373, 333, 173]
+PAGE = "Low Sales Progression"
+# Short recent ranges; read from the primary
+PROFILE = 'primary'
+# Tables whose changes make this page's cached results stale
+CHANGE_TABLES = watch_tables(PAGE, ('client', 'client_stage_progression', 'textmessage'), rerun=False)
 
-    fetch_low_progression_clients_query = f"""
-    SELECT 
-        csp.client_id,
-        c.fullname AS client_name,
-        e.fullname AS employee_name,
-        MAX(csp.current_stage) AS current_stage,
-        MAX(csp.created_on) AS time_entered_stage,
-        CONCAT('https://services.followupboss.com/2/people/view/', csp.client_id) AS followup_boss_link
-    FROM 
-        public.client_stage_progression csp
-    JOIN 
-        public.client c ON csp.client_id = c.id
-    JOIN 
-        public.employee e ON c.assigned_employee = e.id
-    WHERE 
-        csp.current_stage <= 3
-        AND csp.created_on >= NOW() - INTERVAL '24 hours'
-        AND e.id IN ({','.join(map(str, employee_ids))})
-    GROUP BY 
-        csp.client_id, c.fullname, e.fullname
-    HAVING 
-        MAX(csp.current_stage) <= 3
-    ORDER BY 
-        e.fullname, csp.client_id;
-    """
+fetch_low_progression_clients_query = register_query('low_progression_clients', """
+SELECT 
+    csp.client_id,
+    c.fullname AS client_name,
+    e.fullname AS employee_name,
+    MAX(csp.current_stage) AS current_stage,
+    MAX(csp.created_on) AS time_entered_stage,
+    CONCAT('https://services.followupboss.com/2/people/view/', csp.client_id) AS followup_boss_link
+FROM 
+    public.client_stage_progression csp
+JOIN 
+    public.client c ON csp.client_id = c.id
+JOIN 
+    public.employee e ON c.assigned_employee = e.id
+WHERE 
+    csp.current_stage <= 3
+    AND csp.created_on >= NOW() - INTERVAL '24 hours'
+    AND c.assigned_employee = ANY(%(employee_ids)s)
+GROUP BY 
+    csp.client_id, c.fullname, e.fullname
+HAVING 
+    MAX(csp.current_stage) <= 3
+ORDER BY 
+    e.fullname, csp.client_id;
+""")
 
-    def fetch_data(query):
-        connection = None
-        cursor = None
-        try:
-            connection = psycopg2.connect(**db_params)
-            cursor = connection.cursor()
-            cursor.execute(query)
-            records = cursor.fetchall()
-            column_names = [desc[0] for desc in cursor.description]
-            df = pd.DataFrame(records, columns=column_names)
-            
-            return df
-            
-        except Exception as error:
-            st.error(f"Error fetching records: {error}")
-        finally:
-            if cursor:
-                cursor.close()
-            if connection:
-                connection.close()
+def load_low_sales_progression():
+    low_progression_clients_data = fetch_frame(fetch_low_progression_clients_query, {'employee_ids': group_ids('low_progression_reps')}, profile=PROFILE)
+    return {'low_progression_clients': normalize_frame(low_progression_clients_data, PAGE)}
+
+def show_low_sales_progression():
+    st.title("Low Sales Progression Report")
 
     def display_low_progression_clients(df):
         st.subheader("Clients with Low Progression in the Last 24 Hours")
@@ -123,7 +105,7 @@ def show_low_sales_progression():
     today = datetime.today().strftime('%Y-%m-%d')
     st.markdown(f"**DATE: {today}** (This report contains data from the last 24 hours)")
 
-    low_progression_clients_data = fetch_data(fetch_low_progression_clients_query)
+    low_progression_clients_data = load_low_sales_progression()['low_progression_clients']
 
     if low_progression_clients_data is not None:
         display_low_progression_clients(low_progression_clients_data)
@@ -0,0 +1,216 @@
+"""Process metrics in OpenMetrics text format.
+
+The data layer and the page dispatch record histograms and counters here:
+query latency and rows per registered query, range-cache days hit and missed
+per page, Sling API latency and page render time. start_metrics_exporter()
+publishes them as configured in secrets.toml, on a scrape endpoint, in a file
+rewritten periodically (e.g. for node_exporter's textfile collector), or both:
+
+    [metrics]
+    port = 9464                                  # http://127.0.0.1:9464/metrics
+    path = "/var/lib/node_exporter/dashboard-{pid}.prom"
+
+The endpoint listens on localhost only; set host = "0.0.0.0" (or an interface
+address) to let a scraper on another machine reach it.
+
+Each Streamlit process exports its own series, so give every process its own
+port or a path with {pid}. An alert on the 11 AM report p95 then reads:
+
+    histogram_quantile(0.95, sum by (le) (rate(
+        dashboard_page_render_seconds_bucket{page="11 AM Reporting"}[15m]))) > 5
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+# Query names and render times are internal; wider binding is opt-in through [metrics] host
+DEFAULT_HOST = "127.0.0.1"
+WRITE_SECONDS = 15
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+ROW_BUCKETS = (0, 1, 10, 100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+_families = {}
+_metrics_lock = threading.Lock()
+_exporter_started = False
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)] + list(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    def __init__(self, name, help_text, label_names, buckets, unit=''):
+        self.name, self.help_text, self.unit = name, help_text, unit
+        self.label_names, self.buckets = tuple(label_names), tuple(buckets)
+        # Label values -> [count per bucket (non-cumulative, +Inf last), sum]
+        self._series = {}
+
+    def observe(self, value, *label_values):
+        with _metrics_lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    def render(self):
+        lines = []
+        for label_values, (counts, total) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else _number(float(bound))
+                bucket_labels = _labels(self.label_names, label_values, [f'le="{le}"'])
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, label_values)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, label_values)} {_number(total)}")
+        return 'histogram', lines
+
+
+class Counter:
+    def __init__(self, name, help_text, label_names):
+        self.name, self.help_text, self.unit = name, help_text, ''
+        self.label_names = tuple(label_names)
+        self._series = {}
+
+    def inc(self, *label_values, amount=1):
+        with _metrics_lock:
+            self._series[label_values] = self._series.get(label_values, 0) + amount
+
+    def render(self):
+        return 'counter', [f"{self.name}_total{_labels(self.label_names, label_values)} {_number(value)}"
+                           for label_values, value in sorted(self._series.items())]
+
+
+def _register(metric):
+    # Streamlit re-imports edited modules; keep the series recorded so far
+    with _metrics_lock:
+        return _families.setdefault(metric.name, metric)
+
+
+def histogram(name, help_text, label_names=(), buckets=LATENCY_BUCKETS, unit=''):
+    return _register(Histogram(name, help_text, label_names, buckets, unit))
+
+
+def counter(name, help_text, label_names=()):
+    return _register(Counter(name, help_text, label_names))
+
+
+query_seconds = histogram('dashboard_query_seconds', "Time to run a query and fetch its rows",
+                          ('query', 'profile'), unit='seconds')
+query_rows = histogram('dashboard_query_rows', "Rows fetched per query", ('query', 'profile'), ROW_BUCKETS)
+query_errors = counter('dashboard_query_errors', "Queries that raised", ('query', 'profile'))
+range_cache_days = counter('dashboard_range_cache_days', "Days served from the range cache or queried",
+                           ('page', 'namespace', 'result'))
+sling_seconds = histogram('dashboard_sling_request_seconds', "Sling API request latency",
+                          ('endpoint', 'status'), unit='seconds')
+page_render_seconds = histogram('dashboard_page_render_seconds', "Time to run a page's show function",
+                                ('page',), unit='seconds')
+
+
+def current_page():
+    """Page the calling script run is rendering, '' outside a page (e.g. batch runs)"""
+    ctx = get_script_run_ctx(suppress_warning=True)
+    return getattr(ctx, 'report_page', '') or ''
+
+
+@contextmanager
+def page_timer(page):
+    """Time a page render and label the metrics recorded during it with the page"""
+    ctx = get_script_run_ctx(suppress_warning=True)
+    if ctx is not None:
+        # Helper threads attached with add_script_run_ctx share the context and see the page too
+        ctx.report_page = page
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        page_render_seconds.observe(time.perf_counter() - started, page)
+
+
+def render_metrics():
+    with _metrics_lock:
+        lines = []
+        for name, metric in sorted(_families.items()):
+            kind, samples = metric.render()
+            lines.append(f"# TYPE {name} {kind}")
+            if metric.unit:
+                lines.append(f"# UNIT {name} {metric.unit}")
+            lines.append(f"# HELP {name} {_escape(metric.help_text)}")
+            lines.extend(samples)
+    lines.append("# EOF")
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = render_metrics().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes every few seconds would flood the app log
+        pass
+
+
+def write_metrics(path):
+    # Write then rename so a collector never reads a half-written file
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w') as metrics_file:
+        metrics_file.write(render_metrics())
+    os.replace(temp_path, path)
+
+
+def _write_forever(path):
+    while True:
+        try:
+            write_metrics(path)
+        except OSError as error:
+            print(f"metrics: could not write {path}: {error}")
+        time.sleep(WRITE_SECONDS)
+
+
+def start_metrics_exporter():
+    """Start the endpoint and file writer named in the [metrics] secrets section, once per process"""
+    global _exporter_started
+    with _metrics_lock:
+        if _exporter_started:
+            return
+        _exporter_started = True
+    try:
+        settings = st.secrets.get("metrics", {})
+    except FileNotFoundError:
+        settings = {}
+    if settings.get("port"):
+        try:
+            server = ThreadingHTTPServer((settings.get("host", DEFAULT_HOST), int(settings["port"])), _MetricsHandler)
+        except OSError as error:
+            print(f"metrics: could not listen on port {settings['port']}: {error}")
+        else:
+            threading.Thread(target=server.serve_forever, name="metrics-endpoint", daemon=True).start()
+    if settings.get("path"):
+        path = settings["path"].format(pid=os.getpid())
+        threading.Thread(target=_write_forever, args=(path,), name="metrics-writer", daemon=True).start()
@@ -0,0 +1,107 @@
+"""On-demand sampling profile of one page run.
+
+Admins open the dashboard with ?admin=<key>, the key set in secrets.toml:
+
+    [admin]
+    key = "..."
+
+and get a sidebar toggle that runs the selected page under pyinstrument. The
+run is followed by the top functions by own time, pyinstrument's interactive
+flame graph, and a session file under profiles/ for offline comparison:
+
+    pyinstrument --load=profiles/<file>.pyisession -r html
+
+Without the key or with the toggle off the page runs directly and pyinstrument
+is never imported, so only deployments that profile need it installed; where
+it is missing the toggle is not shown.
+"""
+import hmac
+import importlib.util
+import os
+import re
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+import streamlit as st
+import streamlit.components.v1 as components
+
+PROFILE_ROOT = "profiles"
+SAMPLE_INTERVAL_SECONDS = 0.001
+TOP_FUNCTIONS = 25
+
+
+def is_admin():
+    try:
+        key = st.secrets.get("admin", {}).get("key")
+    except FileNotFoundError:
+        return False
+    return bool(key) and hmac.compare_digest(st.query_params.get("admin", ""), key)
+
+
+def profiling_available():
+    return importlib.util.find_spec("pyinstrument") is not None
+
+
+def profiling_enabled():
+    return is_admin() and profiling_available() and st.sidebar.toggle("Profile this page", key="profile_page")
+
+
+def top_functions(root, limit=TOP_FUNCTIONS):
+    """Functions by own time, with the time spent inside them counted once per call stack"""
+    totals = {}
+
+    def visit(frame, open_keys):
+        key = (frame.function, frame.file_path_short, frame.line_no)
+        entry = totals.setdefault(key, [0.0, 0.0])
+        entry[0] += frame.total_self_time
+        # Recursive calls are already inside the outermost call's time
+        if key not in open_keys:
+            entry[1] += frame.time
+        for child in frame.children:
+            visit(child, open_keys | {key})
+
+    if root is not None:
+        visit(root, frozenset())
+    table = pd.DataFrame(
+        [(function, f"{path}:{line}", own, total) for (function, path, line), (own, total) in totals.items()
+         if function and not function.startswith('[')],
+        columns=['Function', 'Location', 'Own s', 'Total s'],
+    )
+    return table.sort_values('Own s', ascending=False).head(limit).round(4)
+
+
+def save_session(page, session, root=PROFILE_ROOT):
+    os.makedirs(root, exist_ok=True)
+    slug = re.sub(r'[^a-z0-9]+', '-', page.lower()).strip('-')
+    path = os.path.join(root, f"{datetime.now():%Y%m%d-%H%M%S}-{slug}.pyisession")
+    session.save(path)
+    return path
+
+
+def show_profile(page, profiler, session):
+    path = save_session(page, session)
+    st.divider()
+    st.subheader(f"Profile: {page}")
+    st.caption(f"{session.duration:.2f}s wall, {session.cpu_time:.2f}s CPU, "
+               f"{session.sample_count} samples. Saved to {path}")
+    st.dataframe(top_functions(session.root_frame()), hide_index=True)
+    components.html(profiler.output_html(), height=800, scrolling=True)
+
+
+@contextmanager
+def page_profile(page):
+    """Profile the block when an admin has switched the sidebar toggle on"""
+    if not profiling_enabled():
+        yield
+        return
+    from pyinstrument import Profiler
+    # The page runs on the script thread; async mode would follow coroutines we do not use
+    profiler = Profiler(interval=SAMPLE_INTERVAL_SECONDS, async_mode='disabled')
+    profiler.start()
+    try:
+        yield
+    finally:
+        session = profiler.stop()
+    # Reached only when the page finished; a rerun or error leaves nothing worth showing
+    show_profile(page, profiler, session)
@@ -0,0 +1,247 @@
+"""Attribute OpenPhone calls to employees by id instead of by raw phone text.
+
+openphone_log.from_ and employee.phone are free-form strings, so a call from
+"(312) 555-0101" never matched an employee stored as "+13125550101" and was
+silently left out of the reports. This installs:
+
+- dashboard_e164(text), which normalizes a number to E.164 (US numbers
+  without a country code get +1);
+- dashboard_employee_phone, a normalized phone -> employee id side table kept
+  current by a trigger on employee;
+- an indexed openphone_log.employee_id filled on insert by a trigger, and
+  for earlier rows by the backfill, so reports join calls on an integer.
+
+When an employee's phone is added or changed, unattributed calls from that
+number are attributed; calls already attributed keep their employee.
+
+    python phone_index.py --install
+    python phone_index.py --backfill          # after every --install
+    python history_store.py                   # re-syncs days copied before the backfill
+    python phone_index.py --unattributed      # numbers that still match nobody
+"""
+import argparse
+from datetime import timedelta
+
+import psycopg2
+
+from db import CONNECT_TIMEOUT_SECONDS, get_db_params
+
+DEFAULT_COUNTRY_CODE = '1'
+BACKFILL_DAYS = 30
+UNATTRIBUTED_LIMIT = 25
+
+# Each statement runs on its own; CREATE INDEX CONCURRENTLY cannot run in a transaction
+INSTALL_STATEMENTS = [
+    f"""
+    CREATE OR REPLACE FUNCTION dashboard_e164(phone text) RETURNS text AS $$
+        SELECT CASE
+            WHEN digits = '' THEN NULL
+            -- Numbers written with a country code keep it, whatever their length
+            WHEN left(number, 1) = '+' THEN '+' || digits
+            WHEN left(number, 2) = '00' THEN '+' || substr(digits, 3)
+            WHEN length(digits) = 10 THEN '+{DEFAULT_COUNTRY_CODE}' || digits
+            ELSE '+' || digits
+        END
+        FROM (SELECT number, regexp_replace(number, '[^0-9]', '', 'g') AS digits
+              -- Extensions are not part of the number
+              FROM (SELECT btrim(regexp_replace(phone, '\\s*(x|ext\\.?)\\s*\\d+\\s*$', '', 'i')) AS number) stripped
+        ) parsed
+    $$ LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS dashboard_employee_phone (
+        phone_e164 text PRIMARY KEY,
+        employee_id integer NOT NULL
+    )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS dashboard_employee_phone_employee ON dashboard_employee_phone (employee_id)
+    """,
+    # Before the employee trigger below, which fills it
+    "ALTER TABLE public.openphone_log ADD COLUMN IF NOT EXISTS employee_id integer",
+    # Indexes come before the triggers that use them. The reports filter one
+    # employee's outgoing calls by start or completion time
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS openphone_log_employee_created
+        ON public.openphone_log (employee_id, created_at_parsed) WHERE direction = 'outgoing'
+    """,
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS openphone_log_employee_completed
+        ON public.openphone_log (employee_id, completed_at_parsed) WHERE direction = 'outgoing'
+    """,
+    # Lets a new or changed employee phone find its unattributed calls; without it the
+    # employee trigger's UPDATE would scan the whole log under the employee row lock.
+    # Rebuilt on every install, since it indexes dashboard_e164 as it was when built
+    "DROP INDEX CONCURRENTLY IF EXISTS openphone_log_unattributed_from",
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS openphone_log_unattributed_from
+        ON public.openphone_log (dashboard_e164(from_)) WHERE employee_id IS NULL
+    """,
+    """
+    CREATE OR REPLACE FUNCTION dashboard_sync_employee_phone() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP <> 'INSERT' THEN
+            DELETE FROM dashboard_employee_phone WHERE employee_id = OLD.id;
+        END IF;
+        IF TG_OP <> 'DELETE' AND dashboard_e164(NEW.phone) IS NOT NULL THEN
+            INSERT INTO dashboard_employee_phone (phone_e164, employee_id)
+            VALUES (dashboard_e164(NEW.phone), NEW.id)
+            ON CONFLICT (phone_e164) DO UPDATE SET employee_id = EXCLUDED.employee_id;
+            UPDATE public.openphone_log SET employee_id = NEW.id
+            WHERE employee_id IS NULL AND dashboard_e164(from_) = dashboard_e164(NEW.phone);
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS dashboard_sync_employee_phone ON public.employee",
+    """
+    CREATE TRIGGER dashboard_sync_employee_phone
+        AFTER INSERT OR UPDATE OF phone OR DELETE ON public.employee
+        FOR EACH ROW EXECUTE PROCEDURE dashboard_sync_employee_phone()
+    """,
+    # Numbers normalized by an earlier dashboard_e164 that no longer match their employee
+    """
+    DELETE FROM dashboard_employee_phone ep
+    WHERE NOT EXISTS (SELECT 1 FROM public.employee e
+                      WHERE e.id = ep.employee_id AND dashboard_e164(e.phone) = ep.phone_e164)
+    """,
+    # Current phones; a number shared by two employees goes to the newest of them
+    """
+    INSERT INTO dashboard_employee_phone (phone_e164, employee_id)
+    SELECT DISTINCT ON (dashboard_e164(e.phone)) dashboard_e164(e.phone), e.id
+    FROM public.employee e
+    WHERE dashboard_e164(e.phone) IS NOT NULL
+    ORDER BY dashboard_e164(e.phone), e.id DESC
+    ON CONFLICT (phone_e164) DO UPDATE SET employee_id = EXCLUDED.employee_id
+    """,
+    """
+    CREATE OR REPLACE FUNCTION dashboard_attribute_call() RETURNS trigger AS $$
+    BEGIN
+        SELECT employee_id INTO NEW.employee_id
+        FROM dashboard_employee_phone WHERE phone_e164 = dashboard_e164(NEW.from_);
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS dashboard_attribute_call ON public.openphone_log",
+    """
+    CREATE TRIGGER dashboard_attribute_call
+        BEFORE INSERT OR UPDATE OF from_ ON public.openphone_log
+        FOR EACH ROW EXECUTE PROCEDURE dashboard_attribute_call()
+    """,
+]
+
+UNINSTALL_STATEMENTS = [
+    "DROP TRIGGER IF EXISTS dashboard_attribute_call ON public.openphone_log",
+    "DROP TRIGGER IF EXISTS dashboard_sync_employee_phone ON public.employee",
+    "DROP INDEX CONCURRENTLY IF EXISTS openphone_log_employee_created",
+    "DROP INDEX CONCURRENTLY IF EXISTS openphone_log_employee_completed",
+    "DROP INDEX CONCURRENTLY IF EXISTS openphone_log_unattributed_from",
+    "ALTER TABLE public.openphone_log DROP COLUMN IF EXISTS employee_id",
+    "DROP FUNCTION IF EXISTS dashboard_attribute_call()",
+    "DROP FUNCTION IF EXISTS dashboard_sync_employee_phone()",
+    "DROP TABLE IF EXISTS dashboard_employee_phone",
+    "DROP FUNCTION IF EXISTS dashboard_e164(text)",
+]
+
+BACKFILL_RANGE_SQL = "SELECT MIN(created_at_parsed), MAX(created_at_parsed) FROM public.openphone_log"
+
+# One window per statement keeps each UPDATE's locks and WAL short. Calls whose
+# number no longer maps to their employee (attributed under an earlier
+# dashboard_e164) are released first, then attributed again
+RELEASE_SQL = """
+UPDATE public.openphone_log ol
+SET employee_id = NULL
+WHERE ol.employee_id IS NOT NULL
+  AND ol.created_at_parsed >= %s AND ol.created_at_parsed < %s
+  AND NOT EXISTS (SELECT 1 FROM dashboard_employee_phone ep
+                  WHERE ep.phone_e164 = dashboard_e164(ol.from_) AND ep.employee_id = ol.employee_id)
+"""
+
+BACKFILL_SQL = """
+UPDATE public.openphone_log ol
+SET employee_id = ep.employee_id
+FROM dashboard_employee_phone ep
+WHERE ol.employee_id IS NULL
+  AND ol.created_at_parsed >= %s AND ol.created_at_parsed < %s
+  AND dashboard_e164(ol.from_) = ep.phone_e164
+"""
+
+UNATTRIBUTED_SQL = """
+SELECT ol.from_, dashboard_e164(ol.from_) AS phone_e164, COUNT(*) AS calls, MAX(ol.created_at_parsed) AS last_call
+FROM public.openphone_log ol
+WHERE ol.employee_id IS NULL AND ol.direction = 'outgoing'
+GROUP BY ol.from_
+ORDER BY calls DESC
+LIMIT %s
+"""
+
+
+def run_statements(connection, statements):
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def backfill(connection, days=BACKFILL_DAYS):
+    """Attribute existing calls, one window of created_at_parsed at a time, re-attributing
+    those whose number maps to a different employee (or none) than the one they have"""
+    with connection.cursor() as cursor:
+        cursor.execute(BACKFILL_RANGE_SQL)
+        first, last = cursor.fetchone()
+        if first is None:
+            return 0
+        attributed = 0
+        window_start = first
+        while window_start <= last:
+            window_end = window_start + timedelta(days=days)
+            cursor.execute(RELEASE_SQL, (window_start, window_end))
+            released = cursor.rowcount
+            cursor.execute(BACKFILL_SQL, (window_start, window_end))
+            attributed += cursor.rowcount
+            print(f"{window_start:%Y-%m-%d} - {window_end:%Y-%m-%d}: {cursor.rowcount} calls attributed"
+                  f"{f', {released} released' if released else ''}")
+            window_start = window_end
+    return attributed
+
+
+def print_unattributed(connection, limit=UNATTRIBUTED_LIMIT):
+    with connection.cursor() as cursor:
+        cursor.execute(UNATTRIBUTED_SQL, (limit,))
+        rows = cursor.fetchall()
+    print(f"{'from_':24s} {'E.164':16s} {'calls':>7s}  last call")
+    for from_, phone_e164, calls, last_call in rows:
+        print(f"{str(from_):24s} {str(phone_e164):16s} {calls:7d}  {last_call}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--install', action='store_true', help="create the function, side table, column and triggers")
+    group.add_argument('--uninstall', action='store_true', help="drop everything --install created")
+    group.add_argument('--backfill', action='store_true',
+                       help="attribute calls logged before --install, or again after reinstalling")
+    group.add_argument('--unattributed', action='store_true', help="list outgoing numbers that match no employee")
+    parser.add_argument('--days', type=int, default=BACKFILL_DAYS, help="backfill window in days")
+    args = parser.parse_args()
+
+    connection = psycopg2.connect(connect_timeout=CONNECT_TIMEOUT_SECONDS, **get_db_params())
+    connection.autocommit = True
+    try:
+        if args.install:
+            run_statements(connection, INSTALL_STATEMENTS)
+            print("installed; run --backfill to attribute existing calls")
+        elif args.uninstall:
+            run_statements(connection, UNINSTALL_STATEMENTS)
+            print("removed")
+        elif args.backfill:
+            print(f"{backfill(connection, args.days)} calls attributed")
+        else:
+            print_unattributed(connection)
+    finally:
+        connection.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+import threading
+from datetime import date, datetime, timedelta, timezone
+
+import pandas as pd
+
+from cache_backends import backend_from_secrets
+from metrics import current_page, range_cache_days
+
+# The report queries bucket days with AT TIME ZONE 'CST', a fixed UTC-6 offset
+CST = timezone(timedelta(hours=-6))
+
+# Today is still filling up, so it is only reused briefly
+TODAY_TTL_SECONDS = 300
+# Finished days are reused for a day; budgets and responses can still change later
+PAST_DAY_TTL_SECONDS = 24 * 3600
+
+_backend = None
+_backend_lock = threading.Lock()
+# Namespace -> tables its rows come from, for change-feed expiry
+_namespace_tables = {}
+# Namespaces whose earlier days can change with today's rows; a change expires all their days
+_expire_all_namespaces = set()
+
+
+def cst_today():
+    return datetime.now(CST).date()
+
+
+def _day_range(start_date, end_date):
+    return [start_date + timedelta(days=offset) for offset in range((end_date - start_date).days + 1)]
+
+
+def _missing_runs(days):
+    """Group missing days into contiguous (first, last) runs, one query each"""
+    runs = []
+    for day in days:
+        if runs and runs[-1][1] + timedelta(days=1) == day:
+            runs[-1][1] = day
+        else:
+            runs.append([day, day])
+    return [tuple(run) for run in runs]
+
+
+def get_backend():
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = backend_from_secrets()
+        return _backend
+
+
+def set_backend(backend):
+    global _backend
+    with _backend_lock:
+        _backend = backend
+
+
+def _get(namespace, day):
+    try:
+        return get_backend().get(namespace, day)
+    except Exception as error:
+        # An unreachable shared cache only costs a query
+        print(f"range cache read failed: {error}")
+        return None
+
+
+def _put(namespace, day, frame, ttl_seconds):
+    try:
+        get_backend().put(namespace, day, frame, ttl_seconds)
+    except Exception as error:
+        print(f"range cache write failed: {error}")
+
+
+def clear_range_cache(namespace=None):
+    get_backend().clear(namespace)
+
+
+def expire_tables(tables):
+    """Drop today's entries of every namespace that reads one of the changed tables.
+
+    New rows land on today; earlier days keep their entries until the TTL, except
+    in namespaces cached with expire_all, which lose every day.
+    """
+    tables = set(tables)
+    namespaces = [namespace for namespace, sources in _namespace_tables.items() if tables & sources]
+    try:
+        get_backend().expire([namespace for namespace in namespaces if namespace not in _expire_all_namespaces],
+                             cst_today())
+        get_backend().expire([namespace for namespace in namespaces if namespace in _expire_all_namespaces],
+                             date.min)
+    except Exception as error:
+        print(f"range cache expiry failed: {error}")
+
+
+def _split_by_day(df, day_column, first_day, last_day):
+    days = pd.to_datetime(df[day_column]).dt.date.fillna(last_day)
+    # Keep rows on a run boundary even if the database buckets them a day off
+    days = days.clip(lower=first_day, upper=last_day)
+    return {day: df[days == day] for day in _day_range(first_day, last_day)}
+
+
+def cached_days(namespace, start_date, end_date, fetch_range, day_column, tables=(), expire_all=False):
+    """Rows for [start_date, end_date] assembled from per-day cache entries.
+
+    fetch_range(first_day, last_day) is called once for every contiguous run of
+    days that are not cached and its rows are split into days by day_column.
+    `tables` are the tables the rows come from; a change to one expires today,
+    or every day with expire_all, for queries where a new row can change an
+    earlier day's result (their earlier days also keep today's short TTL).
+    Returns None, caching nothing, if a fetch fails.
+    """
+    _namespace_tables[namespace] = set(tables)
+    if expire_all:
+        _expire_all_namespaces.add(namespace)
+    days = _day_range(start_date, end_date)
+    if not days:
+        # An empty range still needs the query's columns
+        return fetch_range(start_date, end_date)
+    frames = {day: _get(namespace, day) for day in days}
+    missing = [day for day in days if frames[day] is None]
+    page = current_page()
+    range_cache_days.inc(page, namespace, 'hit', amount=len(days) - len(missing))
+    range_cache_days.inc(page, namespace, 'miss', amount=len(missing))
+
+    today = cst_today()
+    for first_day, last_day in _missing_runs(missing):
+        df = fetch_range(first_day, last_day)
+        if df is None:
+            return None
+        for day, rows in _split_by_day(df, day_column, first_day, last_day).items():
+            rows = rows.reset_index(drop=True)
+            # Without the change feed nothing else would expire an expire_all namespace's earlier days
+            past_ttl = TODAY_TTL_SECONDS if expire_all else PAST_DAY_TTL_SECONDS
+            _put(namespace, day, rows, TODAY_TTL_SECONDS if day >= today else past_ttl)
+            frames[day] = rows
+
+    print(f"{namespace}: queried {len(missing)} of {len(days)} days")
+    return pd.concat([frames[day] for day in days], ignore_index=True)
@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+
+from frame_dtypes import STAGE_NAMES, UNKNOWN_STAGE
+
+# Stage labels as shown in the Client Progression tables, e.g. '4:  Property Touring'
+TRANSITION_LABELS = [f"{stage}: {name.split(':')[1]}".split(' - ')[0] for stage, name in STAGE_NAMES.items()]
+TRANSITION_LABELS.append(UNKNOWN_STAGE)
+
+
+def employee_activity_metrics(df, seconds_per_message):
+    """Compute every per-employee activity metric in a single groupby pass"""
+    is_call = df['type'] == 'call'
+    is_text = df['type'] == 'text_created'
+
+    activity = pd.DataFrame({
+        'employee_name': df['employee_name'],
+        'total_calls': is_call,
+        'call_seconds': df['call_duration'].where(is_call, 0),
+        'total_messages': is_text,
+    })
+    metrics = activity.groupby('employee_name', observed=True, sort=False).sum()
+
+    # Clients reached by either a call or a text, counted once per employee
+    handled = df.loc[is_call | is_text, ['employee_name', 'client_id']].dropna().drop_duplicates()
+    clients = handled.groupby('employee_name', observed=True).size()
+    metrics['clients_handled'] = clients.reindex(metrics.index, fill_value=0)
+
+    metrics['work_seconds'] = metrics['call_seconds'] + metrics['total_messages'] * seconds_per_message
+    return metrics
+
+
+def _transition_labels(stages):
+    stages = pd.to_numeric(stages).to_numpy(dtype='float64', na_value=np.nan)
+    known = np.isin(stages, list(STAGE_NAMES))
+    codes = np.where(known, np.nan_to_num(stages).astype('int64') - 1, len(TRANSITION_LABELS) - 1)
+    return pd.Categorical.from_codes(codes, categories=TRANSITION_LABELS)
+
+
+def stage_transitions(df5):
+    """Previous and current stage of every client for every employee in one pass.
+
+    Returns a dict of employee name -> Client / Previous Stage / Current Stage
+    frame, so each report tab only slices its own rows.
+    """
+    summary = (
+        df5.groupby(['assigned_employee_name', 'client_id'], observed=True)
+        .agg(Client=('fullname', 'first'), first_stage=('current_stage', 'min'), last_stage=('current_stage', 'max'))
+        .reset_index()
+    )
+    summary['Previous Stage'] = _transition_labels(summary['first_stage'])
+    summary['Current Stage'] = _transition_labels(summary['last_stage'])
+    summary = summary.sort_values(['assigned_employee_name', 'Client'])
+
+    columns = ['Client', 'Previous Stage', 'Current Stage']
+    return {
+        employee_name: rows[columns].reset_index(drop=True)
+        for employee_name, rows in summary.groupby('assigned_employee_name', observed=True)
+    }
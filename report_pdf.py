@@ -0,0 +1,107 @@
+import io
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from xml.sax.saxutils import escape
+
+import pymupdf
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import landscape, letter
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib.units import inch
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+# Same thresholds the attendance table highlights in the dashboard
+HIGHLIGHT_COLOR = colors.HexColor('#ffcccc')
+HIGHLIGHT_RULES = {
+    'Late Minutes': 0,
+    'Early Out Minutes': 0,
+    'Actual Break Taken': 60,
+}
+
+# Small teams are faster in-process than paying for worker start-up
+MIN_PARALLEL_SECTIONS = 4
+
+STYLES = getSampleStyleSheet()
+TABLE_STYLE = [
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#dde7f0')),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -1), 8),
+    ('GRID', (0, 0), (-1, -1), 0.25, colors.grey),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+]
+
+
+def frame_rows(df, columns=None):
+    """Plain header + rows lists so a section can be pickled to a worker process"""
+    if df is None or df.empty:
+        return None
+    df = df[columns] if columns else df
+    return [list(df.columns)] + df.astype(str).values.tolist()
+
+
+def _table(rows, highlight_rules=None):
+    table = Table(rows, repeatRows=1, hAlign='LEFT')
+    style = list(TABLE_STYLE)
+    for column, threshold in (highlight_rules or {}).items():
+        if column not in rows[0]:
+            continue
+        col = rows[0].index(column)
+        for row_number, row in enumerate(rows[1:], start=1):
+            try:
+                flagged = float(row[col]) > threshold
+            except ValueError:
+                flagged = False
+            if flagged:
+                style.append(('BACKGROUND', (col, row_number), (col, row_number), HIGHLIGHT_COLOR))
+    table.setStyle(TableStyle(style))
+    return table
+
+
+def render_employee_section(section):
+    """Render one employee's metrics, attendance and client progression to PDF bytes"""
+    # Paragraph text is markup; a name with & or < would otherwise break the build
+    story = [Paragraph(f"Report for {escape(section['employee_name'])}", STYLES['Heading1'])]
+    if section.get('subtitle'):
+        story.append(Paragraph(escape(section['subtitle']), STYLES['Normal']))
+
+    story += [Spacer(1, 0.15 * inch), Paragraph("Employee Performance Summary", STYLES['Heading2'])]
+    story.append(_table([['Metric', 'Value']] + [[metric, value] for metric, value in section['metrics'].items()]))
+
+    if section.get('attendance'):
+        story += [Spacer(1, 0.15 * inch), Paragraph("Attendance Details", STYLES['Heading2'])]
+        story.append(_table(section['attendance'], HIGHLIGHT_RULES))
+
+    if section.get('progression'):
+        story += [Spacer(1, 0.15 * inch), Paragraph("Client Progression", STYLES['Heading2'])]
+        story.append(_table(section['progression']))
+
+    buffer = io.BytesIO()
+    document = SimpleDocTemplate(buffer, pagesize=landscape(letter), title=section['employee_name'],
+                                 leftMargin=0.5 * inch, rightMargin=0.5 * inch,
+                                 topMargin=0.5 * inch, bottomMargin=0.5 * inch)
+    document.build(story)
+    return buffer.getvalue()
+
+
+def merge_pdfs(parts):
+    """Concatenate rendered sections into one document, keeping their order"""
+    merged = pymupdf.open()
+    for part in parts:
+        with pymupdf.open(stream=part, filetype='pdf') as section:
+            merged.insert_pdf(section)
+    return merged.tobytes(garbage=3, deflate=True)
+
+
+def build_team_pdf(sections, workers=None):
+    """Render every employee section, in parallel across processes, and merge them"""
+    if not sections:
+        return None
+    workers = workers or min(len(sections), os.cpu_count() or 1)
+    if workers < 2 or len(sections) < MIN_PARALLEL_SECTIONS:
+        parts = [render_employee_section(section) for section in sections]
+    else:
+        # Forking the multithreaded Streamlit server can copy a held lock into the child
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+            parts = list(executor.map(render_employee_section, sections))
+    return merge_pdfs(parts)
@@ -1,68 +1,20 @@
 import streamlit as st
-import psycopg2
-import pandas as pd
 from datetime import datetime, timedelta
 
-def generate_11am_report():
-    st.title("11 AM Report")
-
-    db_params = {
-        'dbname': st.secrets["database"]["DB_NAME"],
-        'user': st.secrets["database"]["DB_USER"],
-        'password': st.secrets["database"]["DB_PASSWORD"],
-        'host': st.secrets["database"]["DB_HOST"],
-        'port': st.secrets["database"]["DB_PORT"]
-    }
-
-    def fetch_data(query):
-        connection = None
-        cursor = None
-        try:
-            connection = psycopg2.connect(**db_params)
-            cursor = connection.cursor()
-            cursor.execute(query)
-            records = cursor.fetchall()
-            column_names = [desc[0] for desc in cursor.description]
-            return pd.DataFrame(records, columns=column_names)
-        except Exception as error:
-            st.error(f"Error fetching records: {error}")
-            return pd.DataFrame()
-        finally:
-            if cursor:
-                cursor.close()
-            if connection:
-                connection.close()
-
-    # Date input to select a start and end date
-    st.subheader("Select Date Range for the Report")
-    start_date = st.date_input("Start Date", datetime.now().date() - timedelta(days=1))
-    end_date = st.date_input("End Date", datetime.now().date())
+from change_feed import watch_tables
+from db import fetch_frame, register_query
+from exports import download_buttons
+from frame_dtypes import normalize_frame
+from roster import group_employees, group_ids
 
-    # Add employee filter query
-    fetch_employees_query = """
-        SELECT DISTINCT e.fullname 
-        FROM public.employee e
-        WHERE e.id IN (356, 409, 411, 412, 413, 414, 417, 419, 421, 422, 423 , 424, 425, 426, 427, 428, 429, 430, 431, 432, 433, 434, 435, 437, 438, 439, 440, 441, 442, 443, 444, 445)
-        AND e.fullname IS NOT NULL
-        ORDER BY e.fullname;
-    """
-    
-    # Fetch employee list for dropdown
-    employees_df = fetch_data(fetch_employees_query)
-    employee_options = ['All Employees'] + employees_df['fullname'].tolist()
-    selected_employee = st.selectbox("Select Employee", employee_options)
+PAGE = "11 AM Reporting"
+# Short recent ranges; read from the primary
+PROFILE = 'primary'
+# Tables whose changes make this page's cached results stale
+CHANGE_TABLES = watch_tables(PAGE, ('client', 'textmessage'), rerun=False)
 
-    # Convert dates to datetime format with start and end of the day
-    start_datetime = datetime.combine(start_date, datetime.min.time())
-    end_datetime = datetime.combine(end_date, datetime.max.time())
-
-    # Modify the client query to include employee filter
-    employee_filter = ""
-    if selected_employee != 'All Employees':
-        employee_filter = f"AND e.fullname = '{selected_employee}'"
-
-    # Query to fetch client data
-    fetch_clients_query = f"""
+# Query to fetch client data
+clients_query = register_query('report_11am_clients', """
     WITH clients_created_today AS (
         SELECT 
             c.id AS client_id,
@@ -88,10 +40,10 @@ def generate_11am_report():
         LEFT JOIN 
             public.requirements r ON c.id = r.client_id
         WHERE 
-            c.created >= '{start_datetime}'::timestamp AT TIME ZONE 'CST'
-            AND c.created <= '{end_datetime}'::timestamp AT TIME ZONE 'CST'
-            AND (c.assigned_employee NOT IN (317, 318, 319,410,415,416, 344,160, 20) OR c.assigned_employee IS NULL)
-            {employee_filter}
+            c.created >= %(start_datetime)s::timestamp AT TIME ZONE 'CST'
+            AND c.created <= %(end_datetime)s::timestamp AT TIME ZONE 'CST'
+            AND (c.assigned_employee <> ALL(%(excluded_ids)s) OR c.assigned_employee IS NULL)
+            AND (%(employee_id)s::int IS NULL OR c.assigned_employee = %(employee_id)s::int)
     ),
     clients_with_received_status AS (
         SELECT DISTINCT 
@@ -126,8 +78,9 @@ def generate_11am_report():
         clients_with_received_status r ON c.client_id = r.client_id
     ORDER BY 
         c.created_at DESC;
-    """
-    fetch_employee_summary_query = f"""
+""")
+
+employee_summary_query = register_query('report_11am_employee_summary', """
         SELECT 
             e.fullname AS employee_name,
             COUNT(c.id) AS number_of_clients,
@@ -145,23 +98,62 @@ def generate_11am_report():
         LEFT JOIN 
             public.employee e ON c.assigned_employee = e.id
         WHERE 
-            c.created >= '{start_datetime}'::timestamp AT TIME ZONE 'CST'
-            AND c.created <= '{end_datetime}'::timestamp AT TIME ZONE 'CST'
-            AND (c.assigned_employee NOT IN (317, 318, 319,410,415,416, 344,160, 20) OR c.assigned_employee IS NULL)
-            {employee_filter}
+            c.created >= %(start_datetime)s::timestamp AT TIME ZONE 'CST'
+            AND c.created <= %(end_datetime)s::timestamp AT TIME ZONE 'CST'
+            AND (c.assigned_employee <> ALL(%(excluded_ids)s) OR c.assigned_employee IS NULL)
+            AND (%(employee_id)s::int IS NULL OR c.assigned_employee = %(employee_id)s::int)
         GROUP BY 
             e.fullname
         ORDER BY 
             number_of_clients DESC;
-    """
+""")
+
+def load_11am_employees():
+    # Served from the cached roster; id -> name, sorted by name for the dropdown
+    employees = group_employees('new_lead_reps').sort_values('fullname')
+    return dict(zip(employees['id'], employees['fullname']))
+
+def load_11am_report(start_date, end_date, employee_id=None):
+    # Convert dates to datetime format with start and end of the day
+    start_datetime = datetime.combine(start_date, datetime.min.time())
+    end_datetime = datetime.combine(end_date, datetime.max.time())
+
+    # The employee filter is a bound id; NULL means all employees
+    params = {
+        'start_datetime': start_datetime,
+        'end_datetime': end_datetime,
+        'excluded_ids': group_ids('excluded'),
+        'employee_id': employee_id,
+    }
 
     # Fetch the data
-    client_data = fetch_data(fetch_clients_query)
-    employee_summary_data = fetch_data(fetch_employee_summary_query)
+    client_data = fetch_frame(clients_query, params, profile=PROFILE)
+    employee_summary_data = fetch_frame(employee_summary_query, params, profile=PROFILE)
+    return {
+        'clients': normalize_frame(client_data, PAGE),
+        'employee_summary': normalize_frame(employee_summary_data, PAGE),
+    }
+
+def generate_11am_report():
+    st.title("11 AM Report")
+
+    # Date input to select a start and end date
+    st.subheader("Select Date Range for the Report")
+    start_date = st.date_input("Start Date", datetime.now().date() - timedelta(days=1))
+    end_date = st.date_input("End Date", datetime.now().date())
+
+    # Fetch employee list for dropdown
+    employees = load_11am_employees()
+    employee_id = st.selectbox("Select Employee", [None] + list(employees),
+                               format_func=lambda option: 'All Employees' if option is None else employees[option])
+
+    data = load_11am_report(start_date, end_date, employee_id)
+    client_data = data['clients']
+    employee_summary_data = data['employee_summary']
 
     # Display the clients table
     st.subheader("Client Details")
-    if not client_data.empty:
+    if client_data is not None and not client_data.empty:
         client_data['FUB Link'] = client_data.apply(
             lambda row: f'<a href="{row["fub_link"]}" target="_blank">Go to Link</a>', axis=1
         )
@@ -170,15 +162,14 @@ def generate_11am_report():
 
         st.write(client_data_display.to_html(escape=False, index=False), unsafe_allow_html=True)
 
-        # Add option to download as CSV
-        csv = client_data_display.to_csv(index=False)
-        st.download_button(label="Download 11AM Reporting CSV File", data=csv, file_name="11AM Reporting.csv", mime="text/csv")
+        # Add download options; the file is only written when one is clicked
+        download_buttons("Download 11AM Reporting File", "11AM Reporting", client_data_display)
     else:
         st.write("No clients found in the selected date range.")
 
     # Display the employee summary table
     st.subheader("Employee Summary")
-    if not employee_summary_data.empty:
+    if employee_summary_data is not None and not employee_summary_data.empty:
         st.dataframe(employee_summary_data, use_container_width=True)
     else:
         st.write("No leads assigned to employees in the selected date range.")
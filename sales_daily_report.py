@@ -1,39 +1,55 @@
 import streamlit as st
 
 import os
-import psycopg2
+import threading
+import time
 import pandas as pd
 import json
 import requests
 from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
 from datetime import datetime, timedelta
 
+from change_feed import watch_tables
+from client_dimension import client_names
+from db import execute_query, pooled_connection, register_query
+from frame_dtypes import normalize_frame
+from history_store import read_fact, split_at_watermark
+from identity_index import build_identity_index, load_overrides, save_override
+from metrics import sling_seconds
+from report_metrics import employee_activity_metrics, stage_transitions
+from report_pdf import build_team_pdf, frame_rows
+from roster import group_employees, group_ids
+
+PAGE = "Sales Rep Daily Report"
+# Full-history analytics; served by a replica when one is configured and current
+PROFILE = 'analytics'
+# Tables whose changes make this page's cached results stale
+CHANGE_TABLES = watch_tables(PAGE, ('client', 'client_stage_progression', 'textmessage'), rerun=False)
+
 ASSIGNED_MINUTES = 480
 SECONDS_PER_MESSAGE = 5
 
+# Total wait for Sling before the report is shown without attendance
+SLING_TIMEOUT_SECONDS = 30
+
+ACTIVITY_COLUMNS = ['timestamp', 'type', 'message', 'client_id', 'employee_name', 'employee_id', 'call_duration']
+
+ATTENDANCE_COLUMNS = ['Date', 'Scheduled Clock-in', 'Actual Clock-in', 'Late Minutes',
+                      'Scheduled Clock-out', 'Actual Clock-out', 'Early Out Minutes',
+                      'Scheduled Break Duration', 'Actual Break Taken']
+
 # Add Sling API configuration
 class Config:
     SLING_API_BASE = "https://api.getsling.com/v1"
     SLING_API_KEY = st.secrets.get("sling", {}).get("API_KEY", "")
     SLING_ORG_ID = st.secrets.get("sling", {}).get("ORG_ID", "")
+    SLING_REQUEST_TIMEOUT = 20
 
-db_params = {
-    'dbname': st.secrets["database"]["DB_NAME"],
-    'user': st.secrets["database"]["DB_USER"],
-    'password': st.secrets["database"]["DB_PASSWORD"],
-    'host': st.secrets["database"]["DB_HOST"],
-    'port': st.secrets["database"]["DB_PORT"]
-}
-
-# # For debugging
-# print(f"Database connection parameters:")
-# print(f"Host: {db_params['host']}")
-# print(f"Database: {db_params['dbname']}")
-# print(f"User: {db_params['user']}")
-# print(f"Port: {db_params['port']}")
-
-employee_names = ['Mukund Chopra','John Green', 'Hiba Siddiqui','Travis Grey','John Reed','Joshua weller','Shanzay Adams', 'SOVIT BISWAL','Omar Rogers','Ruby Smith', 'BPO Diligence', 'Evard Odlanyer P. Aguilar', 'Andrei Joshua U. Descaller', 'Ferwhin I. Solano', 'Fiel G. Rivera', 'Soliman M. Soliman', 'Sophie Scott', 'Nora Bannon', 'Henry Brown', 'Adam Kent' , 'Brian Baik','Hugh Taylor', 'Stanley Martin', 'Wilson Carter','Marcia Monroe', 'Michelle Taylor','Shaun Green','Sarah Michael','Amber Baker','Hildah Manoah']
+# Employees whose activity the report covers, in tab order
+REP_GROUP = 'daily_report_reps'
 
 # Default date range calculation - will be overridden by user selection
 end_time = datetime.now()
@@ -55,12 +71,24 @@ class AttendanceAnalyzer:
         self.break_threshold = 60  # Maximum allowed break duration in minutes
         self.start_date = start_date
         self.end_date = end_date
+        self.user_map = {}
+
+    def sling_get(self, endpoint, url, **kwargs):
+        """GET a Sling endpoint, recording its latency by endpoint and status"""
+        started = time.perf_counter()
+        status = 'error'
+        try:
+            response = requests.get(url, headers=self.headers, timeout=Config.SLING_REQUEST_TIMEOUT, **kwargs)
+            status = str(response.status_code)
+            return response
+        finally:
+            sling_seconds.observe(time.perf_counter() - started, endpoint, status)
 
     def fetch_user_data(self) -> dict:
         """Fetch all users from Sling API"""
         url = f"{self.api_base}/{Config.SLING_ORG_ID}/users"
         try:
-            response = requests.get(url, headers=self.headers)
+            response = self.sling_get('users', url)
             if response.status_code == 200:
                 data = response.json()
                 user_map = {
@@ -85,9 +113,9 @@ class AttendanceAnalyzer:
         
         url = f"{self.api_base}/{Config.SLING_ORG_ID}/reports/timesheets"
         try:
-            response = requests.get(
+            response = self.sling_get(
+                'timesheets',
                 url,
-                headers=self.headers,
                 params={
                     'dates': date_range,
                     'nonce': nonce
@@ -101,6 +129,7 @@ class AttendanceAnalyzer:
     def analyze_attendance(self) -> pd.DataFrame:
         """Analyze attendance focusing on shifts and late arrivals"""
         user_map = self.fetch_user_data()
+        self.user_map = user_map
         if not user_map:
             print("No users found!")
             return pd.DataFrame()
@@ -189,6 +218,7 @@ class AttendanceAnalyzer:
                     attendance_records.append({
                         'Date': current_date.strftime('%Y-%m-%d'),
                         'Employee Name': user_name,
+                        'Sling User ID': user_id,
                         'Scheduled Clock-in': shift_start.strftime('%H:%M'),
                         'Actual Clock-in': clock_in.strftime('%H:%M') if clock_in else 'Not Clocked In',
                         'Scheduled Clock-out': shift_end.strftime('%H:%M'),
@@ -207,55 +237,20 @@ class AttendanceAnalyzer:
 
         return pd.DataFrame(attendance_records)
 
-fetch_client_ids_query = """
-SELECT DISTINCT c.id AS client_id, c.fullname AS client_name
-FROM
-(
-    SELECT
-        t.client_id
-    FROM
-        textmessage t
-    JOIN
-        employee e ON t.created_by = e.id
-    WHERE
-        t.created >= NOW() - INTERVAL '1 month'
-    AND e.fullname = ANY(%s)
-
-    UNION
-
-    SELECT
-        call.client_id
-    FROM
-        call
-    JOIN
-        employee e ON call.employee_id = e.id
-    WHERE
-        call.created >= NOW() - INTERVAL '1 month'
-    AND call.is_incoming = false
-    AND e.fullname = ANY(%s)
-) as combined
-JOIN
-    public.client c ON combined.client_id = c.id
-ORDER BY client_id;
-"""
-
-def get_fetch_records_query(start_time_str, end_time_str):
-    return f"""
+records_query = register_query('daily_report_activity', """
     (
         SELECT
             to_char(t.created, 'YYYY-MM-DD HH24:MI:SS') AS timestamp,
             'text_created' AS type,
             t.message AS message,
             t.client_id,
-            e.fullname AS employee_name,
+            t.created_by AS employee_id,
             NULL AS call_duration
         FROM
             textmessage t
-        JOIN
-            employee e ON t.created_by = e.id
         WHERE
-            e.fullname = %s
-            AND t.created BETWEEN '{start_time_str}' AND '{end_time_str}'
+            t.created_by = %(employee_id)s
+            AND t.created BETWEEN %(start_time)s AND %(end_time)s
     )
     UNION ALL
     (
@@ -264,39 +259,24 @@ def get_fetch_records_query(start_time_str, end_time_str):
             'call' AS type,
             c.note AS message,
             c.client_id,
-            e.fullname AS employee_name,
+            c.employee_id,
             c.duration AS call_duration
         FROM
             call c
-        JOIN
-            employee e ON c.employee_id = e.id
         WHERE
-            e.fullname = %s
-            AND c.created BETWEEN '{start_time_str}' AND '{end_time_str}'
+            c.employee_id = %(employee_id)s
+            AND c.created BETWEEN %(start_time)s AND %(end_time)s
             AND c.is_incoming = false
     )
     ORDER BY
         client_id, timestamp;
-    """
+""")
 
-def get_stage_progression_query(start_time_str, end_time_str):
-    return f"""
+stage_progression_query = register_query('daily_report_stage_progression', """
     SELECT
         csp.id,
         csp.client_id,
         c.fullname,
-        CASE
-            WHEN csp.current_stage = 1 THEN 'Stage 1: Not Interested'
-            WHEN csp.current_stage = 2 THEN 'Stage 2: Initial Contact'
-            WHEN csp.current_stage = 3 THEN 'Stage 3: Requirement Collection'
-            WHEN csp.current_stage = 4 THEN 'Stage 4: Property Touring'
-            WHEN csp.current_stage = 5 THEN 'Stage 5: Property Tour and Feedback'
-            WHEN csp.current_stage = 6 THEN 'Stage 6: Application and Approval'
-            WHEN csp.current_stage = 7 THEN 'Stage 7: Post-Approval and Follow-Up'
-            WHEN csp.current_stage = 8 THEN 'Stage 8: Commission Collection'
-            WHEN csp.current_stage = 9 THEN 'Stage 9: Dead Stage'
-            ELSE 'Unknown Stage'
-        END AS stage_name,
         csp.current_stage,
         csp.created_on,
         c.assigned_employee,
@@ -308,106 +288,195 @@ def get_stage_progression_query(start_time_str, end_time_str):
     ON
         csp.client_id = c.id
     WHERE
-        csp.created_on BETWEEN '{start_time_str}' AND '{end_time_str}'
+        csp.created_on BETWEEN %(start_time)s AND %(end_time)s
     ORDER BY
         csp.created_on;
-    """
+""")
+
+def fetch_employees():
+    return group_employees(REP_GROUP)
+
+def fetch_history_records(start_datetime, end_datetime):
+    """Activity records for finished days, read from the local Parquet history"""
+    texts = read_fact('textmessage', start_datetime, end_datetime,
+                      ['created', 'message', 'client_id', 'employee_name', 'employee_id'],
+                      employee_ids=group_ids(REP_GROUP))
+    texts['type'] = 'text_created'
+    texts['call_duration'] = None
+    calls = read_fact('call', start_datetime, end_datetime,
+                      ['created', 'message', 'client_id', 'employee_name', 'employee_id', 'duration'],
+                      employee_ids=group_ids(REP_GROUP))
+    calls['type'] = 'call'
+    calls = calls.rename(columns={'duration': 'call_duration'})
+    df = pd.concat([texts, calls], ignore_index=True)
+    df['timestamp'] = df['created'].dt.strftime('%Y-%m-%d %H:%M:%S')
+    return df[ACTIVITY_COLUMNS]
 
-def employee_record(name, df):
-    temp = df[df['assigned_employee_name'] == name]
-
-    result_df = temp.groupby('fullname')[['current_stage', 'stage_name']].agg(['min', 'max']).reset_index()
-    result_df.columns = ['Client', 'min_current_stage', 'max_current_stage', 'min_stage_name', 'max_stage_name']
-    result_df['change'] = result_df['max_current_stage'] - result_df['min_current_stage']
-    result_df['Previous Stage'] = result_df['min_current_stage'].astype(str) + ': ' + result_df['min_stage_name'].apply(lambda x: x.split(':')[1] if ':' in x else x)
-    result_df['Current Stage'] = result_df['max_current_stage'].astype(str) + ': ' + result_df['max_stage_name'].apply(lambda x: x.split(':')[1] if ':' in x else x)
-    result_df['Previous Stage'] = result_df['Previous Stage'].apply(lambda x: x.split(' - ')[0])
-    result_df['Current Stage'] = result_df['Current Stage'].apply(lambda x: x.split(' - ')[0])
-    result_df = result_df.drop(columns=['min_current_stage', 'max_current_stage', 'min_stage_name', 'max_stage_name','change'])
-    return result_df
-
-def fetch_client_ids_and_names():
-    connection = None
-    cursor = None
+def fetch_and_save_records_to_csv(start_time_str, end_time_str):
+    # Finished days come from the history store, only the rest from production
+    start_datetime = datetime.strptime(start_time_str, '%Y-%m-%d %H:%M:%S')
+    end_datetime = datetime.strptime(end_time_str, '%Y-%m-%d %H:%M:%S')
+    history_range, live_range = split_at_watermark(('textmessage', 'call'), start_datetime, end_datetime)
+    frames = []
+    if history_range:
+        frames.append(fetch_history_records(*history_range))
+    if live_range:
+        live = fetch_live_records(*(bound.strftime('%Y-%m-%d %H:%M:%S') for bound in live_range))
+        if live is None:
+            return None
+        frames.append(live)
+    if not history_range:
+        return frames[0]
+    # Same order as the per-employee live queries, which also decides the tab order
+    df = pd.concat(frames, ignore_index=True)
+    df['employee_order'] = df['employee_id'].map({employee_id: i for i, employee_id in enumerate(group_ids(REP_GROUP))})
+    df = df.sort_values(['employee_order', 'client_id', 'timestamp'], ignore_index=True)
+    return df.drop(columns='employee_order')
+
+def fetch_live_records(start_time_str, end_time_str):
+    all_records = []
+    # Resolved before borrowing a connection; the roster may need one of its own
+    employees = group_employees(REP_GROUP)
     try:
-        connection = psycopg2.connect(**db_params)
-        cursor = connection.cursor()
-        cursor.execute(fetch_client_ids_query, (employee_names, employee_names))
-        client_data = cursor.fetchall()
-        df = pd.DataFrame(client_data, columns=['client_id', 'client_name'])
-        print("Client IDs and names have been loaded into a DataFrame")
-        return df
+        with pooled_connection(PROFILE) as connection, connection.cursor() as cursor:
+            # One prepared statement, executed once per employee
+            for employee_id in employees['id'].tolist():
+                execute_query(cursor, records_query,
+                              {'employee_id': employee_id, 'start_time': start_time_str, 'end_time': end_time_str})
+                records = cursor.fetchall()
+                all_records.extend(records)
+            df = pd.DataFrame(all_records, columns=[column for column in ACTIVITY_COLUMNS if column != 'employee_name'])
+            # Names come from the roster rather than a join in every query
+            df.insert(ACTIVITY_COLUMNS.index('employee_name'), 'employee_name',
+                      df['employee_id'].map(dict(zip(employees['id'], employees['fullname']))))
+            print("Employee records have been loaded into a DataFrame")
+            return df
     except Exception as error:
-        st.error(f"Error connecting to database: {error}")
-        print(f"Error fetching client data: {error}")
+        print(f"Error fetching records: {error}")
         return None
-    finally:
-        if cursor:
-            cursor.close()
-        if connection:
-            connection.close()
 
-def fetch_and_save_records_to_csv(start_time_str, end_time_str):
-    connection = None
-    cursor = None
-    all_records = []
+def run_query_and_save_to_csv(sql_query, params=None):
     try:
-        connection = psycopg2.connect(**db_params)
-        cursor = connection.cursor()
-        query = get_fetch_records_query(start_time_str, end_time_str)
-        for name in employee_names:
-            cursor.execute(query, (name, name))
+        with pooled_connection(PROFILE) as connection, connection.cursor() as cursor:
+            execute_query(cursor, sql_query, params)
             records = cursor.fetchall()
-            all_records.extend(records)
-        df = pd.DataFrame(all_records, columns=['timestamp', 'type', 'message', 'client_id', 'employee_name', 'call_duration'])
-        print("Employee records have been loaded into a DataFrame")
-        return df
+            column_names = [desc[0] for desc in cursor.description]
+            df = pd.DataFrame(records, columns=column_names)
+            print("Query executed and results loaded into a DataFrame")
+            return df
     except Exception as error:
-        print(f"Error fetching records: {error}")
+        print(f"Error running query: {error}")
         return None
-    finally:
-        if cursor:
-            cursor.close()
-        if connection:
-            connection.close()
-
-def run_query_and_save_to_csv(sql_query):
-    connection = None
-    cursor = None
+
+def load_attendance(start_datetime, end_datetime):
+    """Sling attendance with each Sling user resolved to an employee id"""
+    # Read before the Sling requests, so a slow Sling call never holds a pooled connection
+    employees_df = fetch_employees()
+    attendance_analyzer = AttendanceAnalyzer(start_datetime, end_datetime)
+    attendance_df = attendance_analyzer.analyze_attendance()
+    data = {'attendance': attendance_df, 'sling_users': {}, 'identity_index': {}, 'employees': None}
+    if not attendance_df.empty:
+        # Resolve Sling users to employee ids once for the whole run
+        identity_index = build_identity_index(attendance_analyzer.user_map, employees_df, load_overrides())
+        attendance_df['employee_id'] = attendance_df['Sling User ID'].map(identity_index)
+        data.update(sling_users=attendance_analyzer.user_map, identity_index=identity_index, employees=employees_df)
+    return data
+
+def submit_with_context(executor, fn, *args):
+    # Worker threads keep the page's script context so st.error still reaches the page
+    ctx = get_script_run_ctx(suppress_warning=True)
+
+    def run():
+        if ctx is not None:
+            add_script_run_ctx(threading.current_thread(), ctx)
+        return fn(*args)
+    return executor.submit(run)
+
+def section_result(future, section, errors, timeout=None):
+    """A section's result, or None with the error recorded so the other sections still render"""
     try:
-        connection = psycopg2.connect(**db_params)
-        cursor = connection.cursor()
-        cursor.execute(sql_query)
-        records = cursor.fetchall()
-        column_names = [desc[0] for desc in cursor.description]
-        df = pd.DataFrame(records, columns=column_names)
-        print("Query executed and results loaded into a DataFrame")
-        return df
+        return future.result(timeout=timeout)
+    except FuturesTimeoutError:
+        raise
     except Exception as error:
-        print(f"Error running query: {error}")
+        print(f"{section} failed: {error}")
+        errors.append(f"Failed to load {section}: {error}")
         return None
-    finally:
-        if cursor:
-            cursor.close()
-        if connection:
-            connection.close()
 
-def add_employee_report(employee_name, df, df5, attendance_df=None):
-    st.header(f'Report for {employee_name}')
-    
-    # Calculate work activity metrics
-    total_calls = df[(df['employee_name'] == employee_name) & (df['type'] == 'call')].shape[0]
-    total_duration_seconds = df[(df['employee_name'] == employee_name) & (df['type'] == 'call')]['call_duration'].sum()
-    total_duration_minutes = total_duration_seconds // 60
-    total_messages = df[(df['employee_name'] == employee_name) & (df['type'] == 'text_created')].shape[0]
-    total_message_time_seconds = total_messages * SECONDS_PER_MESSAGE
-    total_work_time_seconds = total_duration_seconds + total_message_time_seconds
-    total_work_time_minutes = total_work_time_seconds // 60
+def load_sales_rep_daily_report(start_datetime, end_datetime, sling_timeout=SLING_TIMEOUT_SECONDS):
+    """Fetch attendance, stage progression and activity for the report without rendering anything.
+
+    Sling and the three database queries do not depend on each other and run
+    concurrently. Attendance that is not back within sling_timeout seconds of
+    the start is dropped and attendance_timed_out is set. A section that raises
+    is left as None and its message added to errors.
+    """
+    started = time.monotonic()
+    start_time_str = start_datetime.strftime('%Y-%m-%d %H:%M:%S')
+    end_time_str = end_datetime.strftime('%Y-%m-%d %H:%M:%S')
+    data = {'attendance': None, 'sling_users': {}, 'identity_index': {}, 'employees': None,
+            'attendance_timed_out': False, 'stage_progression': None, 'client_names': None,
+            'activity': None, 'metrics': None, 'errors': []}
+
+    executor = ThreadPoolExecutor(max_workers=4)
+    attendance_future = submit_with_context(executor, load_attendance, start_datetime, end_datetime)
+    stage_future = submit_with_context(executor, run_query_and_save_to_csv, stage_progression_query,
+                                       {'start_time': start_time_str, 'end_time': end_time_str})
+    records_future = submit_with_context(executor, fetch_and_save_records_to_csv, start_time_str, end_time_str)
+
+    df5 = section_result(stage_future, "stage progression", data['errors'])
+    if df5 is not None and not df5.empty:
+        df5 = df5.drop_duplicates(subset=['client_id', 'current_stage'])
+        df5 = df5[df5['current_stage'] != 9]
+        data['stage_progression'] = normalize_frame(df5, PAGE)
+
+    df = section_result(records_future, "activity records", data['errors'])
+    client_ids = df['client_id'] if df is not None and 'client_id' in df else pd.Series(dtype='Int64')
+    labels = client_names(client_ids)
+    data['client_names'] = labels
+    if labels is not None:
+        if df is not None and not df.empty:
+            # Ensure call_duration is numeric
+            df['call_duration'] = pd.to_numeric(df['call_duration'], errors='coerce').fillna(0)
+
+            df['client_name'] = labels
+            df = normalize_frame(df, PAGE)
+            data['metrics'] = employee_activity_metrics(df, SECONDS_PER_MESSAGE)
+        data['activity'] = df
+
+    # Join attendance in if Sling has answered by now, otherwise wait out the rest of the budget
+    try:
+        attendance = section_result(attendance_future, "Sling attendance", data['errors'],
+                                    timeout=max(0, sling_timeout - (time.monotonic() - started)))
+        if attendance is not None:
+            data.update(attendance)
+    except FuturesTimeoutError:
+        print(f"Sling attendance not ready after {sling_timeout}s, continuing without it")
+        data['attendance_timed_out'] = True
+    # A slow Sling request finishes in the background without holding up the page; it
+    # holds no pooled connection, and one not yet started is dropped
+    executor.shutdown(wait=False, cancel_futures=True)
+    return data
+
+def work_metrics_table(metrics):
+    # Work activity metrics were precomputed for every employee in one pass
+    total_calls = int(metrics['total_calls'])
+    total_duration_minutes = metrics['call_seconds'] // 60
+    total_messages = int(metrics['total_messages'])
+    total_work_time_minutes = metrics['work_seconds'] // 60
+    num_clients = int(metrics['clients_handled'])
     
-    employee_calls_clients = df[(df['employee_name'] == employee_name) & (df['type'] == 'call')]['client_id'].dropna().unique()
-    employee_messages_clients = df[(df['employee_name'] == employee_name) & (df['type'] == 'text_created')]['client_id'].dropna().unique()
-    unique_clients = pd.Series(list(set(employee_calls_clients) | set(employee_messages_clients))).dropna().unique()
-    num_clients = len(unique_clients)
+    return {
+        "Total Calls": str(total_calls),
+        "Total Call Duration (min)": str(int(total_duration_minutes)),
+        "Total Messages": str(total_messages),
+        "Assigned Time (min)": str(ASSIGNED_MINUTES),
+        "Total Work Time (min)": str(int(total_work_time_minutes)),
+        "Clients Handled": str(num_clients)
+    }
+
+def add_employee_report(employee_name, metrics, employee_df=None, employee_attendance=None):
+    st.header(f'Report for {employee_name}')
     
     # Create a combined activity table
     st.subheader("Employee Performance Summary")
@@ -419,14 +488,7 @@ def add_employee_report(employee_name, df, df5, attendance_df=None):
     }
     
     # Add work activity metrics
-    work_metrics = {
-        "Total Calls": str(total_calls),
-        "Total Call Duration (min)": str(int(total_duration_minutes)),
-        "Total Messages": str(total_messages),
-        "Assigned Time (min)": str(ASSIGNED_MINUTES),
-        "Total Work Time (min)": str(int(total_work_time_minutes)),
-        "Clients Handled": str(num_clients)
-    }
+    work_metrics = work_metrics_table(metrics)
     
     # Add metrics
     for metric, value in work_metrics.items():
@@ -437,73 +499,90 @@ def add_employee_report(employee_name, df, df5, attendance_df=None):
     combined_df = pd.DataFrame(combined_data)
     st.table(combined_df)
     
-    # Show detailed attendance information if available
-    if attendance_df is not None and not attendance_df.empty:
-        # Extract first and last name for better matching
-        employee_parts = employee_name.split()
-        last_name = employee_parts[-1] if len(employee_parts) > 0 else ""
-        first_name = employee_parts[0] if len(employee_parts) > 0 else ""
+    # Attendance rows were joined to this employee by id through the identity index
+    if employee_attendance is not None and not employee_attendance.empty:
+        st.subheader("Attendance Details")
         
-        # Try different matching strategies
-        employee_attendance = attendance_df[attendance_df['Employee Name'] == employee_name]
-        if employee_attendance.empty and last_name:
-            employee_attendance = attendance_df[attendance_df['Employee Name'].str.contains(last_name, case=False)]
-        if employee_attendance.empty and first_name:
-            employee_attendance = attendance_df[attendance_df['Employee Name'].str.contains(first_name, case=False)]
+        # Format the attendance dataframe for better display
+        display_df = employee_attendance.copy()
         
-        if not employee_attendance.empty:
-            st.subheader("Attendance Details")
-            
-            # Format the attendance dataframe for better display
-            display_df = employee_attendance.copy()
-            
-            # Sort by date
-            display_df = display_df.sort_values(by='Date')
-            
-            # Select and reorder columns for display
-            display_columns = ['Date', 'Scheduled Clock-in', 'Actual Clock-in', 'Late Minutes',
-                              'Scheduled Clock-out', 'Actual Clock-out', 'Early Out Minutes',
-                              'Scheduled Break Duration', 'Actual Break Taken']
-            
-            display_df = display_df[display_columns]
-            
-            # Apply styling to highlight issues - using the newer map method instead of applymap
-            def highlight_late_minutes(val):
-                if val > 0:
-                    return 'background-color: #ffcccc'
-                return ''
-            
-            def highlight_early_out_minutes(val):
-                if val > 0:
-                    return 'background-color: #ffcccc'
-                return ''
-            
-            def highlight_break_duration(val):
-                if val > 60:  # Assuming 60 min is standard break
-                    return 'background-color: #ffcccc'
-                return ''
-            
-            # Apply the styling using map instead of applymap
-            styled_df = display_df.style.map(
-                highlight_late_minutes, 
-                subset=['Late Minutes']
-            ).map(
-                highlight_early_out_minutes, 
-                subset=['Early Out Minutes']
-            ).map(
-                highlight_break_duration, 
-                subset=['Actual Break Taken']
-            )
-            
-            st.dataframe(styled_df)
+        # Sort by date
+        display_df = display_df.sort_values(by='Date')
+        
+        # Select and reorder columns for display
+        display_df = display_df[ATTENDANCE_COLUMNS]
+        
+        # Apply styling to highlight issues - using the newer map method instead of applymap
+        def highlight_late_minutes(val):
+            if val > 0:
+                return 'background-color: #ffcccc'
+            return ''
+        
+        def highlight_early_out_minutes(val):
+            if val > 0:
+                return 'background-color: #ffcccc'
+            return ''
+        
+        def highlight_break_duration(val):
+            if val > 60:  # Assuming 60 min is standard break
+                return 'background-color: #ffcccc'
+            return ''
+        
+        # Apply the styling using map instead of applymap
+        styled_df = display_df.style.map(
+            highlight_late_minutes, 
+            subset=['Late Minutes']
+        ).map(
+            highlight_early_out_minutes, 
+            subset=['Early Out Minutes']
+        ).map(
+            highlight_break_duration, 
+            subset=['Actual Break Taken']
+        )
+        
+        st.dataframe(styled_df)
     
     # Show client progression information
-    employee_df = employee_record(employee_name, df5)
-    if not employee_df.empty:
+    if employee_df is not None and not employee_df.empty:
         st.subheader("Client Progression")
         st.dataframe(employee_df)
 
-def generate_combined_streamlit_report(df, df5, attendance_df=None):
+def employee_pdf_sections(employee_names, metrics, transitions, attendance_by_employee, employee_ids, subtitle=None):
+    # Plain lists only, so each section can be rendered in a separate process
+    sections = []
+    for employee_name in employee_names:
+        employee_attendance = attendance_by_employee.get(int(employee_ids[employee_name]))
+        if employee_attendance is not None:
+            employee_attendance = employee_attendance.sort_values(by='Date')
+        sections.append({
+            'employee_name': employee_name,
+            'subtitle': subtitle,
+            'metrics': work_metrics_table(metrics.loc[employee_name]),
+            'attendance': frame_rows(employee_attendance, ATTENDANCE_COLUMNS),
+            'progression': frame_rows(transitions.get(employee_name)),
+        })
+    return sections
+
+def pdf_file_name(report_range):
+    if not report_range:
+        return "sales_rep_daily_report.pdf"
+    return f"sales_rep_daily_report_{report_range.replace(' ', '_').replace(':', '')}.pdf"
+
+def show_pdf_export(sections, report_range):
+    # Keep the rendered file for this date range across the rerun the download triggers
+    if st.button("Prepare PDF export"):
+        with st.spinner("Rendering PDF..."):
+            st.session_state['sales_rep_daily_pdf'] = (report_range, build_team_pdf(sections))
+    exported = st.session_state.get('sales_rep_daily_pdf')
+    if exported and exported[0] == report_range and exported[1]:
+        st.download_button(
+            "Download PDF",
+            data=exported[1],
+            file_name=pdf_file_name(report_range),
+            mime="application/pdf",
+        )
+
+def generate_combined_streamlit_report(df, df5, attendance_df=None, metrics=None, report_range=''):
     # Use a more specific title
     st.header('Employee Performance Reports')
     
@@ -513,14 +592,55 @@ def generate_combined_streamlit_report(df, df5, attendance_df=None):
     # Convert NumPy array to list before passing to st.tabs()
     employee_names_list = employee_names.tolist()
     
+    # Compute all employee metrics once instead of scanning df for every tab
+    if metrics is None:
+        metrics = employee_activity_metrics(df, SECONDS_PER_MESSAGE)
+    
+    # Stage transitions for every employee's clients, sliced per tab below
+    transitions = stage_transitions(df5)
+    
+    # Split attendance by employee id once so each tab is a key lookup
+    employee_ids = df.drop_duplicates('employee_name').set_index('employee_name')['employee_id']
+    attendance_by_employee = {}
+    if attendance_df is not None and 'employee_id' in attendance_df.columns:
+        attendance_by_employee = {
+            int(employee_id): rows
+            for employee_id, rows in attendance_df.dropna(subset=['employee_id']).groupby('employee_id')
+        }
+    
+    # One PDF with a section per employee tab
+    sections = employee_pdf_sections(employee_names, metrics, transitions, attendance_by_employee,
+                                     employee_ids, report_range)
+    show_pdf_export(sections, report_range)
+    
     # Create tabs for each employee
     tabs = st.tabs(employee_names_list)
     
     # Generate report for each employee in their own tab
     for i, employee_name in enumerate(employee_names):
         with tabs[i]:
-            add_employee_report(employee_name, df, df5, attendance_df)
+            employee_attendance = attendance_by_employee.get(int(employee_ids[employee_name]))
+            add_employee_report(employee_name, metrics.loc[employee_name], transitions.get(employee_name), employee_attendance)
         
+def show_unmatched_sling_users(sling_users, identity_index, employees_df):
+    unmatched = {user_id: user for user_id, user in sling_users.items() if user_id not in identity_index}
+    if not unmatched or employees_df.empty:
+        return
+    with st.expander(f"Unmatched Sling users ({len(unmatched)})"):
+        sling_user_id = st.selectbox(
+            "Sling user",
+            list(unmatched),
+            format_func=lambda user_id: f"{unmatched[user_id]['name']} ({unmatched[user_id]['email']})",
+        )
+        employee_id = st.selectbox(
+            "Employee",
+            employees_df['id'].tolist(),
+            format_func=lambda employee_id: employees_df.loc[employees_df['id'] == employee_id, 'fullname'].iloc[0],
+        )
+        if st.button("Save mapping"):
+            save_override(sling_user_id, employee_id)
+            st.success("Mapping saved. It will be used from the next refresh.")
+
 def show_sales_rep_daily_report():
     # Add date selection at the top
     st.subheader("Select Date Range")
@@ -564,51 +684,38 @@ def show_sales_rep_daily_report():
     # Display selected range
     st.info(f"Showing data from {start_time_str} to {end_time_str}")
     
-    # Fetch attendance data
-    attendance_df = None
-    with st.spinner("Fetching attendance data..."):
-        attendance_analyzer = AttendanceAnalyzer(start_datetime, end_datetime)
-        attendance_df = attendance_analyzer.analyze_attendance()
-        
-        if attendance_df.empty:
-            st.warning("No attendance data found for the selected date range.")
-    
-    # Get the stage progression query with the selected date range
-    stage_query = get_stage_progression_query(start_time_str, end_time_str)
-    
-    # Run queries with the selected date range
-    df5 = run_query_and_save_to_csv(stage_query)
-    
-    if df5 is not None and not df5.empty:
-        df5 = df5.drop_duplicates(subset=['client_id', 'current_stage'])
-        df5 = df5[df5['current_stage'] != 9]
-
-        client_ids = {}
-        df = fetch_client_ids_and_names()
-        if df is not None:
-            for index, row in df.iterrows():
-                client_ids[row['client_id']] = row['client_name']
-
-            # Fetch records with the selected date range
-            df = fetch_and_save_records_to_csv(start_time_str, end_time_str)
-            
-            if df is not None and not df.empty:
-                # Ensure call_duration is numeric
-                df['call_duration'] = pd.to_numeric(df['call_duration'], errors='coerce').fillna(0)
-                
-                # Map client IDs to client names
-                df['client_name'] = df['client_id'].map(client_ids)
-                
-                # Add a divider before individual reports
-                st.markdown("---")
-                
-                generate_combined_streamlit_report(df, df5, attendance_df)
-            else:
-                st.warning("No employee activity records found for the selected date range.")
-        else:
-            st.error("Failed to fetch client data.")
+    # Fetch everything up front; rendering below only reads the loaded frames
+    with st.spinner("Fetching report data..."):
+        data = load_sales_rep_daily_report(start_datetime, end_datetime)
+
+    for error in data['errors']:
+        st.error(error)
+
+    attendance_df = data['attendance']
+    if data['attendance_timed_out']:
+        st.warning(f"Sling did not respond within {SLING_TIMEOUT_SECONDS} seconds; showing the report without attendance.")
+    elif attendance_df is None:
+        # Its failure is among the errors above
+        pass
+    elif attendance_df.empty:
+        st.warning("No attendance data found for the selected date range.")
     else:
+        show_unmatched_sling_users(data['sling_users'], data['identity_index'], data['employees'])
+
+    df5 = data['stage_progression']
+    df = data['activity']
+    if df5 is None:
         st.warning("No stage progression data found for the selected date range.")
+    elif data['client_names'] is None:
+        st.error("Failed to fetch client data.")
+    elif df is not None and not df.empty:
+        # Add a divider before individual reports
+        st.markdown("---")
+
+        generate_combined_streamlit_report(df, df5, attendance_df, data['metrics'],
+                                           f"{start_time_str} to {end_time_str}")
+    else:
+        st.warning("No employee activity records found for the selected date range.")
 
 # def main():
 #     try:
@@ -1,384 +1,299 @@
-import psycopg2
+import threading
+import time
+
+import numpy as np
 import pandas as pd
 import streamlit as st
 import matplotlib.pyplot as plt
 from datetime import datetime
-def show_sales_leads():
-    st.title("Sales Leads Monitoring")
-
-    db_params = {
-        'dbname': st.secrets["database"]["DB_NAME"],
-        'user': st.secrets["database"]["DB_USER"],
-        'password': st.secrets["database"]["DB_PASSWORD"],
-        'host': st.secrets["database"]["DB_HOST"],
-        'port': st.secrets["database"]["DB_PORT"]
-    }
-    fetch_max_stages_query = """
-    WITH StageHistory AS (
-        SELECT 
-            csp.client_id,
-            ROW_NUMBER() OVER (PARTITION BY csp.client_id ORDER BY csp.created_on ASC) AS stage_order
-        FROM 
-            public.client_stage_progression csp
-    )
-    SELECT MAX(stage_order) AS max_stage
-    FROM StageHistory;
-    """
 
-    # Step 2: Adjust the Data Fetch Query
-    def fetch_dynamic_stages_query(max_stage):
-        stages_select = ",\n".join(
-            [f"MAX(CASE WHEN ds.stage_number = {i} THEN ds.stage_name END) AS Data_{i}_recorded," +
-            f"MAX(CASE WHEN ds.stage_number = {i} THEN ds.time_entered_stage END) AS Time_for_data{i}_recorded"
-            for i in range(1, max_stage + 1)]
-        )
-
-        return f"""
-        WITH StageHistory AS (
-            SELECT 
-                csp.client_id,
-                c.fullname AS client_name,
-                e.fullname AS employee_name,
-                csp.current_stage,
-                csp.created_on AS time_entered_stage,
-                csp.stage_name,
-                ROW_NUMBER() OVER (PARTITION BY csp.client_id ORDER BY csp.created_on ASC) AS stage_order
-            FROM 
-                public.client_stage_progression csp
-            JOIN 
-                public.client c ON csp.client_id = c.id
-            JOIN 
-                public.employee e ON c.assigned_employee = e.id
-        ),
-        ClientTimeDiff AS (
-            SELECT 
-                client_id,
-                MIN(time_entered_stage) AS first_stage_time,
-                MAX(time_entered_stage) AS last_stage_time,
-                EXTRACT(EPOCH FROM (MAX(time_entered_stage) - MIN(time_entered_stage))) / 3600 AS time_diff_hours,
-                MAX(current_stage) AS max_stage_reached
-            FROM 
-                StageHistory
-            GROUP BY 
-                client_id
-        ),
-        DynamicStages AS (
-            SELECT
-                client_id,
-                stage_name,
-                time_entered_stage,
-                ROW_NUMBER() OVER (PARTITION BY client_id ORDER BY time_entered_stage) AS stage_number
-            FROM
-                StageHistory
-        )
-        SELECT 
-            sh.client_id,
-            CONCAT('https://services.followupboss.com/2/people/view/', sh.client_id) AS followup_boss_link,
-            sh.client_name,
-            sh.employee_name,
-            {stages_select}
-        FROM 
-            StageHistory sh
-        LEFT JOIN 
-            DynamicStages ds ON sh.client_id = ds.client_id
-        GROUP BY 
-            sh.client_id, sh.client_name, sh.employee_name
-        ORDER BY 
-            sh.client_id;
-        """
+from change_feed import table_versions, unchanged, watch_tables
+from db import fetch_arrow_frame, fetch_value, register_query
+from frame_dtypes import normalize_frame, stage_labels
+from stage_velocity import load_stage_velocity
 
-    # SQL query to calculate the average time difference for clients whose current_stage=8
-    calculate_average_time_diff_query = """
-    WITH StageHistory AS (
-        SELECT 
-            csp.client_id,
-            csp.created_on AS time_entered_stage,
-            ROW_NUMBER() OVER (PARTITION BY csp.client_id ORDER BY csp.created_on ASC) AS stage_order
-        FROM 
-            public.client_stage_progression csp
-        WHERE 
-            csp.current_stage = 8
-    ),
-    ClientTimeDiff AS (
-        SELECT 
-            client_id,
-            MIN(time_entered_stage) AS first_stage_time,
-            MAX(time_entered_stage) AS last_stage_time,
-            EXTRACT(EPOCH FROM (MAX(time_entered_stage) - MIN(time_entered_stage))) / 3600 AS time_diff_hours
-        FROM 
-            StageHistory
-        GROUP BY 
-            client_id
-    )
-    SELECT 
-        AVG(time_diff_hours) AS avg_time_diff_hours
-    FROM 
-        ClientTimeDiff;
-    """
+PAGE = "Sales Leads Monitoring"
+# Full-history analytics; served by a replica when one is configured and current
+PROFILE = 'analytics'
+# Tables whose changes make this page's cached results stale
+CHANGE_TABLES = watch_tables(PAGE, ('client', 'client_stage_progression'))
 
-    fetch_latest_stage_query = """
+fetch_max_stages_query = register_query('sales_leads_max_stages', """
+WITH StageHistory AS (
     SELECT 
         csp.client_id,
-        c.fullname AS client_name,
-        e.fullname AS employee_name,
-        CASE 
-            WHEN csp.current_stage = 2 THEN 'Stage 2: Initial Contact'
-            WHEN csp.current_stage = 3 THEN 'Stage 3: Requirement Collection'
-            WHEN csp.current_stage = 4 THEN 'Stage 4: Property Touring'
-            WHEN csp.current_stage = 5 THEN 'Stage 5: Property Tour and Feedback'
-            WHEN csp.current_stage = 6 THEN 'Stage 6: Application and Approval'
-            WHEN csp.current_stage = 7 THEN 'Stage 7: Post-Approval and Follow-Up'
-            WHEN csp.current_stage = 8 THEN 'Stage 8: Commission Collection'
-            WHEN csp.current_stage = 1 THEN 'Stage 1: Not Interested'
-            WHEN csp.current_stage = 9 THEN 'Stage 9: Dead Stage'
-            ELSE 'Unknown Stage'
-        END AS latest_stage_name
+        ROW_NUMBER() OVER (PARTITION BY csp.client_id ORDER BY csp.created_on ASC) AS stage_order
     FROM 
         public.client_stage_progression csp
-    JOIN 
-        public.client c ON csp.client_id = c.id
-    JOIN 
-        public.employee e ON c.assigned_employee = e.id
-    WHERE 
-        (csp.client_id, csp.created_on) IN (
-            SELECT client_id, MAX(created_on)
-            FROM public.client_stage_progression
-            GROUP BY client_id
-        )
-    ORDER BY 
-        csp.client_id;
-    """
+)
+SELECT MAX(stage_order) AS max_stage
+FROM StageHistory;
+""")
 
+# Step 2: Adjust the Data Fetch Query
+def fetch_dynamic_stages_query(max_stage):
+    stages_select = ",\n".join(
+        [f"MAX(CASE WHEN ds.stage_number = {i} THEN ds.stage_name END) AS Data_{i}_recorded," +
+        f"MAX(CASE WHEN ds.stage_number = {i} THEN ds.time_entered_stage END) AS Time_for_data{i}_recorded"
+        for i in range(1, max_stage + 1)]
+    )
 
-    # SQL query to fetch employee-wise client stage information
-    fetch_employee_stage_query = """
-    SELECT 
-        csp.client_id,
-        CONCAT('https://services.followupboss.com/2/people/view/', csp.client_id) AS followup_boss_link,
-        e.fullname AS employee_name,
-        c.fullname AS client_name,
-        csp.stage_name AS current_stage_name
-    FROM 
-        public.client_stage_progression csp
-    JOIN 
-        public.client c ON csp.client_id = c.id
-    JOIN 
-        public.employee e ON c.assigned_employee = e.id
-    WHERE 
-        (csp.client_id, csp.created_on) IN (
-            SELECT client_id, MAX(created_on)
-            FROM public.client_stage_progression
-            GROUP BY client_id
-        )
-    ORDER BY 
-        e.fullname, c.fullname;
-    """
-
-    # SQL query to classify clients based on the calculated average time difference
-    calculate_average_time_diff_query = """
+    return f"""
     WITH StageHistory AS (
         SELECT 
             csp.client_id,
+            c.fullname AS client_name,
+            e.fullname AS employee_name,
             csp.current_stage,
             csp.created_on AS time_entered_stage,
-            ROW_NUMBER() OVER (PARTITION BY csp.client_id ORDER BY csp.created_on DESC) AS row_num -- Ordering DESC to get the last row
+            csp.stage_name,
+            ROW_NUMBER() OVER (PARTITION BY csp.client_id ORDER BY csp.created_on ASC) AS stage_order
         FROM 
             public.client_stage_progression csp
+        JOIN 
+            public.client c ON csp.client_id = c.id
+        JOIN 
+            public.employee e ON c.assigned_employee = e.id
     ),
     ClientTimeDiff AS (
         SELECT 
             client_id,
             MIN(time_entered_stage) AS first_stage_time,
             MAX(time_entered_stage) AS last_stage_time,
-            current_stage,
-            EXTRACT(EPOCH FROM (MAX(time_entered_stage) - MIN(time_entered_stage))) / 3600 AS time_diff_hours
+            EXTRACT(EPOCH FROM (MAX(time_entered_stage) - MIN(time_entered_stage))) / 3600 AS time_diff_hours,
+            MAX(current_stage) AS max_stage_reached
         FROM 
             StageHistory
-        WHERE 
-            row_num = 1 -- Selecting only the last row for each client
         GROUP BY 
-            client_id, current_stage
-        HAVING
-            current_stage = 8 -- Ensure that the last stage is 8
-    )
-    SELECT 
-        AVG(time_diff_hours) AS avg_time_diff_hours
-    FROM 
-        ClientTimeDiff;
-    """
-
-    # SQL query to classify clients based on the calculated average time difference
-    classify_clients_query_template = """
-    WITH StageHistory AS (
-        SELECT 
-            csp.client_id,
-            csp.current_stage,
-            csp.created_on AS time_entered_stage,
-            ROW_NUMBER() OVER (PARTITION BY csp.client_id ORDER BY csp.created_on DESC) AS row_num -- Ordering DESC to get the last row
-        FROM 
-            public.client_stage_progression csp
+            client_id
     ),
-    ClientTimeDiff AS (
-        SELECT 
+    DynamicStages AS (
+        SELECT
             client_id,
-            MIN(time_entered_stage) AS first_stage_time,
-            MAX(time_entered_stage) AS last_stage_time,
-            current_stage,
-            EXTRACT(EPOCH FROM (MAX(time_entered_stage) - MIN(time_entered_stage))) / 3600 AS time_diff_hours
-        FROM 
+            stage_name,
+            time_entered_stage,
+            ROW_NUMBER() OVER (PARTITION BY client_id ORDER BY time_entered_stage) AS stage_number
+        FROM
             StageHistory
-        WHERE 
-            row_num = 1 -- Selecting only the last row for each client
-        GROUP BY 
-            client_id, current_stage
     )
     SELECT 
-        ctd.client_id,
-        c.fullname AS client_name,
-        e.fullname AS employee_name,
-        CASE 
-            WHEN ctd.current_stage = 8 AND ctd.time_diff_hours <= {avg_time_diff_hours} THEN 'NORMAL CLIENT'
-            ELSE 'NOT NORMAL CLIENT'
-        END AS client_status
+        sh.client_id,
+        CONCAT('https://services.followupboss.com/2/people/view/', sh.client_id) AS followup_boss_link,
+        sh.client_name,
+        sh.employee_name,
+        {stages_select}
     FROM 
-        ClientTimeDiff ctd
-    JOIN 
-        public.client c ON ctd.client_id = c.id
-    JOIN 
-        public.employee e ON c.assigned_employee = e.id
+        StageHistory sh
+    LEFT JOIN 
+        DynamicStages ds ON sh.client_id = ds.client_id
+    GROUP BY 
+        sh.client_id, sh.client_name, sh.employee_name
     ORDER BY 
-        ctd.client_id;
+        sh.client_id;
     """
-    def fetch_max_stage():
-        connection = None
-        cursor = None
-        try:
-            # Connect to the database
-            connection = psycopg2.connect(**db_params)
-            cursor = connection.cursor()
-            
-            # Execute the query to fetch the maximum number of stages
-            cursor.execute(fetch_max_stages_query)
-            
-            # Fetch the result (maximum stage number)
-            max_stage = cursor.fetchone()[0]
-            
-            return max_stage
-            
-        except Exception as error:
-            st.error(f"Error fetching maximum stage: {error}")
-        finally:
-            # Close the cursor and connection
-            if cursor:
-                cursor.close()
-            if connection:
-                connection.close()
-
-    def fetch_data(query):
-        connection = None
-        cursor = None
-        try:
-            # Connect to the database
-            connection = psycopg2.connect(**db_params)
-            cursor = connection.cursor()
-            
-            # Execute the query to fetch records
-            cursor.execute(query)
-            
-            # Fetch all records
-            records = cursor.fetchall()
-            
-            # Get column names from cursor
-            column_names = [desc[0] for desc in cursor.description]
-            
-            # Create a pandas DataFrame from the records
-            df = pd.DataFrame(records, columns=column_names)
-            
-            return df
-            
-        except Exception as error:
-            st.error(f"Error fetching records: {error}")
-        finally:
-            # Close the cursor and connection
-            if cursor:
-                cursor.close()
-            if connection:
-                connection.close()
-
-    def fetch_average_time_diff():
-        connection = None
-        cursor = None
-        try:
-            # Connect to the database
-            connection = psycopg2.connect(**db_params)
-            cursor = connection.cursor()
-            
-            # Execute the query to calculate average time difference
-            cursor.execute(calculate_average_time_diff_query)
-            
-            # Fetch the result (average time difference)
-            avg_time_diff = cursor.fetchone()[0]
-            
-            return avg_time_diff
-            
-        except Exception as error:
-            st.error(f"Error calculating average time difference: {error}")
-        finally:
-            # Close the cursor and connection
-            if cursor:
-                cursor.close()
-            if connection:
-                connection.close()
 
-    # Add a refresh button
-    # if st.button('Show Data / Refresh Data'):
-    # Fetch the average time difference for clients in stage 8
-    
-    st.markdown(f"**DATE: {datetime.today().strftime('%Y-%m-%d')}** (This report contains data from the last 24 hours)")
+fetch_latest_stage_query = register_query('sales_leads_latest_stage', """
+SELECT 
+    csp.client_id,
+    c.fullname AS client_name,
+    e.fullname AS employee_name,
+    csp.current_stage
+FROM 
+    public.client_stage_progression csp
+JOIN 
+    public.client c ON csp.client_id = c.id
+JOIN 
+    public.employee e ON c.assigned_employee = e.id
+WHERE 
+    (csp.client_id, csp.created_on) IN (
+        SELECT client_id, MAX(created_on)
+        FROM public.client_stage_progression
+        GROUP BY client_id
+    )
+ORDER BY 
+    csp.client_id;
+""")
+
+
+# SQL query to fetch employee-wise client stage information
+fetch_employee_stage_query = register_query('sales_leads_employee_stage', """
+SELECT 
+    csp.client_id,
+    CONCAT('https://services.followupboss.com/2/people/view/', csp.client_id) AS followup_boss_link,
+    e.fullname AS employee_name,
+    c.fullname AS client_name,
+    csp.stage_name AS current_stage_name
+FROM 
+    public.client_stage_progression csp
+JOIN 
+    public.client c ON csp.client_id = c.id
+JOIN 
+    public.employee e ON c.assigned_employee = e.id
+WHERE 
+    (csp.client_id, csp.created_on) IN (
+        SELECT client_id, MAX(created_on)
+        FROM public.client_stage_progression
+        GROUP BY client_id
+    )
+ORDER BY 
+    e.fullname, c.fullname;
+""")
+
+# Per-client time from the first to the latest progression row and the latest stage,
+# aggregated in one pass; {client_filter} limits a refresh to clients with new rows
+client_durations_template = """
+SELECT 
+    csp.client_id,
+    (ARRAY_AGG(csp.current_stage ORDER BY csp.created_on DESC))[1] AS current_stage,
+    EXTRACT(EPOCH FROM (MAX(csp.created_on) - MIN(csp.created_on))) / 3600 AS time_diff_hours,
+    MAX(csp.created_on) AS last_stage_time
+FROM 
+    public.client_stage_progression csp
+{client_filter}
+GROUP BY 
+    csp.client_id;
+"""
+
+fetch_client_durations_query = register_query(
+    'sales_leads_client_durations', client_durations_template.format(client_filter=''))
+fetch_changed_client_durations_query = register_query(
+    'sales_leads_changed_client_durations', client_durations_template.format(client_filter="""WHERE 
+    csp.client_id IN (
+        SELECT client_id
+        FROM public.client_stage_progression
+        WHERE created_on > %(since)s
+    )"""))
+
+# Rows backfilled with an older created_on are only picked up by a full reload
+DURATIONS_FULL_RELOAD_SECONDS = 24 * 3600
 
-    avg_time_diff_hours = fetch_average_time_diff()
+_durations = {'frame': None, 'watermark': None, 'loaded_at': 0.0, 'feed_version': None}
+DURATION_TABLES = ('client_stage_progression',)
+_durations_lock = threading.Lock()
 
-    max_stage = fetch_max_stage()    # Fetch data for the client stage progression report
+
+def client_durations():
+    """Cached per-client durations; refreshes only re-aggregate clients with new progression rows"""
+    with _durations_lock:
+        cached = _durations['frame']
+        versions = table_versions(DURATION_TABLES)
+        if cached is None or time.monotonic() - _durations['loaded_at'] > DURATIONS_FULL_RELOAD_SECONDS:
+            durations = fetch_arrow_frame(fetch_client_durations_query, profile=PROFILE)
+            if durations is None:
+                return cached
+            _durations['loaded_at'] = time.monotonic()
+        elif unchanged(DURATION_TABLES, _durations['feed_version']):
+            # The change feed saw no new progression rows since the last refresh
+            return cached
+        else:
+            changed = fetch_arrow_frame(fetch_changed_client_durations_query,
+                                        {'since': _durations['watermark']}, profile=PROFILE)
+            if changed is None:
+                return cached
+            durations = pd.concat([cached[~cached['client_id'].isin(changed['client_id'])], changed],
+                                  ignore_index=True)
+            print(f"{PAGE}: reclassified {len(changed)} of {len(durations)} clients")
+        if not durations.empty:
+            _durations['watermark'] = durations['last_stage_time'].max()
+        _durations['frame'], _durations['feed_version'] = durations, versions
+        return durations
+
+
+def classify_clients(durations, clients):
+    """Label clients whose latest stage is 8 and who got there no slower than the
+    stage-8 average as NORMAL CLIENT; returns the labels and that average"""
+    stage_8 = durations['current_stage'] == 8
+    avg_time_diff_hours = durations.loc[stage_8.fillna(False), 'time_diff_hours'].mean()
+    normal = (stage_8 & (durations['time_diff_hours'] <= avg_time_diff_hours)).fillna(False).astype(bool)
+    labels = pd.DataFrame({
+        'client_id': durations['client_id'].astype('int64'),
+        'client_status': np.where(normal, 'NORMAL CLIENT', 'NOT NORMAL CLIENT'),
+    })
+    # Names come from the employee stage rows, which cover the same clients
+    names = clients[['client_id', 'client_name', 'employee_name']].drop_duplicates('client_id')
+    names = names.astype({'client_id': 'int64'})
+    classified = names.merge(labels, on='client_id').sort_values('client_id', ignore_index=True)
+    return classified, avg_time_diff_hours
+
+# Rename columns to "First_Stage_Recorded", "Second_Stage_Recorded", etc.
+rename_columns = {
+    'STAGE_1_NAME': 'First_Recorded',
+    'TIME_ENTERED_STAGE_1': 'Time_Entered_First_Recorded',
+    'STAGE_2_NAME': 'Second_Recorded',
+    'TIME_ENTERED_STAGE_2': 'Time_Entered_Second_Recorded',
+    'STAGE_3_NAME': 'Third_Recorded',
+    'TIME_ENTERED_STAGE_3': 'Time_Entered_Third_Recorded',
+    'STAGE_4_NAME': 'Fourth_Recorded',
+    'TIME_ENTERED_STAGE_4': 'Time_Entered_Fourth_Recorded',
+    'STAGE_5_NAME': 'Fifth_Recorded',
+    'TIME_ENTERED_STAGE_5': 'Time_Entered_Fifth_Recorded',
+    'STAGE_6_NAME': 'Sixth_Recorded',
+    'TIME_ENTERED_STAGE_6': 'Time_Entered_Sixth_Recorded',
+    'STAGE_7_NAME': 'Seventh_Recorded',
+    'TIME_ENTERED_STAGE_7': 'Time_Entered_Seventh_Recorded',
+    'STAGE_8_NAME': 'Eighth_Recorded',
+    'TIME_ENTERED_STAGE_8': 'Time_Entered_Eighth_Recorded',
+    'STAGE_9_NAME': 'Ninth_Recorded',
+    'TIME_ENTERED_STAGE_9': 'Time_Entered_Ninth_Recorded'
+}
+
+def load_sales_leads():
+    # Fetch data for the client stage progression report
+    max_stage = fetch_value(fetch_max_stages_query, profile=PROFILE)
     dynamic_query = fetch_dynamic_stages_query(max_stage)
-    data = fetch_data(dynamic_query)
-
-    # Rename columns to "First_Stage_Recorded", "Second_Stage_Recorded", etc.
-    rename_columns = {
-        'STAGE_1_NAME': 'First_Recorded',
-        'TIME_ENTERED_STAGE_1': 'Time_Entered_First_Recorded',
-        'STAGE_2_NAME': 'Second_Recorded',
-        'TIME_ENTERED_STAGE_2': 'Time_Entered_Second_Recorded',
-        'STAGE_3_NAME': 'Third_Recorded',
-        'TIME_ENTERED_STAGE_3': 'Time_Entered_Third_Recorded',
-        'STAGE_4_NAME': 'Fourth_Recorded',
-        'TIME_ENTERED_STAGE_4': 'Time_Entered_Fourth_Recorded',
-        'STAGE_5_NAME': 'Fifth_Recorded',
-        'TIME_ENTERED_STAGE_5': 'Time_Entered_Fifth_Recorded',
-        'STAGE_6_NAME': 'Sixth_Recorded',
-        'TIME_ENTERED_STAGE_6': 'Time_Entered_Sixth_Recorded',
-        'STAGE_7_NAME': 'Seventh_Recorded',
-        'TIME_ENTERED_STAGE_7': 'Time_Entered_Seventh_Recorded',
-        'STAGE_8_NAME': 'Eighth_Recorded',
-        'TIME_ENTERED_STAGE_8': 'Time_Entered_Eighth_Recorded',
-        'STAGE_9_NAME': 'Ninth_Recorded',
-        'TIME_ENTERED_STAGE_9': 'Time_Entered_Ninth_Recorded'
-    }
+    data = fetch_arrow_frame(dynamic_query, profile=PROFILE)
 
     # Apply the renaming to the DataFrame
     if data is not None:
         data.rename(columns=rename_columns, inplace=True)
+        data = normalize_frame(data, PAGE)
+
+    # Fetch the latest stage each client is in for the summary
+    latest_stage_data = fetch_arrow_frame(fetch_latest_stage_query, profile=PROFILE)
+    if latest_stage_data is not None:
+        latest_stage_data['latest_stage_name'] = stage_labels(latest_stage_data['current_stage'])
+        latest_stage_data = normalize_frame(latest_stage_data, PAGE)
+
+    # Fetch employee-wise client stage information
+    employee_stage_data = fetch_arrow_frame(fetch_employee_stage_query, profile=PROFILE)
+
+    # Classify clients as NORMAL or NOT NORMAL against the stage 8 average, from the cached durations
+    classified_clients_data, avg_time_diff_hours = None, None
+    durations = client_durations()
+    if durations is not None and employee_stage_data is not None:
+        classified_clients_data, avg_time_diff_hours = classify_clients(durations, employee_stage_data)
+        classified_clients_data = normalize_frame(classified_clients_data, PAGE)
+    employee_stage_data = normalize_frame(employee_stage_data, PAGE)
+
+    return {
+        'history': data,
+        'latest_stage': latest_stage_data,
+        'employee_stage': employee_stage_data,
+        'classified_clients': classified_clients_data,
+        'avg_stage_8_hours': avg_time_diff_hours,
+    }
+
+def show_sales_leads():
+    st.title("Sales Leads Monitoring")
+
+    # Add a refresh button
+    # if st.button('Show Data / Refresh Data'):
+    
+    st.markdown(f"**DATE: {datetime.today().strftime('%Y-%m-%d')}** (This report contains data from the last 24 hours)")
+
+    sales_leads = load_sales_leads()
+    data = sales_leads['history']
 
     # Display the data in a Streamlit table
     if data is not None:
         st.dataframe(data)
         st.write(f"Total records fetched: {len(data)}")
 
-    # Fetch the latest stage each client is in for the summary
-    latest_stage_data = fetch_data(fetch_latest_stage_query)
+    latest_stage_data = sales_leads['latest_stage']
 
     # Display the summarized data in a table
     if latest_stage_data is not None:
-        stage_summary = latest_stage_data.groupby('latest_stage_name').size().reset_index(name='Number of Clients')
+        stage_summary = latest_stage_data.groupby('latest_stage_name', observed=True).size().reset_index(name='Number of Clients')
         st.subheader("Summary of Clients in Latest Stage")
         st.table(stage_summary)
         
@@ -392,8 +307,7 @@ def show_sales_leads():
         plt.xticks(rotation=45, ha='right')
         st.pyplot(fig)
     
-    # Fetch employee-wise client stage information
-    employee_stage_data = fetch_data(fetch_employee_stage_query)
+    employee_stage_data = sales_leads['employee_stage']
 
     if employee_stage_data is not None:
         st.subheader("Client Stages by Employee")
@@ -404,7 +318,7 @@ def show_sales_leads():
     # Create a bar chart to visualize the number of clients per employee in different stages
     st.subheader("Bar Chart of Client Stages by Employee")
     fig, ax = plt.subplots(figsize=(14, 8))  # Increase the figure size
-    employee_stage_summary = employee_stage_data.groupby(['employee_name', 'current_stage_name']).size().unstack().fillna(0)
+    employee_stage_summary = employee_stage_data.groupby(['employee_name', 'current_stage_name'], observed=True).size().unstack().fillna(0)
     employee_stage_summary.plot(kind='bar', stacked=True, ax=ax)
     ax.set_xlabel('Employee', fontsize=12)
     ax.set_ylabel('Number of Clients', fontsize=12)
@@ -413,11 +327,11 @@ def show_sales_leads():
     plt.yticks(fontsize=10)  # Adjust the font size for y-axis labels
     st.pyplot(fig)
     
-    # Classify clients as NORMAL or NOT NORMAL based on the calculated average time difference
-    classify_clients_query = classify_clients_query_template.format(avg_time_diff_hours=avg_time_diff_hours)
-    classified_clients_data = fetch_data(classify_clients_query)
+    classified_clients_data = sales_leads['classified_clients']
 
     if classified_clients_data is not None:
+        if pd.notna(sales_leads['avg_stage_8_hours']):
+            st.write(f"Average time to reach stage 8: {sales_leads['avg_stage_8_hours']:.1f} hours")
         st.subheader("NORMAL CLIENTS")
         normal_clients = classified_clients_data[classified_clients_data['client_status'] == 'NORMAL CLIENT']
         st.dataframe(normal_clients)
@@ -426,4 +340,13 @@ def show_sales_leads():
         st.subheader("NOT NORMAL CLIENTS")
         not_normal_clients = classified_clients_data[classified_clients_data['client_status'] == 'NOT NORMAL CLIENT']
         st.dataframe(not_normal_clients)
-        st.write(f"Total NOT NORMAL CLIENTS: {len(not_normal_clients)}")
\ No newline at end of file
+        st.write(f"Total NOT NORMAL CLIENTS: {len(not_normal_clients)}")
+
+    # Hours spent in each stage before moving on, from the cached stage intervals
+    velocity = load_stage_velocity()
+    if velocity['by_stage'] is not None:
+        st.subheader("Pipeline Velocity (hours in stage)")
+        by_stage_tab, by_employee_tab, by_week_tab = st.tabs(["By Stage", "By Employee", "By Week"])
+        by_stage_tab.dataframe(velocity['by_stage'], hide_index=True)
+        by_employee_tab.dataframe(velocity['by_employee'], hide_index=True)
+        by_week_tab.dataframe(velocity['by_week'], hide_index=True)
\ No newline at end of file
@@ -1,23 +1,31 @@
 import os
-import psycopg2
 import pandas as pd
 import json
 import streamlit as st
 
 from datetime import datetime, timedelta
 
+from change_feed import watch_tables
+from client_dimension import client_names
+from db import execute_query, pooled_connection, register_query
+from frame_dtypes import normalize_frame
+from history_store import read_fact, split_at_watermark
+from report_metrics import stage_transitions
+from roster import group_employees, group_ids, group_names
+
+PAGE = "Sales Rep Daily Report"
+# Full-history analytics; served by a replica when one is configured and current
+PROFILE = 'analytics'
+# Tables whose changes make this page's cached results stale
+CHANGE_TABLES = watch_tables(PAGE, ('client', 'client_stage_progression', 'textmessage'), rerun=False)
+
 ASSIGNED_MINUTES = 480
 SECONDS_PER_MESSAGE = 5
 
-db_params = {
-    'dbname': st.secrets["database"]["DB_NAME"],
-    'user': st.secrets["database"]["DB_USER"],
-    'password': st.secrets["database"]["DB_PASSWORD"],
-    'host': st.secrets["database"]["DB_HOST"],
-    'port': st.secrets["database"]["DB_PORT"]
-}
+RECORD_COLUMNS = ['timestamp', 'type', 'message', 'client_id', 'employee_name']
 
-employee_names = ['Mukund Chopra','John Green', 'Hiba Siddiqui','Travis Grey','John Reed','Joshua weller','SOVIT BISWAL', 'Emma Paul','Omar Rogers','Ruby Smith', 'Brian Baik', 'BPO Diligence']
+# Employees whose activity the report covers, in report order
+REP_GROUP = 'rep_report_reps'
 
 end_time = datetime.now()
 start_time = end_time - timedelta(days=1)
@@ -28,53 +36,19 @@ end_time_str = end_time.strftime('%Y-%m-%d %H:%M:%S')
 print(f"Start time: {start_time_str}")
 print(f"End time: {end_time_str}")
 
-fetch_client_ids_query = """
-SELECT DISTINCT c.id AS client_id, c.fullname AS client_name
-FROM
-(
-    SELECT
-        t.client_id
-    FROM
-        textmessage t
-    JOIN
-        employee e ON t.created_by = e.id
-    WHERE
-        t.created >= NOW() - INTERVAL '1 month'
-    AND e.fullname = ANY(%s)
-
-    UNION
-
-    SELECT
-        ol.client_id
-    FROM
-        openphone_log ol
-    JOIN
-        employee e ON ol.from_ = e.phone
-    WHERE
-        ol.created_at_parsed >= NOW() - INTERVAL '1 month'
-    AND ol.direction = 'outgoing'
-    AND e.fullname = ANY(%s)
-) as combined
-JOIN
-    public.client c ON combined.client_id = c.id
-ORDER BY client_id;
-"""
-
-fetch_records_query_template = f"""
+records_query = register_query('rep_report_activity', """
 (
     SELECT
         to_char(t.created, 'YYYY-MM-DD HH24:MI:SS') AS timestamp,
         'text_created' AS type,
         t.message AS message,
         t.client_id,
-        e.fullname AS employee_name
+        t.created_by AS employee_id
     FROM
         textmessage t
-    JOIN
-        employee e ON t.created_by = e.id
     WHERE
-        e.fullname = %s
-        AND t.created BETWEEN '{start_time_str}' AND '{end_time_str}'
+        t.created_by = %(employee_id)s
+        AND t.created BETWEEN %(start_time)s AND %(end_time)s
 )
 UNION ALL
 (
@@ -83,14 +57,12 @@ UNION ALL
         'call_created' AS type,
         NULL AS message,
         ol.client_id,
-        e.fullname AS employee_name
+        ol.employee_id
     FROM
         openphone_log ol
-    JOIN
-        employee e ON ol.from_ = e.phone
     WHERE
-        e.fullname = %s
-        AND ol.created_at_parsed BETWEEN '{start_time_str}' AND '{end_time_str}'
+        ol.employee_id = %(employee_id)s
+        AND ol.created_at_parsed BETWEEN %(start_time)s AND %(end_time)s
         AND ol.direction = 'outgoing'
 )
 UNION ALL
@@ -100,37 +72,23 @@ UNION ALL
         'call_completed' AS type,
         NULL AS message,
         ol.client_id,
-        e.fullname AS employee_name
+        ol.employee_id
     FROM
         openphone_log ol
-    JOIN
-        employee e ON ol.from_ = e.phone
     WHERE
-        e.fullname = %s
-        AND ol.completed_at_parsed BETWEEN '{start_time_str}' AND '{end_time_str}'
+        ol.employee_id = %(employee_id)s
+        AND ol.completed_at_parsed BETWEEN %(start_time)s AND %(end_time)s
         AND ol.direction = 'outgoing'
 )
 ORDER BY
     client_id, timestamp;
-"""
+""")
 
-sql_query = f"""
+sql_query = register_query('rep_report_stage_progression', """
 SELECT
     csp.id,
     csp.client_id,
     c.fullname,
-    CASE
-        WHEN csp.current_stage = 1 THEN 'Stage 1: Not Interested'
-        WHEN csp.current_stage = 2 THEN 'Stage 2: Initial Contact'
-        WHEN csp.current_stage = 3 THEN 'Stage 3: Requirement Collection'
-        WHEN csp.current_stage = 4 THEN 'Stage 4: Property Touring'
-        WHEN csp.current_stage = 5 THEN 'Stage 5: Property Tour and Feedback'
-        WHEN csp.current_stage = 6 THEN 'Stage 6: Application and Approval'
-        WHEN csp.current_stage = 7 THEN 'Stage 7: Post-Approval and Follow-Up'
-        WHEN csp.current_stage = 8 THEN 'Stage 8: Commission Collection'
-        WHEN csp.current_stage = 9 THEN 'Stage 9: Dead Stage'
-        ELSE 'Unknown Stage'
-    END AS stage_name,
     csp.current_stage,
     csp.created_on,
     c.assigned_employee,
@@ -142,90 +100,83 @@ JOIN
 ON
     csp.client_id = c.id
 WHERE
-    csp.created_on BETWEEN '{start_time_str}' AND '{end_time_str}'
+    csp.created_on BETWEEN %(start_time)s AND %(end_time)s
 ORDER BY
     csp.created_on;
-"""
-
+""")
 
-def employee_record(name, df):
-    temp = df[df['assigned_employee_name'] == name]
 
-    result_df = temp.groupby('fullname')[['current_stage', 'stage_name']].agg(['min', 'max']).reset_index()
-    result_df.columns = ['Client', 'min_current_stage', 'max_current_stage', 'min_stage_name', 'max_stage_name']
-    result_df['change'] = result_df['max_current_stage'] - result_df['min_current_stage']
-    result_df['Previous Stage'] = result_df['min_current_stage'].astype(str) + ': ' + result_df['min_stage_name'].apply(lambda x: x.split(':')[1] if ':' in x else x)
-    result_df['Current Stage'] = result_df['max_current_stage'].astype(str) + ': ' + result_df['max_stage_name'].apply(lambda x: x.split(':')[1] if ':' in x else x)
-    result_df['Previous Stage'] = result_df['Previous Stage'].apply(lambda x: x.split(' - ')[0])
-    result_df['Current Stage'] = result_df['Current Stage'].apply(lambda x: x.split(' - ')[0])
-    result_df = result_df.drop(columns=['min_current_stage', 'max_current_stage', 'min_stage_name', 'max_stage_name','change'])
-    return result_df
-
-def fetch_client_ids_and_names():
-    connection = None
-    cursor = None
-    try:
-        connection = psycopg2.connect(**db_params)
-        cursor = connection.cursor()
-        cursor.execute(fetch_client_ids_query, (employee_names, employee_names))
-        client_data = cursor.fetchall()
-        df = pd.DataFrame(client_data, columns=['client_id', 'client_name'])
-        print("Client IDs and names have been loaded into a DataFrame")
-        return df
-    except Exception as error:
-        print(f"Error fetching client data: {error}")
-        return None
-    finally:
-        if cursor:
-            cursor.close()
-        if connection:
-            connection.close()
+def fetch_history_records(start_datetime, end_datetime):
+    """Text and OpenPhone records for finished days, read from the local Parquet history"""
+    employee_ids = group_ids(REP_GROUP)
+    texts = read_fact('textmessage', start_datetime, end_datetime,
+                      ['created', 'message', 'client_id', 'employee_name'], employee_ids=employee_ids)
+    texts = texts.rename(columns={'created': 'time'}).assign(type='text_created')
+    created = read_fact('openphone_log', start_datetime, end_datetime,
+                        ['created_at_parsed', 'client_id', 'employee_name'], employee_ids=employee_ids)
+    created = created.rename(columns={'created_at_parsed': 'time'}).assign(type='call_created', message=None)
+    completed = read_fact('openphone_log', start_datetime, end_datetime,
+                          ['completed_at_parsed', 'client_id', 'employee_name'], employee_ids=employee_ids,
+                          time_column='completed_at_parsed', lookback_days=1)
+    completed = completed.rename(columns={'completed_at_parsed': 'time'}).assign(type='call_completed', message=None)
+    df = pd.concat([texts, created, completed], ignore_index=True)
+    df['timestamp'] = df['time'].dt.strftime('%Y-%m-%d %H:%M:%S')
+    return df[RECORD_COLUMNS]
 
 def fetch_and_save_records_to_csv():
-    connection = None
-    cursor = None
+    # Finished days come from the history store, only the rest from production
+    history_range, live_range = split_at_watermark(('textmessage', 'openphone_log'), start_time, end_time)
+    frames = []
+    if history_range:
+        frames.append(fetch_history_records(*history_range))
+    if live_range:
+        live = fetch_live_records(*(bound.strftime('%Y-%m-%d %H:%M:%S') for bound in live_range))
+        if live is None:
+            return None
+        frames.append(live)
+    if not history_range:
+        return frames[0]
+    # Same order as the per-employee live queries; call durations pair adjacent rows
+    df = pd.concat(frames, ignore_index=True)
+    df['employee_order'] = df['employee_name'].map({name: i for i, name in enumerate(group_names(REP_GROUP))})
+    df = df.sort_values(['employee_order', 'client_id', 'timestamp'], ignore_index=True)
+    return df.drop(columns='employee_order')
+
+def fetch_live_records(start_time_str, end_time_str):
     all_records = []
+    # Resolved before borrowing a connection; the roster may need one of its own
+    employees = group_employees(REP_GROUP)
     try:
-        connection = psycopg2.connect(**db_params)
-        cursor = connection.cursor()
-        for name in employee_names:
-            cursor.execute(fetch_records_query_template, (name, name, name))
-            records = cursor.fetchall()
-            all_records.extend(records)
-        df = pd.DataFrame(all_records, columns=['timestamp', 'type', 'message', 'client_id', 'employee_name'])
-        print("Employee records have been loaded into a DataFrame")
-        return df
+        with pooled_connection(PROFILE) as connection, connection.cursor() as cursor:
+            # One prepared statement, executed once per employee
+            for employee_id in employees['id'].tolist():
+                execute_query(cursor, records_query,
+                              {'employee_id': employee_id, 'start_time': start_time_str, 'end_time': end_time_str})
+                records = cursor.fetchall()
+                all_records.extend(records)
+            df = pd.DataFrame(all_records, columns=RECORD_COLUMNS[:-1] + ['employee_id'])
+            # Names come from the roster rather than a join in every query
+            df['employee_name'] = df.pop('employee_id').map(dict(zip(employees['id'], employees['fullname'])))
+            print("Employee records have been loaded into a DataFrame")
+            return df
     except Exception as error:
         print(f"Error fetching records: {error}")
         return None
-    finally:
-        if cursor:
-            cursor.close()
-        if connection:
-            connection.close()
 
-def run_query_and_save_to_csv(sql_query):
-    connection = None
-    cursor = None
+def run_query_and_save_to_csv(sql_query, params=None):
     try:
-        connection = psycopg2.connect(**db_params)
-        cursor = connection.cursor()
-        cursor.execute(sql_query)
-        records = cursor.fetchall()
-        column_names = [desc[0] for desc in cursor.description]
-        df = pd.DataFrame(records, columns=column_names)
-        print("Query executed and results loaded into a DataFrame")
-        return df
+        with pooled_connection(PROFILE) as connection, connection.cursor() as cursor:
+            execute_query(cursor, sql_query, params)
+            records = cursor.fetchall()
+            column_names = [desc[0] for desc in cursor.description]
+            df = pd.DataFrame(records, columns=column_names)
+            print("Query executed and results loaded into a DataFrame")
+            return df
     except Exception as error:
         print(f"Error running query: {error}")
         return None
-    finally:
-        if cursor:
-            cursor.close()
-        if connection:
-            connection.close()
 
-def add_employee_report(employee_name, df, df5):
+def add_employee_report(employee_name, df, employee_df=None):
     st.header(f'Report for {employee_name}')
     total_calls = df[df['employee_name'] == employee_name]['call_duration'].count()
     if total_calls > 0:
@@ -250,26 +201,22 @@ def add_employee_report(employee_name, df, df5):
     num_clients = len(unique_clients)
     if num_clients > 0:
         st.write(f'Number of Clients Handled: {num_clients}')
-    employee_df = employee_record(employee_name, df5)
-    if not employee_df.empty:
+    if employee_df is not None and not employee_df.empty:
         st.write("Employee Records:")
         st.dataframe(employee_df)
 
 def generate_combined_streamlit_report(df, df5):
     st.title('Combined Employee Report')
     employee_names = df['employee_name'].unique()
+    transitions = stage_transitions(df5)
     for employee_name in employee_names:
-        add_employee_report(employee_name, df, df5)
+        add_employee_report(employee_name, df, transitions.get(employee_name))
         
-def show_sales_rep_daily_report():
-    df5 = run_query_and_save_to_csv(sql_query)
+def load_sales_rep_report():
+    df5 = run_query_and_save_to_csv(sql_query, {'start_time': start_time_str, 'end_time': end_time_str})
     df5 = df5.drop_duplicates(subset=['client_id', 'current_stage'])
     df5 = df5[df5['current_stage'] != 9]
-
-    client_ids = {}
-    df = fetch_client_ids_and_names()
-    for index, row in df.iterrows():
-        client_ids[row['client_id']] = row['client_name']
+    df5 = normalize_frame(df5, PAGE)
 
     df = fetch_and_save_records_to_csv()
     df.drop('message', axis=1, inplace=True)
@@ -286,7 +233,8 @@ def show_sales_rep_daily_report():
             duration = end_unix - start_unix
             df.loc[i, 'call_duration'] = duration
 
-    df['client_name'] = df['client_id'].map(client_ids)
+    labels = client_names(df['client_id'])
+    df['client_name'] = labels
     df = df[df['type'] != 'call_completed']
     
     # Ensure call_duration column is handled properly
@@ -297,5 +245,13 @@ def show_sales_rep_daily_report():
             df.loc[index, 'call_duration'] = df[df['employee_name'] == row['employee_name']]['call_duration'].mean()
 
     df.drop('time_stamp', axis=1, inplace=True)
+    df = normalize_frame(df, PAGE)
+
+    return {'stage_progression': df5, 'activity': df, 'client_names': labels}
 
-    generate_combined_streamlit_report(df, df5)
+def show_sales_rep_daily_report():
+    data = load_sales_rep_report()
+    if data['client_names'] is None:
+        st.error("Failed to fetch client data.")
+        return
+    generate_combined_streamlit_report(data['activity'], data['stage_progression'])
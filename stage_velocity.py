@@ -0,0 +1,174 @@
+"""Time-in-stage distributions from the client stage history.
+
+A client's time in a stage runs from the progression row that entered it to the
+next row that moved the client to a different stage. Intervals are computed
+with NumPy diffs over the history sorted by client and time; only closed
+intervals count, so a client's current stage does not skew the numbers.
+
+The intervals are cached in the process. A refresh fetches only rows newer
+than the watermark and continues each affected client from its last open row.
+"""
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from change_feed import table_versions, unchanged
+from db import fetch_arrow_frame, register_query
+from frame_dtypes import normalize_frame, stage_labels
+from range_cache import CST
+
+PAGE = "Sales Leads Monitoring"
+PROFILE = 'analytics'
+CHANGE_TABLES = ('client_stage_progression',)
+
+PERCENTILES = {'p50': 0.5, 'p90': 0.9, 'p99': 0.99}
+US_PER_HOUR = 3600 * 1_000_000
+US_PER_DAY = 24 * US_PER_HOUR
+
+# Rows backfilled with an older created_on are only picked up by a full reload
+FULL_RELOAD_SECONDS = 24 * 3600
+
+# Employees are the clients' current assignees, as on the other pages
+stage_history_template = """
+SELECT
+    csp.client_id,
+    e.fullname AS employee_name,
+    csp.current_stage AS stage,
+    csp.created_on AS entered_at
+FROM
+    public.client_stage_progression csp
+JOIN
+    public.client c ON csp.client_id = c.id
+LEFT JOIN
+    public.employee e ON c.assigned_employee = e.id
+{row_filter};
+"""
+
+fetch_stage_history_query = register_query(
+    'stage_velocity_history', stage_history_template.format(row_filter=''))
+fetch_new_stage_history_query = register_query(
+    'stage_velocity_new_history', stage_history_template.format(row_filter="""WHERE
+    csp.created_on > %(since)s"""))
+
+HISTORY_COLUMNS = ['client_id', 'employee_name', 'stage', 'entered_at']
+
+_velocity = {'intervals': None, 'open_rows': None, 'watermark': None, 'loaded_at': 0.0, 'feed_version': None}
+_velocity_lock = threading.Lock()
+
+
+def _epoch_us(series):
+    """Microseconds since the epoch, in UTC for tz-aware columns"""
+    values = series.array.__arrow_array__() if isinstance(series.dtype, pd.ArrowDtype) else pa.Array.from_pandas(series)
+    return values.cast(pa.timestamp('us')).cast(pa.int64()).to_numpy(zero_copy_only=False)
+
+
+def stage_intervals(history):
+    """Split a stage history into closed time-in-stage intervals and each client's open row.
+
+    history has client_id, employee_name, stage and entered_at columns. Returns
+    (intervals, open_rows); intervals add an hours column.
+    """
+    history = history.dropna(subset=['client_id', 'entered_at'])
+    clients = history['client_id'].to_numpy(dtype='int64')
+    entered = _epoch_us(history['entered_at'])
+    stages = history['stage'].to_numpy(dtype='float64', na_value=np.nan)
+    order = np.lexsort((entered, clients))
+    clients, entered, stages = clients[order], entered[order], stages[order]
+    rows = history.iloc[order].reset_index(drop=True)
+
+    # Repeated rows for the same stage continue the stay that started at the first one
+    new_client = np.r_[True, clients[1:] != clients[:-1]]
+    starts = new_client | np.r_[True, stages[1:] != stages[:-1]]
+    rows, clients, entered = rows[starts].reset_index(drop=True), clients[starts], entered[starts]
+
+    # A stay ends when the next stay of the same client starts
+    closed = np.r_[clients[1:] == clients[:-1], False]
+    hours = np.diff(entered, append=0) / US_PER_HOUR
+
+    intervals = rows[closed].reset_index(drop=True)
+    intervals['hours'] = hours[closed]
+    return intervals, rows[~closed].reset_index(drop=True)
+
+
+def _refresh():
+    versions = table_versions(CHANGE_TABLES)
+    if _velocity['intervals'] is None or time.monotonic() - _velocity['loaded_at'] > FULL_RELOAD_SECONDS:
+        history = fetch_arrow_frame(fetch_stage_history_query, profile=PROFILE)
+        if history is None:
+            return
+        intervals, open_rows = stage_intervals(history)
+        fetched = history
+        _velocity['loaded_at'] = time.monotonic()
+    elif unchanged(CHANGE_TABLES, _velocity['feed_version']):
+        return
+    else:
+        new_rows = fetch_arrow_frame(fetch_new_stage_history_query, {'since': _velocity['watermark']},
+                                     profile=PROFILE)
+        if new_rows is None:
+            return
+        if new_rows.empty:
+            _velocity['feed_version'] = versions
+            return
+        previous_open = _velocity['open_rows']
+        touched = previous_open['client_id'].isin(new_rows['client_id'])
+        # Only the clients with new rows are re-split, starting from their open row
+        new_intervals, new_open = stage_intervals(
+            pd.concat([previous_open.loc[touched, HISTORY_COLUMNS], new_rows[HISTORY_COLUMNS]], ignore_index=True))
+        intervals = pd.concat([_velocity['intervals'], new_intervals], ignore_index=True)
+        open_rows = pd.concat([previous_open[~touched], new_open], ignore_index=True)
+        fetched = new_rows
+        print(f"stage velocity: {len(new_rows)} new rows, {len(new_intervals)} new intervals")
+    if not fetched.empty:
+        _velocity['watermark'] = fetched['entered_at'].max()
+    _velocity['intervals'], _velocity['open_rows'] = intervals, open_rows
+    _velocity['feed_version'] = versions
+
+
+def time_in_stage_intervals():
+    """Cached closed intervals, refreshed with the rows added since the last call"""
+    with _velocity_lock:
+        _refresh()
+        return _velocity['intervals']
+
+
+def stage_percentiles(intervals, by=()):
+    """Count and p50/p90/p99 hours in stage for each stage, optionally split by more columns"""
+    keys = list(by) + ['stage']
+    grouped = intervals.groupby(keys, observed=True, sort=True)['hours']
+    summary = grouped.quantile(list(PERCENTILES.values())).unstack()
+    summary.columns = list(PERCENTILES)
+    summary.insert(0, 'count', grouped.size())
+    summary = summary.reset_index()
+    summary.insert(len(keys), 'stage_name', stage_labels(summary['stage']))
+    return summary
+
+
+def week_start(entered_at, tz=None):
+    """Monday of each timestamp's week, computed on epoch days.
+
+    tz is the fixed-offset zone the weeks are counted in, for UTC timestamps;
+    without it the timestamps are taken as already in report time.
+    """
+    local_us = _epoch_us(entered_at)
+    if tz is not None:
+        local_us = local_us + int(tz.utcoffset(None).total_seconds()) * 1_000_000
+    days = local_us // US_PER_DAY
+    # 1970-01-01 was a Thursday, three days after a Monday
+    return pd.Series((days - (days + 3) % 7).astype('datetime64[D]'), index=entered_at.index, name='week')
+
+
+def load_stage_velocity():
+    intervals = time_in_stage_intervals()
+    if intervals is None:
+        return {'by_stage': None, 'by_employee': None, 'by_week': None}
+    intervals = intervals.copy()
+    # Weeks run Monday to Sunday in CST, like the cohort weeks and the range cache's days
+    intervals['week'] = week_start(intervals['entered_at'], tz=CST)
+    return {
+        'by_stage': normalize_frame(stage_percentiles(intervals), PAGE),
+        'by_employee': normalize_frame(stage_percentiles(intervals, by=['employee_name']), PAGE),
+        'by_week': normalize_frame(stage_percentiles(intervals, by=['week']), PAGE),
+    }
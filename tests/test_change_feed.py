@@ -0,0 +1,112 @@
+"""Feed-driven reruns, with the listener replaced by direct version bumps."""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import change_feed  # noqa: E402
+
+CACHED_PAGE = "Test Cached Page"
+UNCACHED_PAGE = "Test Uncached Page"
+
+
+@pytest.fixture
+def feed(monkeypatch):
+    # Stand-in for the LISTEN thread: versions are bumped by calling mark_changed directly
+    monkeypatch.setattr(change_feed, 'expire_tables', lambda tables: None)
+    monkeypatch.setattr(change_feed, '_versions', change_feed.Counter())
+    monkeypatch.setattr(change_feed, '_page_tables', {})
+    monkeypatch.setattr(change_feed, '_rerun_pages', set())
+    change_feed.watch_tables(CACHED_PAGE, ('client', 'textmessage'))
+    change_feed.watch_tables(UNCACHED_PAGE, ('client', 'textmessage'), rerun=False)
+    change_feed._listening.set()
+    yield change_feed
+    change_feed._listening.clear()
+
+
+def test_cached_page_reruns_after_a_change(feed):
+    seen = feed.page_versions(CACHED_PAGE)
+    assert not feed.should_rerun(CACHED_PAGE, seen, last_rerun=float('-inf'))
+    feed.mark_changed({'textmessage'})
+    assert feed.should_rerun(CACHED_PAGE, seen, last_rerun=float('-inf'))
+
+
+def test_unrelated_table_does_not_rerun(feed):
+    seen = feed.page_versions(CACHED_PAGE)
+    feed.mark_changed({'client_stage_progression'})
+    assert not feed.should_rerun(CACHED_PAGE, seen, last_rerun=float('-inf'))
+
+
+def test_uncached_page_is_never_rerun_by_the_feed(feed):
+    seen = feed.page_versions(UNCACHED_PAGE)
+    feed.mark_changed({'textmessage'})
+    assert not feed.reruns_on_change(UNCACHED_PAGE)
+    assert not feed.should_rerun(UNCACHED_PAGE, seen, last_rerun=float('-inf'))
+
+
+def test_steady_changes_are_coalesced(feed):
+    seen = feed.page_versions(CACHED_PAGE)
+    last_rerun = 1000.0
+    for offset in range(0, feed.MIN_RERUN_SECONDS, 60):
+        feed.mark_changed({'textmessage'})
+        assert not feed.should_rerun(CACHED_PAGE, seen, last_rerun, now=last_rerun + offset)
+    # The held-back changes still rerun the page once the interval has passed
+    assert feed.should_rerun(CACHED_PAGE, seen, last_rerun, now=last_rerun + feed.MIN_RERUN_SECONDS)
+
+
+def test_no_reruns_while_the_feed_is_down(feed):
+    seen = feed.page_versions(CACHED_PAGE)
+    feed.mark_changed({'client'})
+    feed._listening.clear()
+    assert not feed.should_rerun(CACHED_PAGE, seen, last_rerun=float('-inf'))
+
+
+class FakeNotify:
+    def __init__(self, payload):
+        self.payload = payload
+
+
+class FakeListenConnection:
+    """Delivers one batch of notifications, then stops the listen loop"""
+
+    def __init__(self, payloads):
+        self.notifies = []
+        self._payloads = payloads
+        self.polls = 0
+
+    def cursor(self):
+        connection = self
+
+        class Cursor:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                return False
+
+            def execute(self, sql):
+                connection.listened = sql
+
+        return Cursor()
+
+    def poll(self):
+        self.polls += 1
+        if self.polls > 1:
+            raise OSError("connection closed")
+        self.notifies.extend(FakeNotify(payload) for payload in self._payloads)
+
+
+def test_malformed_payloads_are_skipped(feed, monkeypatch):
+    monkeypatch.setattr(change_feed.select, 'select', lambda *args: ([True], [], []))
+    connection = FakeListenConnection(['not json', '{"op": "INSERT"}', '[1, 2]', 'null',
+                                       '{"table": "textmessage", "op": "INSERT"}'])
+    before = feed.table_versions(('textmessage', 'client'))
+    # The loop ends on the fake's second poll, as it would on a dropped connection
+    with pytest.raises(OSError):
+        feed._listen(connection)
+    after = feed.table_versions(('textmessage', 'client'))
+    # The reconnect bump marks every table once; the good payload bumps textmessage again
+    assert after[0] == before[0] + 2
+    assert after[1] == before[1] + 1
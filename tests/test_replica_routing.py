@@ -0,0 +1,109 @@
+"""Profile routing, with the replica lag query answered by a fake pool."""
+import os
+import sys
+import threading
+from types import SimpleNamespace
+
+import psycopg2
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+
+SECRETS = {'database': {'DB_PORT': 5432}, 'replica': {'DB_PORT': 5433}}
+
+
+class FakeCursor:
+    def __init__(self, lag):
+        self.lag = lag
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query):
+        if isinstance(self.lag, Exception):
+            raise self.lag
+
+    def fetchone(self):
+        return (self.lag,)
+
+
+class FakeConnection:
+    closed = 0
+    autocommit = False
+
+    def __init__(self, lag):
+        self.lag = lag
+
+    def cursor(self):
+        return FakeCursor(self.lag)
+
+
+class FakePool:
+    def __init__(self, lag):
+        self.lag = lag
+        self.slots = threading.BoundedSemaphore(1)
+        self.returned = 0
+
+    def getconn(self):
+        return FakeConnection(self.lag)
+
+    def putconn(self, connection, close=False):
+        self.returned += 1
+
+
+@pytest.fixture
+def routing(monkeypatch):
+    # Answers the lag query for the analytics replica; set pools['replica'].lag per test
+    pools = {'replica': FakePool(0)}
+
+    def get_pool(profile, target):
+        if target not in pools:
+            raise AssertionError(f"only the replica should be checked, got {target}")
+        return pools[target]
+
+    monkeypatch.setattr(db, 'st', SimpleNamespace(secrets=SECRETS))
+    monkeypatch.setattr(db, 'get_pool', get_pool)
+    monkeypatch.setattr(db, '_lag_checks', {})
+    return pools
+
+
+def test_current_replica_serves_analytics(routing):
+    assert db.route('analytics') == 'replica'
+    assert routing['replica'].returned == 1
+
+
+def test_lagging_replica_falls_back_to_primary(routing):
+    routing['replica'].lag = db.CONNECTION_PROFILES['analytics']['max_lag_seconds'] + 60
+    assert db.route('analytics') == db.PRIMARY_TARGET
+
+
+def test_unreachable_replica_falls_back_to_primary(routing):
+    routing['replica'].lag = psycopg2.OperationalError("could not connect to server")
+    assert db.route('analytics') == db.PRIMARY_TARGET
+    assert db.replica_lag('analytics', 'replica') == float('inf')
+    # The connection went back to the pool even though the query failed
+    assert routing['replica'].returned == 1
+
+
+def test_lag_is_rechecked_only_after_it_expires(routing, monkeypatch):
+    assert db.route('analytics') == 'replica'
+    routing['replica'].lag = 600
+    assert db.route('analytics') == 'replica'
+    expired = db._lag_checks['replica'][1] - db.LAG_CHECK_SECONDS - 1
+    monkeypatch.setitem(db._lag_checks, 'replica', (0, expired))
+    assert db.route('analytics') == db.PRIMARY_TARGET
+
+
+def test_replica_missing_from_secrets_routes_to_primary(routing, monkeypatch):
+    monkeypatch.setattr(db, 'st', SimpleNamespace(secrets={'database': SECRETS['database']}))
+    assert db.route('analytics') == db.PRIMARY_TARGET
+
+
+def test_primary_profile_never_checks_a_replica(routing):
+    assert db.route('primary') == db.PRIMARY_TARGET
+    assert routing['replica'].returned == 0
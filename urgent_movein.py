@@ -1,35 +1,20 @@
 import streamlit as st
-import psycopg2
 import pandas as pd
 from datetime import datetime, timedelta
 
-def show_clients_with_urgent_movein():
-    st.title("Responsive Clients")
-
-    db_params = {
-        'dbname': st.secrets["database"]["DB_NAME"],
-        'user': st.secrets["database"]["DB_USER"],
-        'password': st.secrets["database"]["DB_PASSWORD"],
-        'host': st.secrets["database"]["DB_HOST"],
-        'port': st.secrets["database"]["DB_PORT"]
-    }
-
-    # Date input to select a start and end date
-    st.subheader("Select Date Range for Client Records")
-    start_date = st.date_input("Start Date", datetime.now().date() - timedelta(days=1))
-    end_date = st.date_input("End Date", datetime.now().date())
+from change_feed import watch_tables
+from db import fetch_frame, register_query
+from frame_dtypes import normalize_frame
+from range_cache import cached_days
 
-    # Convert dates to datetime format with start and end of the day
-    start_datetime = datetime.combine(start_date, datetime.min.time())
-    end_datetime = datetime.combine(end_date, datetime.max.time())
+PAGE = "Clients With Move in Date"
+# Short recent ranges; read from the primary
+PROFILE = 'primary'
+# Tables whose changes make this page's cached results stale
+CHANGE_TABLES = watch_tables(PAGE, ('client', 'textmessage'))
 
-    # Define the current date and thresholds for move-in dates
-    current_date = pd.Timestamp(datetime.now().date())  # Convert current_date to Timestamp
-    thirty_days_later = current_date + pd.Timedelta(days=30)
-    sixty_days_later = current_date + pd.Timedelta(days=60)
-
-    # Updated query to fetch responsive clients with beds, baths, "Calls" column, and move-in filters
-    fetch_responsive_clients_query = f"""
+# Updated query to fetch responsive clients with beds, baths, "Calls" column, and move-in filters
+responsive_clients_query = register_query('urgent_movein_clients', """
     WITH clients_created_today AS (
         SELECT 
             c.id AS client_id,
@@ -37,6 +22,7 @@ def show_clients_with_urgent_movein():
             e.fullname AS assigned_employee_name,
             c.fphone1 AS phone_number,
             c.fullname AS client_name,
+            c.created AT TIME ZONE 'UTC' AT TIME ZONE 'CST' AS created_at,
             r.move_in_date AS move_in_date,
             r.budget AS budget,
             r.beds AS beds,
@@ -53,8 +39,8 @@ def show_clients_with_urgent_movein():
         LEFT JOIN 
             public.employee e ON c.assigned_employee = e.id
         WHERE 
-            c.created >= '{start_datetime}'::timestamp AT TIME ZONE 'CST'
-            AND c.created <= '{end_datetime}'::timestamp AT TIME ZONE 'CST'
+            c.created >= %(start_datetime)s::timestamp AT TIME ZONE 'CST'
+            AND c.created <= %(end_datetime)s::timestamp AT TIME ZONE 'CST'
     ),
     clients_with_received_status AS (
         SELECT DISTINCT 
@@ -79,6 +65,7 @@ def show_clients_with_urgent_movein():
         c.city,
         c.state,
         c.street,
+        c.created_at,
         CASE 
             WHEN EXISTS (
                 SELECT 1 
@@ -95,27 +82,43 @@ def show_clients_with_urgent_movein():
         c.move_in_date IS NOT NULL
     ORDER BY 
         c.move_in_date ASC;
-    """
+""")
+
+def fetch_clients_range(first_day, last_day):
+    # Convert dates to datetime format with start and end of the day
+    start_datetime = datetime.combine(first_day, datetime.min.time())
+    end_datetime = datetime.combine(last_day, datetime.max.time())
+    return fetch_frame(responsive_clients_query, {'start_datetime': start_datetime, 'end_datetime': end_datetime}, profile=PROFILE)
+
+def load_urgent_movein_clients(start_date, end_date):
+    # Define the current date and thresholds for move-in dates
+    current_date = pd.Timestamp(datetime.now().date())  # Convert current_date to Timestamp
+    thirty_days_later = current_date + pd.Timedelta(days=30)
+    sixty_days_later = current_date + pd.Timedelta(days=60)
+
+    # Only days missing from the per-day cache are queried
+    responsive_clients_data = cached_days('urgent_movein_clients', start_date, end_date, fetch_clients_range, 'created_at', tables=CHANGE_TABLES)
+    if responsive_clients_data is None:
+        return {'asap_movein': None, 'movein_30_60_days': None}
+    if not responsive_clients_data.empty:
+        responsive_clients_data = responsive_clients_data.sort_values('move_in_date', kind='stable', ignore_index=True)
+    responsive_clients_data = normalize_frame(responsive_clients_data, PAGE)
+
+    move_in_dates = pd.to_datetime(responsive_clients_data['move_in_date'])
+    return {
+        # Filter for ASAP move-in (within 30 days)
+        'asap_movein': responsive_clients_data[(move_in_dates >= current_date) & (move_in_dates < thirty_days_later)],
+        # Filter for move-in between 30 and 60 days
+        'movein_30_60_days': responsive_clients_data[(move_in_dates >= thirty_days_later) & (move_in_dates <= sixty_days_later)],
+    }
+
+def show_clients_with_urgent_movein():
+    st.title("Responsive Clients")
 
-    def fetch_data(query):
-        connection = None
-        cursor = None
-        try:
-            connection = psycopg2.connect(**db_params)
-            cursor = connection.cursor()
-            cursor.execute(query)
-            records = cursor.fetchall()
-            column_names = [desc[0] for desc in cursor.description]
-            df = pd.DataFrame(records, columns=column_names)
-            return df
-        except Exception as error:
-            st.error(f"Error fetching records: {error}")
-            return None
-        finally:
-            if cursor:
-                cursor.close()
-            if connection:
-                connection.close()
+    # Date input to select a start and end date
+    st.subheader("Select Date Range for Client Records")
+    start_date = st.date_input("Start Date", datetime.now().date() - timedelta(days=1))
+    end_date = st.date_input("End Date", datetime.now().date())
 
     def display_clients_as_table(title, df):
         st.subheader(title)
@@ -132,21 +135,9 @@ def show_clients_with_urgent_movein():
             st.write(df.to_html(escape=False), unsafe_allow_html=True)
 
     # Fetch the data
-    responsive_clients_data = fetch_data(fetch_responsive_clients_query)
-
-    # Filter for ASAP move-in (within 30 days)
-    if responsive_clients_data is not None:
-        asap_movein_clients = responsive_clients_data[
-            (pd.to_datetime(responsive_clients_data['move_in_date']) >= current_date) &
-            (pd.to_datetime(responsive_clients_data['move_in_date']) < thirty_days_later)
-        ]
-
-        # Filter for move-in between 30 and 60 days
-        thirty_to_sixty_days_clients = responsive_clients_data[
-            (pd.to_datetime(responsive_clients_data['move_in_date']) >= thirty_days_later) &
-            (pd.to_datetime(responsive_clients_data['move_in_date']) <= sixty_days_later)
-        ]
+    data = load_urgent_movein_clients(start_date, end_date)
 
+    if data['asap_movein'] is not None:
         # Display the tables
-        display_clients_as_table("ASAP Move-In Clients (Within 30 Days)", asap_movein_clients)
-        display_clients_as_table("Move-In Clients (30 to 60 Days)", thirty_to_sixty_days_clients)
+        display_clients_as_table("ASAP Move-In Clients (Within 30 Days)", data['asap_movein'])
+        display_clients_as_table("Move-In Clients (30 to 60 Days)", data['movein_30_60_days'])